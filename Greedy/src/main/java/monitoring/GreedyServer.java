@@ -0,0 +1,102 @@
+package monitoring;
+
+import java.io.*;
+import java.nio.charset.StandardCharsets;
+import java.util.HashMap;
+import java.util.Locale;
+
+/**
+ * Long-lived greedy solver reading requests on the standard input, one per line,
+ * and answering each of them with a single line on the standard output.
+ * The instances are kept in memory between the requests.
+ * <p>
+ * Requests:
+ * <ul>
+ *     <li>{@code SOLVE <seed> <routes file>}: answers {@code OK <time> <number of paths> <route index>...}</li>
+ *     <li>{@code UNLOAD <routes file>}: forget the instance, answers {@code OK}</li>
+ *     <li>{@code QUIT}: stop the server</li>
+ * </ul>
+ * A request that cannot be handled is answered by {@code ERROR <message>}.
+ */
+public class GreedyServer {
+    private final HashMap<String, PathSelection> instances;
+    private final int threads;
+
+    /**
+     * @param threads number of threads used to score the routes
+     */
+    public GreedyServer(int threads) {
+        this.instances = new HashMap<>();
+        this.threads = threads;
+    }
+
+    /**
+     * Serve the requests until QUIT or the end of the input
+     * @param input the stream of the requests
+     * @param output the stream of the answers
+     */
+    public void serve(InputStream input, PrintStream output) throws IOException {
+        BufferedReader reader = new BufferedReader(new InputStreamReader(input, StandardCharsets.UTF_8));
+        String request = reader.readLine();
+        while (request != null && !request.trim().equals("QUIT")) {
+            String answer;
+            try {
+                answer = handle(request.trim());
+            } catch (RuntimeException error) {
+                answer = "ERROR " + String.valueOf(error).replace('\n', ' ');
+            }
+            output.println(answer);
+            output.flush();
+            request = reader.readLine();
+        }
+    }
+
+    /**
+     * @param request a request line
+     * @return the answer line
+     */
+    private String handle(String request) {
+        String[] tokens = request.split(" ", 3);
+        switch (tokens[0]) {
+            case "SOLVE":
+                if (tokens.length < 3)
+                    return "ERROR usage: SOLVE <seed> <routes file>";
+                return solve(tokens[2], Integer.parseInt(tokens[1]));
+            case "UNLOAD":
+                if (tokens.length < 2)
+                    return "ERROR usage: UNLOAD <routes file>";
+                instances.remove(request.substring("UNLOAD ".length()));
+                return "OK";
+            default:
+                return "ERROR unknown request " + tokens[0];
+        }
+    }
+
+    /**
+     * Solve the instance, parsing it only the first time it is requested
+     * @param routeFilename path to the routes definition
+     * @param seed random seed
+     * @return the answer line containing the solving time and the indexes of the chosen routes
+     */
+    private String solve(String routeFilename, int seed) {
+        PathSelection problem = instances.get(routeFilename);
+        if (problem == null) {
+            if (!new File(routeFilename).isFile())
+                return "ERROR " + routeFilename + " does not exist";
+            problem = new PathSelection(routeFilename, seed);
+            problem.setThreads(threads);
+            instances.put(routeFilename, problem);
+        }
+        problem.reset(seed);
+
+        long startTime = System.currentTimeMillis();
+        problem.solve();
+        double solvingTime = (System.currentTimeMillis() - startTime) / 1000.0;
+
+        StringBuilder answer = new StringBuilder();
+        answer.append(String.format(Locale.ROOT, "OK %.3f %d", solvingTime, problem.measurementPaths.size()));
+        for (Integer route : problem.measurementPaths)
+            answer.append(" ").append(route);
+        return answer.toString();
+    }
+}
@@ -7,8 +7,8 @@ import java.io.IOException;
 
 public class Main {
     public static void main(String[] args) {
-        Option routesFileOpt = Option.builder().longOpt("routes").argName("ROUTES_FILE").required().hasArg()
-                .desc("routes file").build();
+        Option routesFileOpt = Option.builder().longOpt("routes").argName("ROUTES_FILE").hasArg()
+                .desc("routes file, required unless --server is given").build();
 
         Option writeStatsOutOpt = Option.builder().longOpt("write-stats").argName("STATS_FILE").hasArg()
                 .desc("file to write statistics").build();
@@ -24,6 +24,15 @@ public class Main {
 
         Option seedOpt = Option.builder().longOpt("seed").argName("SEED").hasArg().desc("random seed").build();
 
+        Option threadsOpt = Option.builder().longOpt("threads").argName("THREADS").hasArg()
+                .desc("number of threads used to score the routes").build();
+
+        Option printIterationsOpt = Option.builder().longOpt("print-iterations").hasArg(false)
+                .desc("print the timing of each iteration in the error output").build();
+
+        Option serverOpt = Option.builder().longOpt("server").hasArg(false)
+                .desc("serve solving requests read on the standard input, see GreedyServer").build();
+
         Options options = new Options();
         options.addOption(routesFileOpt);
         options.addOption(writeStatsOutOpt);
@@ -31,6 +40,9 @@ public class Main {
         options.addOption(solOutOpt);
         options.addOption(solFileOpt);
         options.addOption(seedOpt);
+        options.addOption(threadsOpt);
+        options.addOption(printIterationsOpt);
+        options.addOption(serverOpt);
 
         CommandLineParser parser = new DefaultParser();
         CommandLine cmd = null;
@@ -41,6 +53,11 @@ public class Main {
             new HelpFormatter().printHelp("solve path selection problem", options);
             System.exit(1);
         }
+        if (!cmd.hasOption("routes") && !cmd.hasOption("server")) {
+            System.err.println("Missing required option: routes");
+            new HelpFormatter().printHelp("solve path selection problem", options);
+            System.exit(1);
+        }
 
         String routeFilename = cmd.getOptionValue("routes");
         String statsFilename = cmd.getOptionValue("write-stats");
@@ -49,8 +66,24 @@ public class Main {
         if (cmd.hasOption("seed"))
             seed = Integer.parseInt(cmd.getOptionValue("seed"));
 
+        int threads = 1;
+        if (cmd.hasOption("threads"))
+            threads = Integer.parseInt(cmd.getOptionValue("threads"));
+
+        if (cmd.hasOption("server")) {
+            try {
+                new GreedyServer(threads).serve(System.in, System.out);
+            } catch (IOException error) {
+                System.err.println(error);
+                System.exit(1);
+            }
+            return;
+        }
+
         // Initialize the problem
         PathSelection problem = new PathSelection(routeFilename, seed);
+        problem.setThreads(threads);
+        problem.setPrintIterations(cmd.hasOption("print-iterations"));
 
         // Solve the problem
         long startTime = System.currentTimeMillis();
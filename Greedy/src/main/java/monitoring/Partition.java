@@ -0,0 +1,106 @@
+package monitoring;
+
+/**
+ * Partition of the nodes into classes of nodes crossed by the same measurement paths.
+ * Two nodes are distinguishable iff they are in different classes, a route then makes distinguishable
+ * sum(|C & route| * |C - route|) new pairs of nodes over the classes C.
+ */
+public class Partition {
+    private final int n;
+    private final int[] labels; // class of each node
+    private final int[] sizes; // size of each class
+    private int classNumber;
+    private long undistinguishablePairs;
+
+    /**
+     * Initialize the partition with a single class containing every node
+     * @param n the number of nodes
+     */
+    public Partition(int n) {
+        this.n = n;
+        this.labels = new int[n];
+        this.sizes = new int[n + 1];
+        this.sizes[0] = n;
+        this.classNumber = 1;
+        this.undistinguishablePairs = (long) n * (n - 1) / 2;
+    }
+
+    /**
+     * @return the number of pairs of nodes that are in the same class
+     */
+    public long getUndistinguishablePairs() {
+        return undistinguishablePairs;
+    }
+
+    /**
+     * @param node index of the node
+     * @return the class of the node
+     */
+    public int getLabel(int node) {
+        return labels[node];
+    }
+
+    /**
+     * Compute the number of pairs of nodes the route would make distinguishable
+     * @param nodes the nodes crossed by the route
+     * @param counts scratch array of size n + 1 filled with zeros, left filled with zeros
+     * @param touched scratch array of size n
+     * @return the number of newly distinguishable pairs
+     */
+    public long score(int[] nodes, int[] counts, int[] touched) {
+        int touchedNumber = 0;
+        for (int node : nodes) {
+            int label = labels[node];
+            if (counts[label] == 0)
+                touched[touchedNumber++] = label;
+            counts[label]++;
+        }
+        long score = 0;
+        for (int i = 0; i < touchedNumber; i++) {
+            int label = touched[i];
+            score += (long) counts[label] * (sizes[label] - counts[label]);
+            counts[label] = 0;
+        }
+        return score;
+    }
+
+    /**
+     * Split the classes crossed by the route: the nodes of the route form a new class
+     * @param nodes the nodes crossed by the route
+     * @return the nodes whose class has been split, i.e. the only nodes for which the score of a route can change
+     */
+    public int[] refine(int[] nodes) {
+        int[] counts = new int[classNumber];
+        for (int node : nodes)
+            counts[labels[node]]++;
+
+        int[] newLabels = new int[classNumber];
+        boolean[] split = new boolean[classNumber + nodes.length];
+        for (int node : nodes) {
+            int label = labels[node];
+            if (counts[label] > 0 && counts[label] < sizes[label]) {
+                undistinguishablePairs -= (long) counts[label] * (sizes[label] - counts[label]);
+                newLabels[label] = classNumber;
+                sizes[classNumber] = counts[label];
+                sizes[label] -= counts[label];
+                split[label] = true;
+                split[classNumber] = true;
+                classNumber++;
+            }
+            // the class is handled once
+            counts[label] = 0;
+        }
+        for (int node : nodes)
+            if (split[labels[node]])
+                labels[node] = newLabels[labels[node]];
+
+        int affectedNumber = 0;
+        int[] affected = new int[n];
+        for (int node = 0; node < n; node++)
+            if (split[labels[node]])
+                affected[affectedNumber++] = node;
+        int[] result = new int[affectedNumber];
+        System.arraycopy(affected, 0, result, 0, affectedNumber);
+        return result;
+    }
+}
@@ -1,67 +1,130 @@
 package monitoring;
 
 import java.util.*;
-
-import static monitoring.Utils.hashPair;
+import java.util.concurrent.ForkJoinPool;
+import java.util.function.IntConsumer;
+import java.util.stream.IntStream;
 
 public class PathSelection extends Problem{
     protected int nbrReduction; //number of paths discards during optimisation of Solution
     protected int nbrCover; //number of added paths during the cover loop
     protected int nbrOneId; //number of paths after the 1id loop
+    protected int threads = 1; //number of threads used to score the routes
+    protected boolean printIterations = false; //print the timing of each iteration in the error output
 
     public PathSelection(String routeFilename, int seed) {
         super(routeFilename, seed);
     }
 
+    @Override
+    public void reset(int seed) {
+        super.reset(seed);
+        this.nbrReduction = 0;
+        this.nbrCover = 0;
+        this.nbrOneId = 0;
+    }
+
+    /**
+     * @param threads the number of threads used to score the routes
+     */
+    public void setThreads(int threads) {
+        this.threads = Math.max(threads, 1);
+    }
+
+    /**
+     * @param printIterations whether to print the timing of each iteration in the error output
+     */
+    public void setPrintIterations(boolean printIterations) {
+        this.printIterations = printIterations;
+    }
+
+    /**
+     * Compute the score of the given routes, in parallel if a pool is given.
+     * The partition is only read, each thread uses its own scratch arrays.
+     * @param routeIndexes indexes of the routes to score
+     * @param scores array where the scores are stored
+     * @param partition the current partition of the nodes
+     * @param pool the thread pool, or null to score the routes in the current thread
+     */
+    private void scoreRoutes(int[] routeIndexes, long[] scores, Partition partition, ForkJoinPool pool) {
+        ThreadLocal<int[][]> scratch = ThreadLocal.withInitial(() -> new int[][]{new int[n + 1], new int[n]});
+        IntConsumer scoreRoute = k -> {
+            int[][] arrays = scratch.get();
+            int route = routeIndexes[k];
+            scores[route] = partition.score(this.routes.get(route).getNodeArray(), arrays[0], arrays[1]);
+        };
+        if (pool == null)
+            IntStream.range(0, routeIndexes.length).forEach(scoreRoute);
+        else
+            pool.submit(() -> IntStream.range(0, routeIndexes.length).parallel().forEach(scoreRoute)).join();
+    }
+
     @Override
     public void solve() {
-        BitSet undistiguishablePairs = new BitSet(n*(n-1)/2);
+        // the score of a route is the number of undistinguishable pairs it makes distinguishable,
+        // it is computed on the partition of the nodes rather than on the set of all the pairs
+        Partition partition = new Partition(n);
         BitSet uncoveredNodes = new BitSet(n);
-        for (int i = 0; i < n; i++) {
-            uncoveredNodes.set(i);
-            for (int j = i+1; j < n; j++) {
-                undistiguishablePairs.set(hashPair(j, i, n));
-            }
+        uncoveredNodes.set(0, n);
+        for (Integer path_index : this.measurementPaths) {
+            partition.refine(routes.get(path_index).getNodeArray());
+            uncoveredNodes.andNot(routes.get(path_index).getNodes());
         }
 
+        // the scores are computed in parallel, but the best route is chosen sequentially so that
+        // the selected routes only depend on the seed, whatever the number of threads
+        ForkJoinPool pool = threads > 1 ? new ForkJoinPool(threads) : null;
+        long[] scores = new long[this.routes.size()];
+        scoreRoutes(IntStream.range(0, this.routes.size()).toArray(), scores, partition, pool);
 
-        for (Integer path_index : this.measurementPaths)
-            undistiguishablePairs.andNot(routes.get(path_index).getDiscrimSet(n));
-
-        int bestDistinguishability = -1;
+        long bestDistinguishability = -1;
         int bestRoute = -1;
         int counter = 0;
-        BitSet distinguishabilitySet;
-        LinkedList<Integer> candidates = new LinkedList<>();
+        ArrayList<Integer> candidates = new ArrayList<>();
+        BitSet outdatedRoutes = new BitSet(this.routes.size());
         Random random = new Random(this.seed);
-        while (!undistiguishablePairs.isEmpty()) {
+        while (partition.getUndistinguishablePairs() > 0) {
+            long iterationStart = System.nanoTime();
             for (int i = 0; i < this.routes.size(); i++) {
                 if (!measurementPaths.contains(i) && !removedRoutes.contains(i)) {
-                    distinguishabilitySet = (BitSet) this.routes.get(i).getDiscrimSet(n).clone();
-                    distinguishabilitySet.and(undistiguishablePairs);
-                    if (distinguishabilitySet.cardinality() > bestDistinguishability) {
-                        // bestRoute = i;
-                        bestDistinguishability = distinguishabilitySet.cardinality();
+                    if (scores[i] > bestDistinguishability) {
+                        bestDistinguishability = scores[i];
                         candidates.clear();
                         candidates.add(i);
-                    } else if (distinguishabilitySet.cardinality() == bestDistinguishability)
+                    } else if (scores[i] == bestDistinguishability)
                         candidates.add(i);
                 }
             }
+            // the remaining pairs cannot be distinguished
+            if (bestDistinguishability <= 0)
+                break;
             bestRoute = candidates.get(random.nextInt(candidates.size()));
-            distinguishabilitySet = (BitSet) this.routes.get(bestRoute).getDiscrimSet(n).clone();
-            distinguishabilitySet.and(undistiguishablePairs);
-
-
 
             uncoveredNodes.andNot(this.routes.get(bestRoute).getNodes());
-            undistiguishablePairs.andNot(this.routes.get(bestRoute).getDiscrimSet(n));
             measurementPaths.add(bestRoute);
+
+            // only the routes crossing a split class have a different score
+            for (int node : partition.refine(this.routes.get(bestRoute).getNodeArray()))
+                for (int route : symptoms[node])
+                    outdatedRoutes.set(route);
+            long scoringStart = System.nanoTime();
+            int[] outdated = outdatedRoutes.stream().toArray();
+            scoreRoutes(outdated, scores, partition, pool);
+            outdatedRoutes.clear();
+            if (printIterations)
+                System.err.printf(Locale.ROOT, "iteration %d: route %d (score %d), %d routes rescored in %.3f ms, " +
+                                "iteration in %.3f ms%n", counter, bestRoute, bestDistinguishability,
+                        outdated.length, (System.nanoTime() - scoringStart) / 1e6,
+                        (System.nanoTime() - iterationStart) / 1e6);
+
             bestDistinguishability = -1;
             candidates.clear();
             counter++;
         }
 
+        if (pool != null)
+            pool.shutdown();
+
         // If a single node is uncovered, we add a random route in its symptom
         for (int i = 0; i < this.n; i++)
             if (uncoveredNodes.get(i)) {
@@ -9,13 +9,12 @@ import java.util.*;
 import java.util.regex.Matcher;
 import java.util.regex.Pattern;
 
-import static monitoring.Utils.hashPair;
-
 public abstract class Problem {
 
     protected int n; //number of nodes;
     protected int seed;
     protected ArrayList<Route> routes; //routes availables for the network
+    protected int[][] symptoms; // indexes of the routes crossing each node
     final protected HashSet<Integer> measurementPaths; // indexes of the chosen measurement paths
     protected LinkedList<HashSet<Integer>> flowers;
     protected HashSet<Integer> leafNodes;
@@ -30,6 +29,7 @@ public abstract class Problem {
     public Problem(String routeFilename, int seed) {
         this.routes = new ArrayList<>();
         parseInstance(routeFilename);
+        computeSymptoms();
         measurementPaths = new HashSet<>();
         removedRoutes = new HashSet<>();
         this.seed = seed;
@@ -74,6 +74,33 @@ public abstract class Problem {
         }
     }
 
+    /**
+     * Forget the current solution so that the problem can be solved again
+     * @param seed the random seed of the next resolution
+     */
+    public void reset(int seed) {
+        this.measurementPaths.clear();
+        this.removedRoutes.clear();
+        this.seed = seed;
+    }
+
+    /**
+     * Compute the indexes of the routes crossing each node
+     */
+    public void computeSymptoms() {
+        int[] degrees = new int[n];
+        for (Route route : routes)
+            for (int node : route.getNodeArray())
+                degrees[node]++;
+        symptoms = new int[n][];
+        for (int node = 0; node < n; node++)
+            symptoms[node] = new int[degrees[node]];
+        int[] filled = new int[n];
+        for (Route route : routes)
+            for (int node : route.getNodeArray())
+                symptoms[node][filled[node]++] = route.index;
+    }
+
     /**
      * Solve the problem
      */
@@ -99,15 +126,10 @@ public abstract class Problem {
      * @return the number of undistinguishable pair of nodes
      */
     public int verifyOneId() {
-        BitSet totalPairs = new BitSet(n*(n-1)/2);
-        for (int i = 1; i < n; i++)
-            for (int j = 0; j < i; j++)
-                totalPairs.set(hashPair(j, i, n));
-
-        BitSet discrimPairs = new BitSet(n*(n-1)/2);
+        Partition partition = new Partition(n);
         for (Integer i: this.measurementPaths)
-            discrimPairs.or(this.routes.get(i).getDiscrimSet(n));
-        return totalPairs.cardinality() - discrimPairs.cardinality();
+            partition.refine(this.routes.get(i).getNodeArray());
+        return (int) partition.getUndistinguishablePairs();
     }
 
     /**
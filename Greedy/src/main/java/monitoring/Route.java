@@ -2,13 +2,12 @@ package monitoring;
 
 import java.util.BitSet;
 
-import static monitoring.Utils.hashPair;
-
 public class Route {
     final int index;
     final int src;
     final int dest;
     private BitSet nodes;
+    private int[] nodeArray;
 
     public Route(int index, int src, int dest) {
         this.index = index;
@@ -18,6 +17,7 @@ public class Route {
 
     public void setNodes(BitSet nodes) {
         this.nodes = nodes;
+        this.nodeArray = nodes.stream().toArray();
     }
 
     /**
@@ -27,6 +27,13 @@ public class Route {
         return this.nodes;
     }
 
+    /**
+     * @return the indexes of the nodes crossed by the route, in increasing order
+     */
+    public int[] getNodeArray() {
+        return this.nodeArray;
+    }
+
     /**
      * @param nodeA index of node A
      * @param nodeB index of node B
@@ -37,24 +44,4 @@ public class Route {
         return ((nodes.get(nodeA) && !nodes.get(nodeB)) ||
                 (!nodes.get(nodeA) && nodes.get(nodeB)));
     }
-
-    /**
-     * compute the list of pair of nodes that the route makes distinguishables
-     * @param nodeNbr the number of nodes
-     * @return a bitset containing the pair of nodes
-     */
-    public BitSet getDiscrimSet(int nodeNbr) {
-        BitSet discrimSet = new BitSet(nodeNbr*(nodeNbr-1)/2);
-        for (int nodeA = 0; nodeA < nodeNbr; nodeA++) {
-            if (nodes.get(nodeA)) {
-                for (int nodeB = 0; nodeB < nodeA; nodeB++)
-                    if (!nodes.get(nodeB))
-                        discrimSet.set(hashPair(nodeA, nodeB, nodeNbr), true);
-                for (int nodeB = nodeA +1 ; nodeB < nodeNbr; nodeB++)
-                    if (!nodes.get(nodeB))
-                        discrimSet.set(hashPair(nodeA, nodeB, nodeNbr), true);
-            }
-        }
-        return discrimSet;
-    }
 }
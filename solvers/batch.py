@@ -0,0 +1,241 @@
+import argparse
+import glob
+import os
+import resource
+import shlex
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from problems import PathSelectionProblem
+from main import CSV_HEADER, SOLVERS, build_parser, load_problem, solve, csv_fields, solver_fields
+
+# the fields of main.py, then the options of the job, the error of a failed job and the solver specific fields,
+# separated by commas
+BATCH_HEADER = CSV_HEADER + ["Options", "Error", "Details"]
+# the fields identifying a job, a job recorded in the csv file is not run again
+KEY_FIELDS = ["Name", "Solver", "Goal", "Seed", "Options", "TimeLimit"]
+
+
+class Job:
+    """
+    A run of main.py on an instance, with a solver, a goal, a seed and options
+    """
+    instance: str
+    solver: str
+    goal: str
+    seed: int
+    options: str
+    timelimit: float
+    size: int
+
+    def __init__(self, instance: str, solver: str, goal: str, seed: int, options: str, timelimit: float) -> None:
+        self.instance = instance
+        self.solver = solver
+        self.goal = goal
+        self.seed = seed
+        self.options = options
+        self.timelimit = timelimit
+        self.size = estimate_size(instance, goal)
+
+    def arguments(self) -> list[str]:
+        """
+        :return: the arguments of main.py, the options coming first so that they cannot replace the job fields
+        """
+        return shlex.split(self.options) + ["--solver", self.solver, "-i", self.instance, "-g", self.goal,
+                                            "--seed", str(self.seed), "--timelimit", str(self.timelimit)]
+
+    def key(self) -> tuple:
+        return self.instance, self.solver, self.goal, str(self.seed), self.options, str(self.timelimit)
+
+    def __str__(self) -> str:
+        return f"{self.instance} {self.solver} {self.goal} {self.seed} {self.options}".strip()
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def estimate_size(instance: str, goal: str) -> int:
+    """
+    :return: the number of routes times the number of rows of the instance, read from the first line of the file
+    """
+    try:
+        with open(instance) as file:
+            node_number, route_number = (int(value) for value in file.readline().split()[:2])
+    except (OSError, ValueError):
+        return 0
+    rows = node_number * (node_number + 1) // 2 if goal == "1id" else node_number
+    return route_number * rows
+
+
+# the last instance loaded by the worker, reused by its next jobs on the same file
+loaded_problems = {}
+
+
+def init_worker(memory: int) -> None:
+    """
+    :param memory: the maximal address space of the worker in MB, 0 for no limit
+    """
+    if memory > 0:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory * 2 ** 20, hard))
+    signal.signal(signal.SIGALRM, on_alarm)
+
+
+def on_alarm(signum, frame):
+    raise JobTimeout()
+
+
+def run_job(job: Job, grace: float) -> list:
+    """
+    Run a job in a worker, the job being interrupted after its time limit plus the grace time
+    :param job: the job
+    :param grace: the time given to the job after its time limit, e.g. to build the model
+    :return: the fields of BATCH_HEADER
+    """
+    args = build_parser().parse_args(job.arguments())
+    signal.setitimer(signal.ITIMER_REAL, job.timelimit + grace)
+    try:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            key = (args.input, args.goal, args.instance_cache)
+            if key not in loaded_problems:
+                loaded_problems.clear()
+                loaded_problems[key] = PathSelectionProblem(args.input, args.goal, args.instance_cache)
+            original_problem, problem = load_problem(args, loaded_problems[key])
+            solver, reduction, verification = solve(args, original_problem, problem)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        details = solver_fields(solver, reduction)
+        return (csv_fields(args, problem, solver, verification)
+                + [job.options, "", ",".join(str(field) for field in details)])
+    except Exception as error:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        # the memory of the failed run is released before the next job
+        loaded_problems.clear()
+        if isinstance(error, JobTimeout):
+            return failed_fields(job, "Timeout", f"interrupted after {job.timelimit + grace} s")
+        return failed_fields(job, "Error", f"{type(error).__name__}: {error}")
+
+
+def failed_fields(job: Job, status: str, error: str) -> list:
+    """
+    :return: the fields of BATCH_HEADER of a job that did not finish
+    """
+    error = " ".join(error.replace(";", ",").split())
+    return [job.instance, job.solver, job.goal, job.seed, "--reductions" in job.options, -1, -1.0, None, status,
+            False, False, job.timelimit, 0, -1, job.options, error, ""]
+
+
+def recorded_jobs(csv_path: str, retry_failed: bool) -> set[tuple]:
+    """
+    :param csv_path: the consolidated csv file
+    :param retry_failed: if True, the jobs recorded with an error are run again
+    :return: the keys of the jobs recorded in the file
+    :raise ValueError: if the header of the file is not the header of the runner
+    """
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+        return set()
+    with open(csv_path) as file:
+        lines = file.read().splitlines()
+    if lines[0].split(";") != BATCH_HEADER:
+        raise ValueError(f"{csv_path} does not have the header of the batch runner")
+    positions = [BATCH_HEADER.index(field) for field in KEY_FIELDS]
+    error_position = BATCH_HEADER.index("Error")
+    recorded = set()
+    for line in lines[1:]:
+        fields = line.split(";")
+        # a line cut by a crash is ignored
+        if len(fields) != len(BATCH_HEADER) or (retry_failed and fields[error_position] != ""):
+            continue
+        recorded.add(tuple(fields[position] for position in positions))
+    return recorded
+
+
+def expand_instances(patterns: list[str]) -> list[str]:
+    instances = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if len(matches) == 0:
+            print(f"No instance matches {pattern}")
+        instances.extend(match for match in matches if match not in instances)
+    return instances
+
+
+def run_batch(jobs: list[Job], csv_path: str, workers: int, memory: int, grace: float) -> None:
+    """
+    Run the jobs in a pool of processes, the largest instances first, and append each result to the csv file as soon as
+    it is known. At most one job per worker is submitted at a time, so that a crashed worker only fails the jobs
+    it was running; the pool is then restarted.
+    """
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+        with open(csv_path, "w") as file:
+            print(";".join(BATCH_HEADER), file=file)
+
+    pending = deque(sorted(jobs, key=lambda job: (-job.size, job.key())))
+    running = {}
+    finished = 0
+    executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(memory,))
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.popleft()
+            running[executor.submit(run_job, job, grace)] = job
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        broken = False
+        for future in done:
+            job = running.pop(future)
+            try:
+                fields = future.result()
+            except BrokenProcessPool:
+                broken = True
+                fields = failed_fields(job, "Error", "the worker running the job died")
+            finished += 1
+            with open(csv_path, "a") as file:
+                print(";".join(str(field) for field in fields), file=file)
+            status, objective = fields[BATCH_HEADER.index("Status")], fields[BATCH_HEADER.index("N_Paths")]
+            print(f"[{finished}/{finished + len(running) + len(pending)}] {job} : {status}, {objective} paths")
+        if broken:
+            executor.shutdown(wait=True, cancel_futures=True)
+            executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(memory,))
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run main.py on every combination of instances, solvers, goals, "
+                                                 "seeds and options in a pool of processes")
+    parser.add_argument('-i', '--instances', nargs='+', required=True,
+                        help="glob patterns of the instance files, e.g. 'instances/*/zoo/*.routes'")
+    parser.add_argument('--solvers', nargs='+', default=["ilp"],
+                        choices=SOLVERS)
+    parser.add_argument('--goals', nargs='+', default=["1id"], choices=["cover", "1id"])
+    parser.add_argument('--seeds', nargs='+', type=int, default=[1863947])
+    parser.add_argument('--options', action='append',
+                        help="options of main.py given to every job, e.g. '--quotient --local-search 5'; "
+                             "repeated to compare several configurations")
+    parser.add_argument('--timelimit', type=float, default=180.0, help="time limit of each job")
+    parser.add_argument('--grace', type=float, default=60.0,
+                        help="seconds after the time limit at which a job is interrupted")
+    parser.add_argument('--memory', type=int, default=0,
+                        help="maximal address space of each worker in MB, 0 (default) for no limit")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes running the jobs")
+    parser.add_argument('--csv', required=True, help="consolidated csv file of the results")
+    parser.add_argument('--retry-failed', action='store_true', help="run again the jobs recorded with an error")
+
+    args = parser.parse_args()
+
+    jobs = [Job(instance, solver, goal, seed, options, args.timelimit)
+            for instance in expand_instances(args.instances)
+            for solver in args.solvers for goal in args.goals for seed in args.seeds
+            for options in (args.options or [""])]
+    # invalid options are reported before any job runs
+    for options in set(job.options for job in jobs):
+        build_parser().parse_args(shlex.split(options) + ["--solver", "ilp", "-i", "instance"])
+
+    try:
+        recorded = recorded_jobs(args.csv, args.retry_failed)
+    except ValueError as error:
+        print(error)
+        exit()
+    remaining = [job for job in jobs if job.key() not in recorded]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(remaining)} already recorded in {args.csv}")
+    run_batch(remaining, args.csv, args.workers, args.memory, args.grace)
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def hash_pair(a: int, b: int, n: int) -> int:
     """
     Hash a pair of node to link it to its corresponding d_ij
@@ -19,6 +22,35 @@ def hash_pair(a: int, b: int, n: int) -> int:
         return int((n-1)*(n-2)/2 - (n-b-1)*(n-b-2)/2 )+ a - 1
 
 
+def hash_pairs(a: np.ndarray, b: np.ndarray, n: int) -> np.ndarray:
+    """
+    Vectorized version of hash_pair, the pairs are expected to be made of distinct nodes
+    :param a: indexes of the first nodes
+    :param b: indexes of the second nodes
+    :param n: total number of node
+    :return: an array containing the hash of each pair
+    """
+    low = np.minimum(a, b).astype(np.int64)
+    high = np.maximum(a, b).astype(np.int64)
+    return (n - 1) * (n - 2) // 2 - (n - low - 1) * (n - low - 2) // 2 + high - 1
+
+
+def transpose_csr(size: int, indptr: np.ndarray, indices: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Transpose a CSR structure, e.g. turn the route -> nodes lists into node -> routes lists
+    :param size: the number of rows of the transposed structure
+    :param indptr: offsets of each row of the structure
+    :param indices: column indexes of the structure
+    :return: a tuple (indptr, indices) of the transposed structure, each row being sorted
+    """
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    # a stable sort on the columns keeps the rows sorted inside each transposed row
+    order = np.argsort(indices, kind="stable")
+    transposed_indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=size), out=transposed_indptr[1:])
+    return transposed_indptr, rows[order]
+
+
 def parse_instance(filename: str) -> (int, int, list[set], list[(int, int)]):
     """
     parse instances
@@ -65,7 +97,8 @@ def parse_reductions(filename: str) -> (set[int], list[set[int]], list[int, (int
             one_degree_packs.append((nodes[0], set(nodes[1:])))
 
     tails = []
-    for line in lines[2 + nbr_bc:2 + nbr_bc + nbr_tail]:
+    tails_start = 2 + nbr_bc + nbr_one_degree_pack
+    for line in lines[tails_start: tails_start + nbr_tail]:
         tails.append([int(i) for i in line.strip().split(" ")])
 
     return indy_nodes, bcs, one_degree_packs, tails
@@ -86,3 +119,5 @@ def compute_symptoms(nodes_number: int, routes: list[set]) -> list[set]:
 
     return symptoms
 
+
+from .instance_loader import load_instance
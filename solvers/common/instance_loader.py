@@ -0,0 +1,189 @@
+import hashlib
+import json
+import mmap
+import os
+import numpy as np
+
+CHUNK_SIZE = 1 << 24
+CACHE_SUFFIX = ".npcache"
+CACHE_MAGIC = b"PSPCACHE"
+CACHE_ALIGNMENT = 64
+CACHE_VERSION = 1
+
+NEWLINE = ord("\n")
+ZERO = ord("0")
+NINE = ord("9")
+
+ARRAY_NAMES = ("endpoints", "route_indptr", "route_indices", "node_indptr", "node_indices")
+
+
+def load_instance(filename: str, use_cache: bool = False) -> (int, dict[str, np.ndarray], str):
+    """
+    Load an instance file into integer arrays.
+    The text is memory-mapped and tokenized in bulk, chunk by chunk.
+    If use_cache is set, the arrays are stored in a binary sidecar file (filename + CACHE_SUFFIX)
+    that is memory-mapped by the next calls, as long as the instance file did not change.
+    :param filename: the path to the file containing the instance
+    :param use_cache: whether to read and write the binary sidecar cache
+    :return: a tuple (nodes_number, arrays, content_hash) where arrays contains the endpoints (route_number x 2),
+            the routes in CSR form (route_indptr, route_indices) and possibly the symptoms in CSR form
+            (node_indptr, node_indices), and content_hash is a hash of the content of the instance file
+    """
+    cache_filename = filename + CACHE_SUFFIX
+    stat = os.stat(filename)
+    if use_cache:
+        cached = _read_cache(filename, cache_filename, stat)
+        if cached is not None:
+            return cached
+
+    nodes_number, arrays, content_hash = _parse_instance_arrays(filename)
+
+    if use_cache:
+        # the symptoms are stored as well so that the next loads do not have to transpose the routes
+        from common import transpose_csr
+        arrays["node_indptr"], arrays["node_indices"] = transpose_csr(nodes_number, arrays["route_indptr"],
+                                                                      arrays["route_indices"])
+        _write_cache(cache_filename, stat, nodes_number, arrays, content_hash)
+
+    return nodes_number, arrays, content_hash
+
+
+def _parse_instance_arrays(filename: str) -> (int, dict[str, np.ndarray], str):
+    with open(filename, "rb") as input_file:
+        header = input_file.readline()
+        nodes_number, routes_number = [int(i) for i in header.split()[:2]]
+        size = os.fstat(input_file.fileno()).st_size
+        if size == 0:
+            raise ValueError(f"{filename} is empty")
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            content_hash = hashlib.blake2b(data, digest_size=20).hexdigest()
+
+            endpoints = []
+            lengths = []
+            nodes = []
+            offset = len(header)
+            while offset < size:
+                end = data.rfind(b"\n", offset, min(offset + CHUNK_SIZE, size))
+                if end == -1 or offset + CHUNK_SIZE >= size:
+                    end = size
+                else:
+                    end += 1
+                chunk = np.frombuffer(data, dtype=np.uint8, count=end - offset, offset=offset)
+                chunk_endpoints, chunk_lengths, chunk_nodes = _tokenize_routes(chunk, nodes_number)
+                del chunk
+                endpoints.append(chunk_endpoints)
+                lengths.append(chunk_lengths)
+                nodes.append(chunk_nodes)
+                offset = end
+
+    endpoints = np.concatenate(endpoints) if endpoints else np.empty((0, 2), dtype=np.int32)
+    lengths = np.concatenate(lengths) if lengths else np.empty(0, dtype=np.int64)
+    if len(lengths) < routes_number:
+        raise ValueError(f"{filename} contains {len(lengths)} routes instead of {routes_number}")
+
+    route_indptr = np.zeros(routes_number + 1, dtype=np.int64)
+    np.cumsum(lengths[:routes_number], out=route_indptr[1:])
+    route_indices = np.concatenate(nodes)[:route_indptr[-1]] if nodes else np.empty(0, dtype=np.int32)
+
+    arrays = {"endpoints": np.ascontiguousarray(endpoints[:routes_number]),
+              "route_indptr": route_indptr,
+              "route_indices": route_indices}
+    return nodes_number, arrays, content_hash
+
+
+def _tokenize_routes(chunk: np.ndarray, nodes_number: int) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Tokenize a chunk of complete route lines ("src dest | node node ...")
+    :param chunk: the bytes of the lines
+    :param nodes_number: the number of nodes
+    :return: a tuple (endpoints, lengths, nodes) with the endpoints of each route, the number of distinct nodes of
+            each route and the concatenation of the sorted nodes of each route
+    """
+    digits = (chunk >= ZERO) & (chunk <= NINE)
+    edges = np.diff(digits.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    token_lengths = np.flatnonzero(edges == -1) - starts
+
+    values = np.zeros(len(starts), dtype=np.int64)
+    for position in range(int(token_lengths.max()) if len(starts) > 0 else 0):
+        active = np.flatnonzero(token_lengths > position)
+        values[active] = values[active] * 10 + (chunk[starts[active] + position] - ZERO)
+
+    # index of the line of each token, and rank of the token in its line
+    line_of_token = np.searchsorted(np.flatnonzero(chunk == NEWLINE), starts)
+    lines, first_token, tokens_per_line = np.unique(line_of_token, return_index=True, return_counts=True)
+    route_of_token = np.repeat(np.arange(len(lines)), tokens_per_line)
+    rank = np.arange(len(starts)) - first_token[route_of_token]
+
+    endpoints = np.stack((values[first_token], values[first_token + 1]), axis=1).astype(np.int32)
+
+    is_node = rank >= 2
+    keys = route_of_token[is_node] * nodes_number + values[is_node]
+    keys.sort()
+    if len(keys) > 0:
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    lengths = np.bincount(keys // nodes_number, minlength=len(lines))
+    return endpoints, lengths.astype(np.int64), (keys % nodes_number).astype(np.int32)
+
+
+def _read_cache(filename: str, cache_filename: str, stat: os.stat_result):
+    try:
+        with open(cache_filename, "rb") as cache_file:
+            if cache_file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            header_length = int.from_bytes(cache_file.read(8), "little")
+            header = json.loads(cache_file.read(header_length))
+    except (OSError, ValueError):
+        return None
+
+    if header.get("version") != CACHE_VERSION or header["size"] != stat.st_size:
+        return None
+    if header["mtime_ns"] != stat.st_mtime_ns:
+        # the file was touched, its content may still be the same
+        with open(filename, "rb") as input_file:
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if hashlib.blake2b(data, digest_size=20).hexdigest() != header["hash"]:
+                    return None
+
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(cache_filename, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+    return header["nodes_number"], arrays, header["hash"]
+
+
+def _write_cache(cache_filename: str, stat: os.stat_result, nodes_number: int, arrays: dict[str, np.ndarray],
+                 content_hash: str) -> None:
+    header = {"version": CACHE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": content_hash,
+              "nodes_number": nodes_number, "arrays": {}}
+
+    # the offsets depend on the header length, which depends on the offsets: reserve enough room for the header
+    reserved = 1024
+    offset = _align(len(CACHE_MAGIC) + 8 + reserved)
+    for name in ARRAY_NAMES:
+        header["arrays"][name] = [arrays[name].dtype.str, list(arrays[name].shape), offset]
+        offset = _align(offset + arrays[name].nbytes)
+    encoded_header = json.dumps(header).encode()
+    if len(encoded_header) > reserved:
+        return
+
+    temporary_filename = f"{cache_filename}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_filename, "wb") as cache_file:
+            cache_file.write(CACHE_MAGIC)
+            cache_file.write(len(encoded_header).to_bytes(8, "little"))
+            cache_file.write(encoded_header)
+            for name in ARRAY_NAMES:
+                cache_file.seek(header["arrays"][name][2])
+                cache_file.write(memoryview(np.ascontiguousarray(arrays[name])))
+        os.replace(temporary_filename, cache_filename)
+    except OSError:
+        # the cache is optional, e.g. the instance directory may be read-only
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+
+
+def _align(offset: int) -> int:
+    return (offset + CACHE_ALIGNMENT - 1) // CACHE_ALIGNMENT * CACHE_ALIGNMENT
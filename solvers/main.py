@@ -1,13 +1,81 @@
 import sys
-from problems import PathSelectionProblem
-from models import PSPIntegerLinearProgram, PSPColumnGeneration
+import functools
+import hashlib
+from common import parse_reductions
+from problems import PathSelectionProblem, IncumbentStream, InstanceReduction, Verification
+from problems import ResultCache, CachedResult, result_key
+from models import PSPIntegerLinearProgram, PSPColumnGeneration, PSPBranchAndPrice, ColumnGenerationSettings
+from models import PSPLagrangianRelaxation, ReducedSolver, PSPGreedy, PSPPortfolio, member_bound
 import argparse
 
-if __name__ == '__main__':
+SOLVERS = ["ilp", "column_generation", "branch_and_price", "lagrangian", "greedy", "portfolio"]
+# the arguments that do not change the result of a run, left out of the key of the result cache
+CACHE_IGNORED = ["input", "timelimit", "solfile", "csv", "incumbents", "instance_cache", "cache", "cache_size",
+                 "cache_accept_longer"]
+
+
+def create_solver(args, settings: ColumnGenerationSettings, problem: PathSelectionProblem,
+                  stream: IncumbentStream = None):
+    """
+    :param args: the parsed arguments
+    :param settings: the settings of the column generation
+    :param problem: the instance to solve
+    :param stream: the stream to which the improving solutions are appended
+    :return: the solver selected by the arguments, or None if the solver is unknown
+    """
+    if args.solver == "ilp":
+        return PSPIntegerLinearProgram(problem, args.seed, args.pair_rows, args.local_search,
+                                       args.greedy if args.mip_start else None, stream)
+    if args.solver == 'column_generation':
+        return PSPColumnGeneration(problem, args.seed, args.greedy, settings, args.lagrangian_time,
+                                   args.local_search, stream)
+    if args.solver == 'branch_and_price':
+        return PSPBranchAndPrice(problem, args.seed, args.greedy, args.strategy, args.branching,
+                                 workers=args.workers, settings=settings, lagrangian_time=args.lagrangian_time,
+                                 local_search_time=args.local_search, stream=stream)
+    if args.solver == 'lagrangian':
+        return PSPLagrangianRelaxation(problem, args.seed, args.greedy, stream)
+    if args.solver == 'greedy':
+        return PSPGreedy(problem, args.seed, args.greedy, args.local_search, stream)
+    if args.solver == 'portfolio':
+        return PSPPortfolio(problem, portfolio_members(args, settings), stream)
+    return None
+
+
+def portfolio_members(args, settings: ColumnGenerationSettings) -> list:
+    """
+    :return: the (label, factory) tuple of each configuration of --portfolio, given as solver or solver:seed, the
+             members without seed using the seed of the arguments plus their position
+    """
+    members = []
+    for position, configuration in enumerate(args.portfolio):
+        solver, _, seed = configuration.partition(":")
+        member_args = argparse.Namespace(**vars(args))
+        member_args.solver = solver
+        member_args.seed = int(seed) if seed else args.seed + position
+        label = f"{solver}:{member_args.seed}"
+        if label in (member[0] for member in members):
+            label += f"#{position}"
+        members.append((label, functools.partial(create_solver, member_args, settings)))
+    return members
+
+
+def portfolio_configuration(configuration: str) -> str:
+    """
+    :return: the configuration of a member of the portfolio, solver or solver:seed
+    :raise argparse.ArgumentTypeError: if the solver is unknown or the seed is not an integer
+    """
+    solver, _, seed = configuration.partition(":")
+    if solver not in SOLVERS or solver == "portfolio" or not (seed == "" or seed.lstrip("-").isdigit()):
+        raise argparse.ArgumentTypeError(f"invalid portfolio configuration {configuration}")
+    return configuration
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument('--solver',
                         required=True,
-                        choices=["ilp", "column_generation"],
+                        choices=SOLVERS,
                         default="ilp")
     parser.add_argument('-i', '--input',
                         help="instance file",
@@ -20,24 +88,258 @@ if __name__ == '__main__':
                         help="time limit for solving problem")
     parser.add_argument('--solfile', required=False, type=str, help='path to store solution')
     parser.add_argument('--csv', required=False, type=str, help="csv file to store stats")
+    parser.add_argument('--incumbents', required=False, type=str,
+                        help="file to which each improving solution is appended as soon as it is found, with its time "
+                             "and a lower bound, in the solution format, or as one line per solution for a .csv file")
+    parser.add_argument('--mip-start', action='store_true',
+                        help="ilp: give the greedy solution to the solver as MIP start")
     parser.add_argument('--seed', type=int, default=1863947)
+    parser.add_argument('--pair-rows', choices=["all", "lazy"], default="all",
+                        help="ilp: build every 1-id constraint up front, or add the violated ones lazily")
+    parser.add_argument('--greedy', choices=["native", "java"], default="native",
+                        help="greedy used to warm start the column generation")
+    parser.add_argument('--reductions', required=False, type=str,
+                        help="reductions file of the instance, whose structures are searched for the routes forced in "
+                             "every solution before the independent components are solved separately, or 'auto' to "
+                             "search every pair of nodes")
+    parser.add_argument('--instance-cache', action='store_true',
+                        help="store the parsed instance in a binary file next to it and reuse it in the next runs")
+    parser.add_argument('--cache', required=False, type=str,
+                        help="directory of the result cache: a run whose instance content and options were already "
+                             "solved with the same time limit returns the stored result without building a model")
+    parser.add_argument('--cache-size', type=float, default=256.0,
+                        help="maximal size of the result cache in MB, the least recently used results being removed")
+    parser.add_argument('--cache-accept-longer', action='store_true',
+                        help="also return the cached results of longer time limits, and the results proven optimal "
+                             "within the time limit")
+    parser.add_argument('--quotient', action='store_true',
+                        help="if the goal is infeasible, solve the instance where the nodes with identical symptoms are "
+                             "merged and the nodes crossed by no route are removed")
+    parser.add_argument('--smoothing', type=float, default=0.0,
+                        help="column generation: weight of the stability center in the Wentges smoothing of the duals, "
+                             "0 (default) prices the routes with the duals of the RMP")
+    parser.add_argument('--adaptive-columns', action='store_true',
+                        help="column generation: add more routes per iteration when many routes improve the RMP")
+    parser.add_argument('--diversity', type=float, default=1.0,
+                        help="column generation: maximal Jaccard similarity between two routes added at the same "
+                             "iteration, 1 (default) disables the filter")
+    parser.add_argument('--column-age', type=int, default=0,
+                        help="column generation: move to the column pool the columns that stayed non-basic with a "
+                             "large reduced cost in this number of consecutive RMPs, 0 (default) keeps every column")
+    parser.add_argument('--column-age-rc', type=float, default=0.0,
+                        help="column generation: reduced cost above which a non-basic column gets older")
+    parser.add_argument('--max-columns', type=int, default=0,
+                        help="column generation: maximal number of columns of the RMP, the oldest ones being moved "
+                             "to the column pool, 0 (default) for no limit")
+    parser.add_argument('--lagrangian-time', type=float, default=0.0,
+                        help="column generation: seconds given to the Lagrangian relaxation before the column "
+                             "generation, whose multipliers are the initial duals of the root, 0 (default) to disable it")
+    parser.add_argument('--local-search', type=float, default=0.0,
+                        help="seconds given to the local search shrinking the greedy solution and the solutions found "
+                             "(dropping redundant routes, 2-for-1 and 1-for-1 swaps), 0 (default) to disable it")
+    parser.add_argument('--portfolio', nargs='+', type=portfolio_configuration,
+                        default=["greedy", "ilp", "column_generation"],
+                        help="portfolio: the configurations run concurrently, as solver or solver:seed")
+    parser.add_argument('--strategy', choices=["best_bound", "depth_first"], default="best_bound",
+                        help="branch_and_price: order in which the nodes of the tree are explored")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="branch_and_price: number of processes solving the nodes of the tree")
+    parser.add_argument('--branching', choices=["route", "pair"], default="route",
+                        help="branch_and_price: branch on a fractional route, or on the routes crossing a pair of nodes")
+    return parser
 
-    args = parser.parse_args()
 
-    try:
-        problem = PathSelectionProblem(args.input, args.goal)
-    except FileNotFoundError:
-        print(f"{args.input} does not exist")
-        exit()
+# the fields common to every solver at the start of each csv line, the solver specific fields follow
+CSV_HEADER = ["Name", "Solver", "Goal", "Seed", "Reductions", "N_Paths", "SolvingTime(s)", "TotalTime(s)", "Status",
+              "IsCovered", "IsOne1id", "TimeLimit", "N_Sources", "MaxLoad"]
+
+
+def load_problem(args, problem: PathSelectionProblem = None) -> (PathSelectionProblem, PathSelectionProblem):
+    """
+    :param args: the parsed arguments
+    :param problem: the instance of args.input if it is already loaded
+    :return: a tuple (original_problem, problem) with the instance of the input file and the instance to solve,
+             i.e. its quotient if the goal is infeasible and --quotient is given
+    :raise ValueError: if the goal is infeasible and --quotient is not given
+    """
+    if problem is None:
+        problem = PathSelectionProblem(args.input, args.goal, args.instance_cache)
+
+    # the routes keep their indexes in the quotient instance, the solution is written with the original nodes
+    original_problem = problem
+    analysis = problem.analyze()
+    print(f"Analysis : {analysis}")
+    if not analysis.is_feasible(args.goal):
+        if not args.quotient:
+            raise ValueError(f"The {args.goal} goal is infeasible on {args.input}, "
+                             f"use --quotient to solve the quotient instance")
+        problem = problem.quotient()
+        print(f"Solving the quotient instance ({problem.node_number} nodes out of {original_problem.node_number})")
+    return original_problem, problem
+
+
+def build_solver(args, original_problem: PathSelectionProblem, problem: PathSelectionProblem):
+    """
+    :param args: the parsed arguments
+    :param original_problem: the instance of the input file, whose routes are written in the incumbents file
+    :param problem: the instance to solve
+    :return: a tuple (solver, reduction), the reduction being None without --reductions,
+             and the solver None if the solver is unknown
+    """
+    settings = ColumnGenerationSettings(args.smoothing, args.adaptive_columns, args.diversity,
+                                        args.column_age, args.column_age_rc, args.max_columns)
+    stream = IncumbentStream(args.incumbents, original_problem) if args.incumbents else None
+    if args.reductions is None:
+        return create_solver(args, settings, problem, stream), None
+
+    hints, node_map = None, None
+    if args.reductions != "auto":
+        hints = parse_reductions(args.reductions)
+        if problem is not original_problem:
+            # the reductions file numbers the nodes of the original instance
+            node_map = original_problem.analyze().node_labels()[0]
+    reduction = InstanceReduction(problem, hints, node_map)
+    print(f"Reductions : {reduction}")
+    # the solvers of the components only know their own routes, the solution is recorded once mapped back
+    return ReducedSolver(reduction, lambda component: create_solver(args, settings, component), args.seed,
+                         stream), reduction
+
+
+def cache_configuration(args) -> dict:
+    """
+    :return: the arguments changing the result of a run, the reductions file being identified by its content
+    """
+    configuration = {name: value for name, value in vars(args).items() if name not in CACHE_IGNORED}
+    if args.reductions is not None and args.reductions != "auto":
+        with open(args.reductions, "rb") as file:
+            configuration["reductions"] = hashlib.blake2b(file.read(), digest_size=20).hexdigest()
+    return configuration
+
+
+def result_bound(solver) -> float:
+    """
+    :return: the lower bound on the number of routes proven by the solver at the end of its run
+    """
+    if isinstance(solver, PSPPortfolio):
+        return solver.best_bound
+    if isinstance(solver, ReducedSolver):
+        # each component needs at least one route
+        component_bounds = sum(max(1.0, result_bound(component)) for component in solver.solvers)
+        return max(solver.lower_bound(), len(solver.reduction.forced_routes) + component_bounds)
+    return member_bound(solver)
+
+
+def csv_fields(args, problem: PathSelectionProblem, solver, verification: Verification) -> list:
+    """
+    :return: the values of the fields of CSV_HEADER
+    """
+    sources = problem.get_sources(solver.get_solution())
+    return [args.input, args.solver, args.goal, args.seed, args.reductions is not None, solver.get_objective(),
+            solver.get_solving_time(), solver.get_total_time(), solver.get_status(),
+            verification.is_covered(), verification.is_one_id(),
+            args.timelimit, len(sources), max(sources.values()) if len(sources) > 0 else -1]
+
+
+def solver_fields(solver, reduction: InstanceReduction = None) -> list:
+    """
+    :return: the statistics specific to the solver, appended to the csv line after the fields of CSV_HEADER
+    """
+    fields = []
+    if isinstance(solver, CachedResult):
+        fields += solver.fields
+    if isinstance(solver, PSPIntegerLinearProgram):
+        fields += [solver.mip_gap, solver.pair_rows, solver.pair_rows_removed, solver.get_build_time()]
+    if isinstance(solver, PSPColumnGeneration):
+        fields += [solver.greedy_time, solver.cg_time, solver.conversion_time,
+                   solver.greedy_obj, solver.column_nbr, solver.pooled_column_nbr,
+                   solver.lp_solution_cost, solver.int_lp_solution_cost, solver.iterations,
+                   solver.avg_null_cover_dual, solver.avg_null_1id_dual,
+                   solver.pair_rows_removed, solver.mispricings, solver.lagrangian_bound]
+    if isinstance(solver, PSPBranchAndPrice):
+        fields += [solver.strategy, solver.branching, solver.workers, solver.nodes_explored, solver.nodes_pruned,
+                   solver.open_nodes, solver.best_bound, solver.gap]
+    if isinstance(solver, PSPLagrangianRelaxation):
+        fields += [solver.greedy_time, solver.greedy_obj, solver.lower_bound, solver.gap, solver.iterations]
+    if isinstance(solver, PSPGreedy):
+        fields += [solver.runs, solver.best_seed]
+    if isinstance(solver, PSPPortfolio):
+        fields += [solver.winner, solver.winner_time, solver.best_bound, solver.gap,
+                   " ".join(f"{label}={status}" for label, status in solver.member_statuses.items())]
+    if isinstance(solver, ReducedSolver):
+        rows_before, rows_after = reduction.row_numbers()
+        fields += [len(reduction.forced_routes), len(reduction.components), rows_before, rows_after,
+                   sum(len(routes) for routes in reduction.component_routes), solver.fallbacks]
+    return fields
+
+
+def print_report(args, original_problem: PathSelectionProblem, problem: PathSelectionProblem, solver,
+                 verification: Verification) -> None:
+    print(
+        f"Status : {solver.get_status()}\n"
+        f"Number of paths : {solver.get_objective()}\n"
+        f"Number of sources : {len(problem.get_sources(solver.get_solution()))}\n"
+        f"Maximal load on source : {max(problem.get_sources(solver.get_solution()).values())}\n"
+        f"Covered : {verification.is_covered()}\n"
+        f"1id : {verification.is_one_id()}\n"
+        f"Solving Time (s) : {solver.get_solving_time()}\n"
+        f"Total Time (s) : {solver.get_total_time()}")
+    if isinstance(solver, PSPIntegerLinearProgram):
+        print(f"Build Time (s) : {solver.get_build_time()}")
+    if isinstance(solver, PSPColumnGeneration):
+        print(f"Column generation : {solver.iterations} iterations ({solver.mispricings} mispricings) "
+              f"in {solver.cg_time} s, LP bound {solver.lp_solution_cost}\n"
+              f"Columns : {solver.column_nbr} active, {solver.pooled_column_nbr} pooled")
+    if isinstance(solver, (PSPIntegerLinearProgram, PSPColumnGeneration)) and args.local_search > 0:
+        print(f"Local search : {solver.local_search_removed} routes removed")
+    if isinstance(solver, PSPBranchAndPrice):
+        print(f"Nodes : {solver.nodes_explored} explored, {solver.nodes_pruned} pruned, {solver.open_nodes} open\n"
+              f"Best bound : {solver.best_bound}\n"
+              f"Gap : {solver.gap}")
+    if isinstance(solver, PSPLagrangianRelaxation):
+        print(f"Lagrangian : {solver.iterations} iterations, lower bound {solver.lower_bound} "
+              f"(greedy {solver.greedy_obj})\n"
+              f"Gap : {solver.gap}")
+    if isinstance(solver, PSPGreedy):
+        print(f"Greedy : {solver.runs} runs, best seed {solver.best_seed}")
+    if isinstance(solver, PSPPortfolio):
+        print(f"Portfolio : won by {solver.winner} after {solver.winner_time} s, best bound {solver.best_bound}\n"
+              f"Gap : {solver.gap}\n"
+              f"Members : {', '.join(f'{label} {status}' for label, status in solver.member_statuses.items())}")
+    if isinstance(solver, ReducedSolver):
+        print(f"Reductions : lower bound {solver.lower_bound()}, "
+              f"{solver.fallbacks} components solved by the greedy")
+    if isinstance(solver, CachedResult):
+        print(f"Cache : result of a run with a time limit of {solver.timelimit} s, bound {solver.bound}")
+    if problem.pair_rows is not None:
+        print(f"Presolve : {problem.pair_rows}")
+
+    original_problem.print_solution(solver.get_solution())
+
+
+def solve(args, original_problem: PathSelectionProblem, problem: PathSelectionProblem):
+    """
+    Build and run the solver selected by the arguments, and write the solution file; with --cache, the result of the
+    same run is read from the cache before any model is built, and the new results are stored
+    :return: a tuple (solver, reduction, verification), the solver being None if the solver is unknown, and a
+             CachedResult if the result comes from the cache
+    """
+    cache, key = None, None
+    if args.cache:
+        cache = ResultCache(args.cache, args.cache_size)
+        key = result_key(original_problem.content_hash, args.goal, cache_configuration(args))
+        cached = cache.lookup(key, args.timelimit, args.cache_accept_longer)
+        if cached is not None:
+            print("Result found in the cache")
+            if args.incumbents:
+                IncumbentStream(args.incumbents, original_problem).record(cached.get_solution(), cached.bound)
+            if args.solfile:
+                original_problem.write_solution(args.solfile, cached.get_solution())
+            return cached, None, problem.verify(cached.get_solution())
 
     print("Loading model")
-    if args.solver == "ilp":
-        solver = PSPIntegerLinearProgram(problem, args.seed)
-    elif args.solver == 'column_generation':
-        solver = PSPColumnGeneration(problem, args.seed)
-    else:
-        print("Please enter a valid solver")
-        exit()
+    solver, reduction = build_solver(args, original_problem, problem)
+    if solver is None:
+        return None, None, None
 
     print("Building model")
     solver.build_model()
@@ -46,37 +348,37 @@ if __name__ == '__main__':
     print("Instance solved, retrieving stats")
 
     if args.solfile:
-        problem.write_solution(args.solfile, solver.get_solution())
+        original_problem.write_solution(args.solfile, solver.get_solution())
+    verification = problem.verify(solver.get_solution())
+    feasible = verification.is_covered() and (args.goal == "cover" or verification.is_one_id())
+    if cache is not None and feasible:
+        description = {"instance": args.input, "goal": args.goal, "configuration": cache_configuration(args)}
+        cache.store(key, description, args.timelimit, solver, result_bound(solver), solver_fields(solver, reduction))
+    return solver, reduction, verification
 
-    if args.csv:
 
-        # Name;Solver;Goal;Reductions;N_Paths;SolvingTime(s);TotalTime(s);Status;IsCovered;IsOne1id
-        output = (f"{args.input};{args.solver};{args.goal};{args.seed};{args.reductions != ''};{solver.get_objective()};"
-                  f"{solver.get_solving_time()};{solver.get_total_time()};{solver.get_status()};"
-                  f"{problem.is_covered(solver.get_solution())};{problem.is_one_id(solver.get_solution())};"
-                  f"{args.timelimit};{len(problem.get_sources(solver.get_solution()))};")
-        sources_sol = problem.get_sources(solver.get_solution()).values()
-        if len(sources_sol) > 0:
-            output += f"{max(problem.get_sources(solver.get_solution()).values())}"
-        else:
-            output += "-1"
-        if isinstance(solver, PSPIntegerLinearProgram):
-            output += f";{solver.mip_gap}"
-        if isinstance(solver, PSPColumnGeneration):
-            output += (f";{solver.greedy_time};{solver.cg_time};{solver.conversion_time};"
-                       f"{solver.greedy_obj};{solver.column_nbr};"
-                       f"{solver.lp_solution_cost};{solver.int_lp_solution_cost};{solver.iterations};{solver.avg_null_cover_dual};{solver.avg_null_1id_dual}")
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+
+    try:
+        original_problem, problem = load_problem(args)
+    except FileNotFoundError:
+        print(f"{args.input} does not exist")
+        exit()
+    except ValueError as error:
+        print(error)
+        exit()
+
+    solver, reduction, verification = solve(args, original_problem, problem)
+    if solver is None:
+        print("Please enter a valid solver")
+        exit()
+
+    if args.csv:
+        # the fields of CSV_HEADER, then the statistics specific to the solver
+        output = ";".join(str(field) for field in csv_fields(args, problem, solver, verification)
+                          + solver_fields(solver, reduction))
         with open(args.csv, "a") as csvfile:
             print(output, file=csvfile)
     else:
-        print(
-            f"Status : {solver.get_status()}\n"
-            f"Number of paths : {solver.get_objective()}\n"
-            f"Number of sources : {len(problem.get_sources(solver.get_solution()))}\n"
-            f"Maximal load on source : {max(problem.get_sources(solver.get_solution()).values())}\n"
-            f"Covered : {problem.is_covered(solver.get_solution())}\n"
-            f"1id : {problem.is_one_id(solver.get_solution())}\n"
-            f"Solving Time (s) : {solver.get_solving_time()}\n"
-            f"Total Time (s) : {solver.get_total_time()}")
-
-        problem.print_solution(solver.get_solution())
+        print_report(args, original_problem, problem, solver, verification)
@@ -1,5 +1,12 @@
 from .psp_ilp import PSPIntegerLinearProgram
-from .psp_greedy import get_greedy_psp_solution_routes, get_greedy_psp_solution_endpoints
-from .cg_utils import Node
+from .partition_greedy import PartitionGreedy
+from .psp_greedy import get_greedy_psp_solution_routes, get_greedy_psp_solution_endpoints, GreedyServer, PSPGreedy
+from .pricing import PricingEngine
+from .env_pool import EnvPool
+from .cg_utils import Node, ColumnGenerationSettings
+from .local_search import LocalSearch, improve_solution
+from .lagrangian import LagrangianRelaxation, PSPLagrangianRelaxation
 from .psp_column_generation import PSPColumnGeneration
-
+from .branch_and_price import PSPBranchAndPrice, OpenNode
+from .reduced_solver import ReducedSolver
+from .portfolio import PSPPortfolio, SharedIncumbent, member_bound
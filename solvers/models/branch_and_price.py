@@ -0,0 +1,518 @@
+import heapq
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from time import time
+from problems import PathSelectionProblem, IncumbentStream
+from models import Node, ColumnGenerationSettings
+from models import PricingEngine
+from models import PSPColumnGeneration
+from models import EnvPool
+from models import get_greedy_psp_solution_routes
+import numpy as np
+
+INTEGRALITY_TOLERANCE = 1e-6
+# share of the remaining time given to the ILP restricted to the columns of the root
+ROOT_HEURISTIC_SHARE = 0.25
+# maximal number of solved nodes whose model is kept to be copied by their children
+KEPT_MODELS_LIMIT = 128
+
+# the instance, pricing engine, environment and shared values of a worker process, set by init_worker
+worker_context = {}
+
+
+class OpenNode:
+    """
+    A node of the branch-and-price tree waiting to be solved: its branching constraints,
+    the columns of its parent used to warm-start its RMP, and the bound inherited from its parent.
+    In the main process, the solved parent is kept to copy its model instead of building the RMP again.
+    """
+    bound: float
+    depth: int
+    branching_constraints_stack: list
+    columns: set[int]
+    description: str
+    parent: Node
+
+    def __init__(self, bound: float, depth: int, branching_constraints_stack: list, columns: set[int],
+                 description: str, parent: Node = None) -> None:
+        self.bound = bound
+        self.depth = depth
+        self.branching_constraints_stack = branching_constraints_stack
+        self.columns = columns
+        self.description = description
+        self.parent = parent
+
+
+class NodeResult:
+    """
+    The outcome of the column generation of a node of the tree, without its model so that it can be sent back
+    by a worker process
+    """
+    open_node: OpenNode
+    evaluated: bool
+    finished: bool
+    infeasible: bool
+    objective_value: float
+    lagrangian_bound: float
+    solution: dict
+    columns: set[int]
+    pooled_columns: int
+    incumbent: dict
+    iterations: int
+    mispricings: int
+    avg_null_cover_dual: float
+    avg_null_1id_dual: float
+
+    def __init__(self, open_node: OpenNode, node: Node = None) -> None:
+        """
+        :param open_node: the node of the tree
+        :param node: the node once solved, None if it was pruned before being solved
+        """
+        self.open_node = open_node
+        self.evaluated = node is not None
+        self.finished = self.evaluated and node.finished
+        self.infeasible = self.finished and node.artificial_value() > INTEGRALITY_TOLERANCE
+        self.objective_value = node.objective_value if self.evaluated else -1
+        self.lagrangian_bound = node.lagrangian_bound if self.evaluated else -math.inf
+        self.solution = node.solution if self.evaluated else {}
+        self.columns = set(node.used_routes) if self.evaluated else set()
+        self.pooled_columns = len(node.column_pool.pooled) if self.evaluated else 0
+        self.iterations = node.iterations if self.evaluated else -1
+        self.mispricings = node.mispricings if self.evaluated else 0
+        self.avg_null_cover_dual = node.avg_null_cover_dual if self.evaluated else -1.0
+        self.avg_null_1id_dual = node.avg_null_1id_dual if self.evaluated else -1.0
+        self.incumbent = {}
+        if self.finished and not self.infeasible:
+            self.incumbent = best_candidate(node.instance, self.solution)
+
+
+def best_candidate(instance: PathSelectionProblem, solution: dict) -> dict:
+    """
+    :param instance: the instance
+    :param solution: the solution of the LP of a node
+    :return: the smallest feasible selection among the routes used by the LP solution, which satisfy every row,
+             and the routes used at 1/2 or more, as a dict {route: 1.0}
+    """
+    candidates = [{route: 1.0 for route, value in solution.items() if value >= 0.5},
+                  {route: 1.0 for route in solution}]
+    for candidate in candidates:
+        verification = instance.verify(candidate)
+        if (len(candidate) > 0 and verification.is_covered()
+                and (instance.goal != "1id" or verification.is_one_id())):
+            return candidate
+    return {}
+
+
+def build_node(instance: PathSelectionProblem, open_node: OpenNode, deadline: float, seed: int,
+               pricing: PricingEngine, env, settings: ColumnGenerationSettings, initial_duals=None) -> Node:
+    """
+    Build the RMP of a node of the tree from the columns of its parent and its branching constraints
+    :param deadline: the time at which the search stops
+    :param env: the environment of the model
+    :param settings: the options of the column generation
+    :param initial_duals: the initial duals of the node, e.g. the Lagrangian multipliers for the root
+    :return: the node, ready to be solved
+    """
+    node = Node(instance, set(open_node.columns), deadline - time(), open_node.description, seed, pricing, env,
+                settings=settings, initial_duals=initial_duals)
+    node.init_rmp()
+    # any solution is cheaper than using every route
+    node.add_artificial_column(instance.route_number + 1.0)
+    for routes, constr_type in open_node.branching_constraints_stack:
+        node.add_branching_constraint(routes, constr_type)
+    return node
+
+
+def init_worker(instance: PathSelectionProblem, seed: int, columns_number: int, settings: ColumnGenerationSettings,
+                incumbent, best_bound):
+    """
+    Initialize a worker process, the instance being sent only once
+    :param incumbent: the shared value of the incumbent
+    :param best_bound: the shared lower bound of the tree
+    """
+    env_pool = EnvPool()
+    worker_context.update(instance=instance, seed=seed, columns_number=columns_number, settings=settings,
+                          incumbent=incumbent,
+                          best_bound=best_bound, pricing=PricingEngine(instance), env_pool=env_pool,
+                          env=env_pool.acquire())
+
+
+def solve_open_node(open_node: OpenNode, deadline: float) -> NodeResult:
+    """
+    Solve a node of the tree in a worker process
+    :param open_node: the node to solve
+    :param deadline: the time at which the search stops
+    :return: the result of the node, not evaluated if the shared incumbent and bound already prune it
+    """
+    incumbent = worker_context["incumbent"].value
+    if (open_node.bound > incumbent - 1 + INTEGRALITY_TOLERANCE
+            or worker_context["best_bound"].value > incumbent - 1 + INTEGRALITY_TOLERANCE):
+        return NodeResult(open_node)
+    node = build_node(worker_context["instance"], open_node, deadline, worker_context["seed"],
+                      worker_context["pricing"], worker_context["env"], worker_context["settings"])
+    node.solve(worker_context["columns_number"])
+    result = NodeResult(open_node, node)
+    node.dispose()
+    with worker_context["incumbent"].get_lock():
+        if 0 < len(result.incumbent) < worker_context["incumbent"].value:
+            worker_context["incumbent"].value = len(result.incumbent)
+    return result
+
+
+class PSPBranchAndPrice(PSPColumnGeneration):
+    """
+    Branch-and-price on top of the column generation of the Node class.
+    Each node of the tree adds (routes, type) branching constraints to the RMP: with the route rule, a fractional
+    route is either used or forbidden; with the pair rule, for a pair of nodes (a, b), either at least one used route
+    crosses both a and b, or none of them does. An artificial column keeps the RMP of every node feasible.
+    With one worker, the model of a child is a copy of the model of its parent, warm-started from its basis.
+    With several workers, the root is solved first, then the open nodes are solved concurrently by worker processes
+    that rebuild their RMP from the columns of the parent, the incumbent and the bound being shared with them.
+    """
+    strategy: str
+    branching: str
+    columns_number: int
+    workers: int
+    pricing: PricingEngine
+    root_duals: np.ndarray
+    env_pool: EnvPool
+    children_left: dict
+    duplicates: dict
+    shared_incumbent: object
+    shared_bound: object
+    nodes_explored: int
+    nodes_pruned: int
+    open_nodes: int
+    best_bound: float
+    gap: float
+    counter: int
+
+    def __init__(self, instance: PathSelectionProblem, seed=784646, greedy="native", strategy="best_bound",
+                 branching="route", columns_number=10, workers=1, settings: ColumnGenerationSettings = None,
+                 lagrangian_time=0.0, local_search_time=0.0, stream: IncumbentStream = None):
+        """
+        :param strategy: the order in which the nodes are explored, "best_bound" or "depth_first"
+        :param branching: the branching rule, "route" or "pair"
+        :param columns_number: the maximal number of columns added by each pricing
+        :param workers: the number of processes solving the nodes of the tree
+        :param settings: the options of the column generation of the nodes
+        :param lagrangian_time: the time given to the Lagrangian relaxation before the root, 0 to disable it
+        :param local_search_time: the time given to the local search shrinking the greedy solution and each new
+                                  incumbent, 0 to disable it
+        :param stream: the stream to which the greedy solution and each new incumbent are appended
+        """
+        super().__init__(instance, seed, greedy, settings, lagrangian_time, local_search_time, stream)
+        self.strategy = strategy
+        self.branching = branching
+        self.columns_number = columns_number
+        self.workers = workers
+        self.pricing = None
+        self.root_duals = None
+        self.env_pool = None
+        self.children_left = {}
+        self.duplicates = {}
+        self.shared_incumbent = None
+        self.shared_bound = None
+        self.nodes_explored = 0
+        self.nodes_pruned = 0
+        self.open_nodes = 0
+        self.best_bound = -1.0
+        self.gap = -1.0
+        self.counter = 0
+
+    def solve(self, timelimit):
+        self.solution, self.greedy_time = get_greedy_psp_solution_routes(self.instance, self.seed, self.greedy)
+        self.greedy_obj = len(self.solution)
+        self.status = "Greedy"
+        start_time = time()
+        self.solution = self.improve(self.solution)
+        self.objective = len(self.solution)
+        deadline = start_time + timelimit - self.greedy_time
+        self.root_duals = self.lagrangian_warm_start(deadline - time())
+        self.record()
+        self.pricing = PricingEngine(self.instance)
+        self.env_pool = EnvPool()
+        self.duplicates = {route: frozenset(group.tolist())
+                           for group in self.instance.analyze().duplicate_routes for route in group.tolist()}
+
+        open_nodes = []
+        # the Lagrangian bound can prove the greedy solution optimal before the root is solved
+        root_bound = max(0.0, float(self.lagrangian_lower_bound))
+        self.push(open_nodes, OpenNode(root_bound, 0, [], set(self.solution.keys()), "root"))
+        if self.workers > 1:
+            self.serial_search(open_nodes, deadline, start_time, node_limit=1)
+            if len(open_nodes) > 0 and time() < deadline:
+                self.parallel_search(open_nodes, deadline)
+        else:
+            self.serial_search(open_nodes, deadline, start_time)
+
+        self.open_nodes = len(open_nodes)
+        if len(open_nodes) == 0:
+            self.status = "BP_optimal"
+            self.best_bound = self.objective
+        else:
+            self.status = "BP_unfinished"
+            self.best_bound = self.lower_bound(open_nodes)
+        self.gap = (self.objective - self.best_bound) / self.objective if self.objective > 0 else 0.0
+        for parent in self.children_left:
+            parent.dispose()
+        self.children_left = {}
+        self.env_pool.dispose()
+        self.conversion_time = time() - start_time - self.cg_time
+        self.solving_time = time() - start_time + self.greedy_time
+
+    def serial_search(self, open_nodes: list, deadline: float, start_time: float, node_limit: int = None):
+        """
+        Solve the open nodes one after the other in the main process, each child copying the model of its parent
+        :param open_nodes: the open nodes, updated with the children of the solved nodes
+        :param deadline: the time at which the search stops
+        :param start_time: the time at which the search started
+        :param node_limit: the maximal number of nodes to solve, no limit if None
+        """
+        env = self.env_pool.acquire()
+        while len(open_nodes) > 0 and time() < deadline and (node_limit is None or self.nodes_explored < node_limit):
+            open_node = self.pop(open_nodes)
+            if self.is_pruned(open_node):
+                self.nodes_pruned += 1
+                self.release_parent(open_node)
+                continue
+
+            if open_node.parent is not None:
+                routes, constr_type = open_node.branching_constraints_stack[-1]
+                node = open_node.parent.branch(routes, constr_type, deadline - time(), open_node.description)
+                self.release_parent(open_node)
+            else:
+                node = build_node(self.instance, open_node, deadline, self.seed, self.pricing, env, self.settings,
+                                  self.root_duals)
+            node.solve(self.columns_number)
+            result = NodeResult(open_node, node)
+
+            if open_node.depth == 0:
+                self.set_root_statistics(result, start_time)
+                if result.finished:
+                    self.update_incumbent(node.solve_restricted_ilp((deadline - time()) * ROOT_HEURISTIC_SHARE,
+                                                                    self.solution))
+
+            children = self.handle_result(result)
+            if children is None:
+                # the column generation of the node did not finish before the time limit
+                node.dispose()
+                self.push(open_nodes, open_node)
+                break
+            if self.workers == 1 and len(children) > 0 and len(self.children_left) < KEPT_MODELS_LIMIT:
+                self.children_left[node] = len(children)
+                for child in children:
+                    child.parent = node
+            else:
+                node.dispose()
+            for child in children:
+                self.push(open_nodes, child)
+        self.env_pool.release(env)
+
+    def parallel_search(self, open_nodes: list, deadline: float):
+        """
+        Solve the open nodes concurrently in worker processes, the incumbent and the lower bound of the tree being
+        shared with the workers so that they skip the nodes pruned in the meantime
+        :param open_nodes: the open nodes, updated with the children of the solved nodes
+        :param deadline: the time at which the search stops
+        """
+        # the workers are spawned since a forked Gurobi environment cannot be used
+        context = multiprocessing.get_context("spawn")
+        self.shared_incumbent = context.Value('i', int(self.objective))
+        self.shared_bound = context.Value('d', 0.0)
+        in_flight = {}
+        executor = ProcessPoolExecutor(self.workers, mp_context=context, initializer=init_worker,
+                                       initargs=(self.instance, self.seed, self.columns_number, self.settings,
+                                                 self.shared_incumbent, self.shared_bound))
+        while (len(open_nodes) > 0 or len(in_flight) > 0) and time() < deadline:
+            while len(open_nodes) > 0 and len(in_flight) < self.workers:
+                open_node = self.pop(open_nodes)
+                if self.is_pruned(open_node):
+                    self.nodes_pruned += 1
+                    continue
+                in_flight[executor.submit(solve_open_node, open_node, deadline)] = open_node
+            self.shared_bound.value = self.lower_bound(open_nodes, list(in_flight.values()))
+
+            done, _ = wait(in_flight, timeout=max(deadline - time(), 0.0), return_when=FIRST_COMPLETED)
+            for future in done:
+                open_node = in_flight.pop(future)
+                children = self.handle_result(future.result())
+                if children is None:
+                    self.push(open_nodes, open_node)
+                    continue
+                for child in children:
+                    self.push(open_nodes, child)
+
+        # the nodes being solved at the time limit stay open
+        for open_node in in_flight.values():
+            self.push(open_nodes, open_node)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def handle_result(self, result: NodeResult):
+        """
+        Update the incumbent with a solved node and branch on its LP solution
+        :param result: the result of the node
+        :return: the children of the node, or None if its column generation did not finish
+        """
+        open_node = result.open_node
+        if not result.evaluated:
+            self.nodes_pruned += 1
+            return []
+        self.nodes_explored += 1
+        if not result.finished:
+            # the Lagrangian bound is valid even if the column generation did not finish
+            open_node.bound = max(open_node.bound, math.ceil(result.lagrangian_bound - INTEGRALITY_TOLERANCE))
+            return None
+        if result.infeasible:
+            # no column can satisfy the branching constraints of the node
+            self.nodes_pruned += 1
+            return []
+
+        self.update_incumbent(result.incumbent)
+        bound = max(open_node.bound, math.ceil(result.objective_value - INTEGRALITY_TOLERANCE))
+        if bound > self.objective - 1 + INTEGRALITY_TOLERANCE:
+            self.nodes_pruned += 1
+            return []
+
+        branching_routes = None
+        if self.branching == "pair":
+            branching_routes = self.pair_branching_routes(result.solution)
+        if branching_routes is None:
+            branching_routes = self.route_branching_routes(result.solution)
+        if branching_routes is None:
+            # the total value of each group of identical routes is integer, one route per used group is as good
+            self.update_incumbent({min(group): 1.0 for group, total in self.group_totals(result.solution).items()
+                                   if total > INTEGRALITY_TOLERANCE})
+            return []
+
+        depth = open_node.depth + 1
+        stack = open_node.branching_constraints_stack
+        forbidden = OpenNode(bound, depth, stack + [(branching_routes, False)], result.columns - branching_routes,
+                             f"{open_node.description}/forbid")
+        required = OpenNode(bound, depth, stack + [(branching_routes, True)], result.columns,
+                            f"{open_node.description}/require")
+        # with the depth first strategy, the last child is explored first
+        return [forbidden, required]
+
+    def lower_bound(self, open_nodes: list, in_flight: list = ()) -> float:
+        """
+        :param open_nodes: the open nodes
+        :param in_flight: the nodes being solved
+        :return: the lower bound of the tree, i.e. the lowest bound among the given nodes and the incumbent
+        """
+        if self.strategy != "depth_first":
+            open_nodes = [entry[-1] for entry in open_nodes]
+        return min([self.objective] + [open_node.bound for open_node in list(open_nodes) + list(in_flight)])
+
+    def is_pruned(self, open_node: OpenNode) -> bool:
+        # the objective is integer, a node can only improve the incumbent if its bound is lower by 1
+        return open_node.bound > self.objective - 1 + INTEGRALITY_TOLERANCE
+
+    def release_parent(self, open_node: OpenNode):
+        """
+        Forget the parent of a node, its model being disposed once every child has been handled
+        """
+        parent = open_node.parent
+        if parent is None:
+            return
+        open_node.parent = None
+        self.children_left[parent] -= 1
+        if self.children_left[parent] == 0:
+            del self.children_left[parent]
+            parent.dispose()
+
+    def set_root_statistics(self, result: NodeResult, start_time: float):
+        self.cg_time = time() - start_time
+        self.column_nbr = len(result.columns)
+        self.pooled_column_nbr = result.pooled_columns
+        self.avg_null_1id_dual = result.avg_null_1id_dual
+        self.avg_null_cover_dual = result.avg_null_cover_dual
+        self.lp_solution_cost = result.objective_value
+        self.int_lp_solution_cost = sum(result.solution.values())
+        self.iterations = result.iterations
+        self.mispricings = result.mispricings
+        self.lagrangian_bound = result.lagrangian_bound
+        if self.instance.pair_rows is not None:
+            self.pair_rows_removed = self.instance.pair_rows.removed()
+
+    def push(self, open_nodes: list, open_node: OpenNode):
+        if self.strategy == "depth_first":
+            open_nodes.append(open_node)
+        else:
+            # among the nodes having the same bound, the deepest one then the newest one, as with depth first
+            heapq.heappush(open_nodes, (open_node.bound, -open_node.depth, -self.counter, open_node))
+            self.counter += 1
+
+    def pop(self, open_nodes: list) -> OpenNode:
+        if self.strategy == "depth_first":
+            return open_nodes.pop()
+        return heapq.heappop(open_nodes)[-1]
+
+    def route_branching_routes(self, solution: dict):
+        """
+        The routes crossing the same nodes are interchangeable, they are branched on together: either at least one of
+        them is used, or none of them
+        :param solution: the solution of the LP of a node
+        :return: the group of identical routes whose total value is the most fractional, the lowest route breaking
+                 ties, or None if the total value of every group is integer
+        """
+        totals = self.group_totals(solution)
+        fractional = [(abs(total - 0.5), min(group), group) for group, total in totals.items()
+                      if INTEGRALITY_TOLERANCE < total < 1 - INTEGRALITY_TOLERANCE]
+        if len(fractional) == 0:
+            return None
+        return set(min(fractional)[2])
+
+    def group_totals(self, solution: dict) -> dict:
+        """
+        :param solution: the solution of the LP of a node
+        :return: the total value of each group of identical routes used by the solution, as a dict {group: total},
+                 the groups being frozensets of routes
+        """
+        totals = {}
+        for route, value in solution.items():
+            group = self.duplicates.get(route, frozenset((route,)))
+            totals[group] = totals.get(group, 0.0) + value
+        return totals
+
+    def pair_branching_routes(self, solution: dict):
+        """
+        :param solution: the solution of the LP of a node
+        :return: the routes crossing both nodes of the pair whose total value on these routes is the most fractional,
+                 or None if this value is integer for every pair
+        """
+        routes = np.array(sorted(solution.keys()), dtype=np.int64)
+        values = np.array([solution[route] for route in routes.tolist()])
+        support = self.pricing.route_nodes[routes]
+        together = (support.T @ support.multiply(values[:, None])).toarray()
+        first, second = np.triu_indices(self.instance.node_number, k=1)
+        together = together[first, second]
+        fractional = np.flatnonzero((together > INTEGRALITY_TOLERANCE) & (together < 1 - INTEGRALITY_TOLERANCE))
+        if len(fractional) == 0:
+            return None
+        # argmin returns the first pair in case of ties
+        pair = fractional[np.argmin(np.abs(together[fractional] - 0.5))]
+        crossing = np.intersect1d(self.instance.get_symptom(int(first[pair])),
+                                  self.instance.get_symptom(int(second[pair])), assume_unique=True)
+        return set(crossing.tolist())
+
+    def update_incumbent(self, solution: dict):
+        """
+        Replace the incumbent by the given routes if they form a better solution of the instance
+        :param solution: a dict {route: value} whose keys are the candidate routes
+        """
+        if len(solution) == 0 or len(solution) >= self.objective:
+            return
+        routes = {route: 1.0 for route in solution}
+        verification = self.instance.verify(routes)
+        if verification.is_covered() and (self.instance.goal != "1id" or verification.is_one_id()):
+            self.solution = self.improve(routes)
+            self.objective = len(self.solution)
+            self.record()
+            if self.shared_incumbent is not None:
+                with self.shared_incumbent.get_lock():
+                    self.shared_incumbent.value = min(self.shared_incumbent.value, self.objective)
+
+    def get_gap(self):
+        return self.gap
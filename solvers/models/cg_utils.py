@@ -1,20 +1,74 @@
 import copy
+import math
 import random
 from gurobipy import GRB
-from common import hash_pair
 from time import time
-from problems import PathSelectionProblem
+from problems import PathSelectionProblem, IncumbentStream
+from models.pricing import PricingEngine, PRICE_TOLERANCE, best_routes, diverse_routes
+from models.column_builder import ColumnBuilder
+from models.model_state import ModelState
+from models.column_pool import ColumnPool
 import gurobipy as gp
+import numpy as np
 
 MEM_LIMIT = 20
 RANDOM_SEED = 1863947
 DEFAULT_TIMEOUT = 1800
+# with the adaptive batch size, a share of the improving routes is added, up to a multiple of columns_number
+ADAPTIVE_COLUMNS_SHARE = 0.05
+ADAPTIVE_COLUMNS_FACTOR = 10
+# the diversity filter picks the routes among a multiple of the batch size
+DIVERSITY_POOL_FACTOR = 3
+
+
+class ColumnGenerationSettings:
+    """
+    Options of the column generation, all disabled by default
+    """
+    smoothing: float
+    adaptive_columns: bool
+    diversity: float
+    max_age: int
+    age_reduced_cost: float
+    max_columns: int
+
+    def __init__(self, smoothing: float = 0.0, adaptive_columns: bool = False, diversity: float = 1.0,
+                 max_age: int = 0, age_reduced_cost: float = 0.0, max_columns: int = 0) -> None:
+        """
+        :param smoothing: the weight alpha of the stability center in the Wentges smoothing of the duals,
+                          0 to price the routes with the duals of the RMP
+        :param adaptive_columns: whether the number of routes added at each iteration grows with the number of routes
+                                 having a negative reduced cost
+        :param diversity: the maximal Jaccard similarity between the nodes of two routes added at the same iteration,
+                          1 to disable the filter
+        :param max_age: the number of consecutive RMPs after which a non-basic column with a large reduced cost is
+                        moved to the column pool, 0 to keep every column
+        :param age_reduced_cost: the reduced cost above which a non-basic column gets older
+        :param max_columns: the maximal number of columns of the RMP, 0 for no limit
+        """
+        self.smoothing = smoothing
+        self.adaptive_columns = adaptive_columns
+        self.diversity = diversity
+        self.max_age = max_age
+        self.age_reduced_cost = age_reduced_cost
+        self.max_columns = max_columns
 
 
 class Node:
     instance: PathSelectionProblem
     used_routes: set[int]
     routes_init: set[int]
+    pricing: PricingEngine
+    columns: ColumnBuilder
+    state: ModelState
+    settings: ColumnGenerationSettings
+    column_pool: ColumnPool
+    artificial: gp.Var
+    artificial_cost: float
+    lagrangian_bound: float
+    stability_center: np.ndarray
+    mispricings: int
+    initial_duals: np.ndarray
 
     branching_constraints_description: list
 
@@ -28,8 +82,21 @@ class Node:
     avg_null_1id_dual: float
 
     def __init__(self, instance: PathSelectionProblem, used_routes: set[int], timelimit: int, description: str = "",
-                 seed=RANDOM_SEED):
+                 seed=RANDOM_SEED, pricing: PricingEngine = None, env: gp.Env = None, model: gp.Model = None,
+                 settings: ColumnGenerationSettings = None, initial_duals: np.ndarray = None):
+        """
+        :param pricing: the pricing engine of the instance, created if not given
+        :param env: a started environment shared with other nodes, a new one is created and owned by the node if not
+                    given
+        :param model: the model of the node, e.g. the copy of the model of its parent, created empty if not given
+        :param settings: the options of the column generation, the default ones if not given
+        :param initial_duals: duals of the cover and 1id rows, e.g. Lagrangian multipliers, used to price the routes
+                              added before the first RMP and as first stability center
+        """
         self.instance = instance
+        self.seed = seed
+        # the pricing engine only depends on the instance, it can be shared among the nodes
+        self.pricing = pricing if pricing is not None else PricingEngine(instance)
         self.used_routes = used_routes
         self.routes_init = copy.copy(used_routes)
         # print(self.used_routes)
@@ -43,13 +110,24 @@ class Node:
         self.iterations = -1
         self.avg_null_cover_dual = -1.0
         self.avg_null_1id_dual = -1.0
+        self.settings = settings if settings is not None else ColumnGenerationSettings()
+        self.column_pool = ColumnPool(self.settings.max_age, self.settings.age_reduced_cost, self.settings.max_columns)
+        self.lagrangian_bound = -math.inf
+        self.stability_center = None
+        self.mispricings = 0
+        self.initial_duals = initial_duals
 
         self.description = description
 
-        env = gp.Env(empty=True)
-        env.setParam('OutputFlag', 0)
-        env.start()
-        self.model = gp.Model("RMP", env=env)
+        # only the environment created by the node is disposed with it
+        self.own_env = env is None
+        self.env = env
+        if self.own_env:
+            self.env = gp.Env(empty=True)
+            self.env.setParam('OutputFlag', 0)
+            self.env.start()
+        self.model = model if model is not None else gp.Model("RMP", env=self.env)
+        self.state = ModelState(self.model)
         self.timelimit = max(timelimit, 0)
         self.model.setParam('TimeLimit', self.timelimit)
         self.model.setParam('SoftMemLimit', MEM_LIMIT)
@@ -58,6 +136,9 @@ class Node:
         random.seed(seed)
 
         self.branching_constraints_stack = []
+        self.columns = None
+        self.artificial = None
+        self.artificial_cost = 0.0
 
     def init_rmp(self):
         self.model.setParam(GRB.Param.Threads, 1)
@@ -66,32 +147,112 @@ class Node:
 
         route_vars = self.model.addVars([i for i in self.used_routes], name="Y",
                                         vtype=GRB.CONTINUOUS)
+        self.state.add_variables(route_vars)
 
         # objective function : minimize the sum of the routes var
         self.model.setObjective(gp.quicksum(route_vars), GRB.MINIMIZE)
 
-        # cover constraints
-        for node in range(self.instance.node_number):
-            constraint = [l for l in self.instance.symptoms[node] if l in self.used_routes]
+        # cover constraints, only for the nodes that must be covered
+        for node in self.instance.cover_nodes().tolist():
+            constraint = [l for l in self.instance.get_symptom(node).tolist() if l in self.used_routes]
 
-            self.model.addConstr(
+            self.state.add_constraint(node, self.model.addConstr(
                 gp.quicksum([route_vars[l] for l in constraint]) >= 1,
-                name=str(node))
+                name=str(node)))
 
-        # one id constraints
+        # one id constraints, the rows implied by other rows are removed by the presolve
         if self.instance.goal == '1id':
-            for i in range(self.instance.node_number):
-                for j in range(i + 1, self.instance.node_number):
-                    full_constraint = (self.instance.symptoms[i]
-                                       .symmetric_difference(self.instance.symptoms[j]))
-                    constraint = [l for l in full_constraint if l in self.used_routes]
+            pair_rows = self.instance.get_pair_rows()
+            for (i, j), row_id in zip(pair_rows.pairs.tolist(), pair_rows.row_ids.tolist()):
+                full_constraint = np.setxor1d(self.instance.get_symptom(i), self.instance.get_symptom(j),
+                                              assume_unique=True)
+                constraint = [l for l in full_constraint.tolist() if l in self.used_routes]
+
+                self.state.add_constraint(self.instance.node_number + row_id, self.model.addConstr(
+                    gp.quicksum([route_vars[l] for l in constraint]) >= 1,
+                    name=str(self.instance.node_number + row_id)))
 
-                    self.model.addConstr(
-                        gp.quicksum([route_vars[l] for l in constraint]) >= 1,
-                        name=str(self.instance.node_number + hash_pair(i, j, self.instance.node_number)))
+        self.model.update()
+        self.columns = ColumnBuilder(self.instance, self.state, self.row_space())
+
+    def add_artificial_column(self, cost: float):
+        """
+        Add a column belonging to every cover, pair and "at least one" branching row, so that the RMP stays feasible
+        whatever the branching decisions, the node being infeasible if the column is used by the optimal LP
+        :param cost: the cost of the column, larger than the cost of any solution
+        """
+        self.artificial_cost = cost
+        self.artificial = self.model.addVar(name="artificial", vtype=GRB.CONTINUOUS, obj=cost,
+                                            column=gp.Column([1.0] * len(self.state.constraints),
+                                                             self.state.constraints))
+        self.model.update()
 
+    def add_branching_constraint(self, routes: set[int], constr_type: bool):
+        """
+        Add a branching constraint after the rows of the RMP
+        :param routes: the routes of the constraint
+        :param constr_type: True if at least one of the routes must be used, False if none of them can be used
+        """
+        self.branching_constraints_stack.append((routes, constr_type))
+        expression = gp.quicksum([variable for route, variable in zip(self.state.routes, self.state.variables)
+                                  if route in routes])
+        if constr_type:
+            if self.artificial is not None:
+                expression += self.artificial
+            constraint = self.model.addConstr(expression >= 1)
+        else:
+            constraint = self.model.addConstr(expression <= 0)
+        self.state.add_constraint(self.row_space() + len(self.branching_constraints_stack) - 1, constraint)
         self.model.update()
 
+    def artificial_value(self) -> float:
+        """
+        :return: the value of the artificial column in the solution of the RMP, 0 if there is no such column
+        """
+        if self.artificial is None or not self.state.has_solution():
+            return 0.0
+        return self.artificial.X
+
+    def branch(self, routes: set[int], constr_type: bool, timelimit: float, description: str = "") -> "Node":
+        """
+        Create a child of the node from a copy of its model, keeping its columns, its branching constraints and the
+        optimal basis of its RMP, the slack of the new branching row being basic
+        :param routes: the routes of the new branching constraint
+        :param constr_type: True if at least one of the routes must be used, False if none of them can be used
+        :param timelimit: the time limit of the child
+        :param description: the description of the child
+        :return: the child, whose RMP is ready to be solved
+        """
+        model = self.model.copy()
+        child = Node(self.instance, set(self.used_routes), timelimit, description, self.seed, self.pricing, self.env,
+                     model, self.settings)
+        child.routes_init = copy.copy(self.routes_init)
+        variables, constraints = model.getVars(), model.getConstrs()
+        child.state.add_variables({route: variables[variable.index]
+                                   for route, variable in zip(self.state.routes, self.state.variables)})
+        for row_index, constraint in zip(self.state.row_indexes, self.state.constraints):
+            child.state.add_constraint(row_index, constraints[constraint.index])
+        if self.artificial is not None:
+            child.artificial = variables[self.artificial.index]
+            child.artificial_cost = self.artificial_cost
+        child.branching_constraints_stack = list(self.branching_constraints_stack)
+        child.columns = ColumnBuilder(self.instance, child.state, self.row_space(), self.columns.structural_rows)
+        child.add_branching_constraint(routes, constr_type)
+
+        if self.model.status == GRB.OPTIMAL:
+            model.setAttr("VBasis", variables, self.model.getAttr("VBasis", self.model.getVars()))
+            model.setAttr("CBasis", constraints, self.model.getAttr("CBasis", self.model.getConstrs()))
+            model.setAttr("CBasis", [child.state.constraints[-1]], [GRB.BASIC])
+        return child
+
+    def dispose(self):
+        """
+        Free the model of the node, and its environment if it is not shared
+        """
+        self.model.dispose()
+        if self.own_env:
+            self.env.dispose()
+
     def solve_rmp(self):
         self.model.optimize()
 
@@ -99,101 +260,138 @@ class Node:
         if self.model.status == 3:
             print("model is infeasible")
             return None
+        # if the time limit is reached before any solution
+        if not self.state.has_solution():
+            return None
 
         self.objective_value = self.model.getObjective().getValue()
 
         # retrieval of the solution of the dual problem
         # one value for each node due to cover constraints
         # if goal is 1-id then there is also 1 value for each pair of nodes
-        constraints = self.model.getConstrs()
-        dual_values = [0.0 for i in range(len(constraints))]
-
-        self.solution = {}
-        for route in self.used_routes:
-            if self.model.getVarByName(f"Y[{route}]").getAttr("X") != 0:
-                self.solution[route] = self.model.getVarByName(f"Y[{route}]").getAttr("X")
+        # the pairs removed by the presolve have a null dual value,
+        # and the branching constraints come last
+        self.solution = self.state.solution()
+        return self.state.duals(self.row_space() + len(self.branching_constraints_stack))
 
-        for c in constraints:
-            dual_values[int(c.constrName)] = c.getAttr("Pi")
-        return dual_values
+    def row_space(self) -> int:
+        """
+        :return: the number of row indexes: one per node, plus one per pair of nodes if the goal is 1-id
+        """
+        if self.instance.goal == '1id':
+            return self.instance.node_number * (self.instance.node_number + 1) // 2
+        return self.instance.node_number
 
     def update_rmp(self, routes_to_add):
-        constraints = self.model.getConstrs()
-        columns = {}
+        # the columns only contain the rows of the route, built from its nodes
         for route in routes_to_add:
-            columns[route] = set()
-
-        for node in range(self.instance.node_number):
-            temp_symptom = self.instance.symptoms[node].intersection(routes_to_add)
-            for route_index in temp_symptom:
-                columns[route_index].add(node)
-
-            if self.instance.goal == '1id':
-                for node_b in range(node, self.instance.node_number):
-                    for route_index in temp_symptom.symmetric_difference(
-                            self.instance.symptoms[node_b].intersection(routes_to_add)):
-                        columns[route_index].add(
-                            self.instance.node_number + hash_pair(node, node_b, self.instance.node_number))
-
-        for index, (constr, constr_type) in enumerate(reversed(self.branching_constraints_stack)):
-            for route_index in constr.intersection(routes_to_add):
-                columns[route_index].add(len(self.model.getConstrs()) - (index + 1))
-
-        for route in routes_to_add:
-            self.model.addVar(name=f"Y[{route}]", vtype=GRB.CONTINUOUS,
-                              column=gp.Column([1.0 if i in columns[route] else 0.0 for i in range(len(constraints))],
-                                               constraints), obj=1.0)
+            self.column_pool.reactivate(route)
+            self.state.add_variable(route, self.model.addVar(
+                name=f"Y[{route}]", vtype=GRB.CONTINUOUS,
+                column=self.columns.column(route, self.branching_constraints_stack), obj=1.0))
             self.used_routes.add(route)
         self.model.update()
 
-
-    def solve_pricing(self, dual_values, columns_number=10):
+    def solve_pricing(self, dual_values, columns_number=10, rmp_dual_values=None):
         """
-        Solve the pricing problem, i.e. find the removed route with highest price
-        :param dual_values: optimal solution of the current dual problem
-        :return: index of the best route in the global route set (int) and its reduced cost (int)
+        Solve the pricing problem, i.e. find the removed routes with highest price, and update the Lagrangian bound
+        :param dual_values: the duals used to price the routes, those of the current RMP or smoothed ones
+        :param columns_number: maximal number of routes to add
+        :param rmp_dual_values: the duals of the current RMP if dual_values are smoothed, only the routes with a
+                                negative reduced cost in the RMP can then be added
+        :return: a set containing the indexes of the routes to add to the RMP
         """
         forbidden_routes = set()
         for constr, constr_type in self.branching_constraints_stack:
             if constr_type is False:
                 forbidden_routes = forbidden_routes.union(constr)
 
-        prices = [[i, 0.0] for i in range(self.instance.route_number)]
-
-        # cost linked to cover constraints
-        # if a route crosses a node, the cost corresponding to this node cover constraint
-        # will be added to the route cost
-        # as the majority of the dual values are equal to zero, it is more efficient to
-        # iterate over the non-zero node costs than on the routes themselves
-        # print(dual_values)
-        null_cover_dual = 0.0
-        for node in range(self.instance.node_number):
-            if dual_values[node] != 0:
-                for route in self.instance.symptoms[node]:
-                    prices[route][1] += dual_values[node]
-            else:
-                null_cover_dual += 1.0
-
-        # cost linked to 1id constraints
-        # if a route crosses one of the two nodes in a pair and not the other one
-        # then the cost linked to this pair's distinguishability constraint is added to the route
-        # again, we iterate over the pair of nodes rather than the routes themselves
-        null_1id_dual = 0.0
-        if self.instance.goal == "1id":
-            for node_a in range(self.instance.node_number):
-                for node_b in range(node_a + 1, self.instance.node_number):
-                    val = dual_values[self.instance.node_number + hash_pair(node_a, node_b, self.instance.node_number)]
-                    if val != 0:
-                        for route_index in self.instance.symptoms[node_a].symmetric_difference(
-                                self.instance.symptoms[node_b]):
-                            prices[route_index][1] += val
-                    else:
-                        null_1id_dual += 1.0
-
+        # cost linked to cover and 1id constraints, computed for every route at once
+        # from the non-zero dual values
+        prices = self.route_prices(dual_values)
+
+        excluded = np.zeros(self.instance.route_number, dtype=bool)
+        excluded[list(forbidden_routes)] = True
+        self.update_lagrangian_bound(dual_values, prices, excluded)
+        excluded[list(self.used_routes)] = True
+        if rmp_dual_values is not None:
+            excluded |= self.route_prices(rmp_dual_values) <= 1 + PRICE_TOLERANCE
+
+        columns_number = self.batch_size(prices, excluded, columns_number)
+        diversity = self.settings.diversity < 1
+        routes = best_routes(prices, excluded, columns_number * DIVERSITY_POOL_FACTOR if diversity else columns_number,
+                             lambda routes: self.route_prices(dual_values, routes))
+        if diversity:
+            routes = diverse_routes(self.instance.incidence, routes, columns_number, self.settings.diversity)
+        return set(routes.tolist())
+
+    def route_prices(self, dual_values, routes=None) -> np.ndarray:
+        """
+        :param dual_values: the duals of the rows, the branching rows coming last
+        :param routes: some routes priced by summing the duals in the order of the rows, every route priced at once
+                       if None
+        :return: the price of the routes, i.e. the sum of the duals of the rows containing them
+        """
+        if routes is None:
+            routes = np.arange(self.instance.route_number)
+            prices = self.pricing.prices(dual_values)
+        else:
+            prices = self.pricing.exact_prices(dual_values, routes)
         for index, (branching_constr, constr_type) in enumerate(reversed(self.branching_constraints_stack)):
-            for route in branching_constr.difference(self.used_routes):
-                if constr_type:
-                    prices[route][1] += dual_values[-(index + 1)]
+            if constr_type:
+                branching_routes = np.fromiter(branching_constr, dtype=np.int64, count=len(branching_constr))
+                prices[np.isin(routes, branching_routes)] += dual_values[-(index + 1)]
+        return prices
+
+    def update_lagrangian_bound(self, dual_values, prices, forbidden):
+        """
+        Bounding the variables by 1 does not change the LP, so that minimizing the Lagrangian over 0 <= y <= 1 gives
+        a lower bound on the LP: the sum of the duals of the rows whose right-hand side is 1, plus the negative
+        reduced costs of the routes that are not forbidden.
+        The best bound and its duals, used as stability center, are kept.
+        :param dual_values: the duals of the rows, the branching rows coming last
+        :param prices: the price of every route for these duals
+        :param forbidden: a boolean mask of the forbidden routes
+        """
+        row_space = self.row_space()
+        right_hand_side = float(np.sum(dual_values[:row_space]))
+        right_hand_side += sum(float(dual_values[row_space + index])
+                               for index, (constr, constr_type) in enumerate(self.branching_constraints_stack)
+                               if constr_type)
+        bound = right_hand_side + float(np.minimum(0.0, 1.0 - prices[~forbidden]).sum())
+        if self.artificial is not None:
+            # the artificial column belongs to every row whose right-hand side is 1
+            bound += min(0.0, self.artificial_cost - right_hand_side)
+        if bound > self.lagrangian_bound:
+            self.lagrangian_bound = bound
+            self.stability_center = np.array(dual_values, dtype=np.float64)
+
+    def batch_size(self, prices, excluded, columns_number) -> int:
+        """
+        :return: the number of routes to add, growing with the number of routes with a negative reduced cost if the
+                 adaptive batch size is enabled
+        """
+        if not self.settings.adaptive_columns:
+            return columns_number
+        improving = np.count_nonzero((prices > 1) & ~excluded)
+        return int(min(max(columns_number, math.ceil(ADAPTIVE_COLUMNS_SHARE * improving)),
+                       ADAPTIVE_COLUMNS_FACTOR * columns_number))
+
+    def manage_columns(self):
+        """
+        Age the columns of the solved RMP and move the old ones to the column pool, the routes of the initial
+        solution being kept so that the RMP stays feasible
+        """
+        if not self.column_pool.enabled() or self.model.status != GRB.OPTIMAL:
+            return
+        positions = self.column_pool.update(self.state, self.routes_init)
+        if len(positions) > 0:
+            self.used_routes.difference_update(self.state.routes[position] for position in positions.tolist())
+            self.state.remove_variables(positions)
+            self.model.update()
+
+    def update_null_duals(self, dual_values):
+        null_cover_dual, null_1id_dual = self.pricing.null_duals(dual_values)
 
         self.avg_null_cover_dual = self.avg_null_cover_dual*(self.iterations)
         self.avg_null_cover_dual += null_cover_dual
@@ -203,18 +401,28 @@ class Node:
         self.avg_null_1id_dual += null_1id_dual
         self.avg_null_1id_dual = self.avg_null_1id_dual/(self.iterations+1.0)
 
-        var_to_add = set()
-        prices = sorted(prices, key=lambda x: x[1], reverse=True)
-
-        for i in range(len(prices)):
-            if prices[i][1] <= 1:
-                break
-            if prices[i][0] not in self.used_routes and prices[i][0] not in forbidden_routes:
-                var_to_add.add(prices[i][0])
-                if len(var_to_add) == columns_number:
-                    break
-        # print(var_to_add)
-        return var_to_add
+    def generate_columns(self, dual_values, columns_number=10):
+        """
+        Find the routes to add to the RMP. With the Wentges smoothing, the routes are priced with
+        alpha * center + (1 - alpha) * dual_values, the center being the duals of the best Lagrangian bound;
+        alpha is lowered at each mispricing, i.e. when no priced route improves the RMP, down to the duals of the RMP
+        :param dual_values: the duals of the current RMP
+        :param columns_number: maximal number of routes to add
+        :return: a set containing the indexes of the routes to add, empty if the RMP is optimal
+        """
+        self.update_null_duals(dual_values)
+        center = self.stability_center
+        if self.settings.smoothing > 0 and center is not None:
+            mispricing = 1
+            alpha = self.settings.smoothing
+            while alpha > PRICE_TOLERANCE:
+                routes = self.solve_pricing(alpha * center + (1 - alpha) * dual_values, columns_number, dual_values)
+                if len(routes) > 0:
+                    return routes
+                self.mispricings += 1
+                mispricing += 1
+                alpha = 1.0 - mispricing * (1.0 - self.settings.smoothing)
+        return self.solve_pricing(dual_values, columns_number)
 
     def solve(self, columns_number=10):
         """
@@ -223,18 +431,23 @@ class Node:
         self.iterations = 0
         self.start_time = time()
         # self.init_rmp()
+        if self.initial_duals is not None:
+            self.seed_columns(columns_number)
         dual_values = self.solve_rmp()
 
-        # if model is infeasible
-        if self.model.status == 3:
+        # if model is infeasible or the time limit is reached
+        if dual_values is None:
             # print("Infeasible model")
             # print(self.get_missing_variables())
             return
 
-
-        new_routes = self.solve_pricing(dual_values, columns_number)
+        new_routes = self.generate_columns(dual_values, columns_number)
         self.iterations = 1
+        if len(new_routes) == 0:
+            self.finished = True
         while len(new_routes) > 0 and self.timelimit > 0:
+            # the RMP is only modified when it is solved again, its last solution and basis stay available
+            self.manage_columns()
             self.used_routes = self.used_routes.union(new_routes)
             self.update_rmp(new_routes)
 
@@ -243,37 +456,103 @@ class Node:
             self.start_time = time()
 
             dual_values = self.solve_rmp()
+            if dual_values is None:
+                break
 
-            new_routes = self.solve_pricing(dual_values)
+            new_routes = self.generate_columns(dual_values, columns_number)
             self.timelimit = self.timelimit - (time() - self.start_time)
 
             if len(new_routes) == 0:
                 self.finished = True
             self.iterations += 1
 
-    def solve_ilp(self):
+    def seed_columns(self, columns_number=10):
+        """
+        Add the routes with the highest price for the initial duals to the RMP, the Lagrangian bound of the initial
+        duals becoming the first bound of the node, and they its first stability center
+        """
+        dual_values = np.zeros(self.row_space() + len(self.branching_constraints_stack))
+        dual_values[:len(self.initial_duals)] = self.initial_duals
+        new_routes = self.solve_pricing(dual_values, columns_number)
+        if len(new_routes) > 0:
+            self.used_routes = self.used_routes.union(new_routes)
+            self.update_rmp(new_routes)
+
+    def solve_restricted_ilp(self, timelimit: float, start: dict = None) -> dict:
+        """
+        Solve the ILP restricted to the columns of the RMP on a copy of the model, the RMP being left unchanged
+        :param timelimit: the time limit of the ILP
+        :param start: a solution given as MIP start, its routes that are not columns of the RMP being ignored
+        :return: the nonzero routes of the best solution found as a dict {route: value}, empty if none was found
+        """
+        model = self.model.copy()
+        variables = model.getVars()
+        route_variables = [variables[variable.index] for variable in self.state.variables]
+        for variable in route_variables:
+            variable.vtype = GRB.BINARY
+        if self.artificial is not None:
+            variables[self.artificial.index].ub = 0.0
+        if start is not None:
+            self.set_start(model, route_variables, start)
+        model.setParam('TimeLimit', max(timelimit, 0.0))
+        model.optimize()
+
+        solution = {}
+        if model.SolCount > 0:
+            values = model.getAttr("X", route_variables)
+            solution = {route: value for route, value in zip(self.state.routes, values) if value > 0.5}
+        model.dispose()
+        return solution
+
+    def set_start(self, model: gp.Model, route_variables: list, start: dict) -> None:
+        """
+        :param model: the model of the node or a copy of it
+        :param route_variables: the variables of the routes of the RMP in this model
+        :param start: the solution given as MIP start
+        """
+        values = [1.0 if start.get(route, 0.0) >= 0.5 else 0.0 for route in self.state.routes]
+        model.setAttr(GRB.Attr.Start, route_variables, values)
+
+    def stream_incumbent(self, model: gp.Model, where: int, stream: IncumbentStream, bound: float) -> None:
+        """
+        Callback appending each incumbent of the ILP to the stream, and stopping the ILP when it cannot improve the
+        best solution known by the stream
+        """
+        if where == GRB.Callback.MIP and stream.should_stop(model.cbGet(GRB.Callback.MIP_OBJBND)):
+            model.terminate()
+        if where == GRB.Callback.MIPSOL:
+            values = model.cbGetSolution(self.state.variables)
+            stream.record({route: 1.0 for route, value in zip(self.state.routes, values) if value > 0.5}, bound)
+
+    def solve_ilp(self, start: dict = None, stream: IncumbentStream = None, bound: float = 0):
         """
         Solve the ILP version of the problem
+        :param start: a solution given as MIP start, its routes that are not columns of the RMP being ignored
+        :param stream: the stream to which each incumbent is appended
+        :param bound: the lower bound written with the incumbents, the bound of the restricted ILP being only valid
+                      for its columns
         :return: a set containing the index of the routes used as measurement paths
         """
         # convert continuous variables into binary variables
-        for v in self.model.getVars():
+        for v in self.state.variables:
             v.vtype = GRB.BINARY
 
         # the optimal solution of the LP relaxation is used as a lower bound on the objective function
-        self.model.addConstr(gp.quicksum(self.model.getVars()) >= self.objective_value)
+        self.model.addConstr(gp.quicksum(self.state.variables) >= self.objective_value)
         self.model.update()
         self.timelimit = self.timelimit - (time() - self.start_time)
 
         self.timelimit = max(self.timelimit, 0.0)
         self.model.setParam('TimeLimit', self.timelimit)
+        if start is not None:
+            self.set_start(self.model, self.state.variables, start)
 
-        self.model.optimize()
+        if stream is not None:
+            self.model.optimize(lambda model, where: self.stream_incumbent(model, where, stream, bound))
+        else:
+            self.model.optimize()
 
         self.objective_value = self.model.getObjective().getValue()
-        self.solution = {}
-        for route in self.used_routes:
-            if self.model.getVarByName(f"Y[{route}]").getAttr("X") != 0:
-                self.solution[route] = self.model.getVarByName(f"Y[{route}]").getAttr("X")
+        self.solution = self.state.solution()
         if self.model.status != 2:
             self.finished = False
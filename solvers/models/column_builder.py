@@ -0,0 +1,64 @@
+from common import hash_pairs
+from problems import PathSelectionProblem
+from models.model_state import ModelState
+import gurobipy as gp
+import numpy as np
+
+
+class ColumnBuilder:
+    """
+    Build the sparse column of a route in the RMP directly from its nodes: the route belongs to the cover rows
+    of its nodes, and to the pair rows of the pairs made of one node of the route and one node out of it.
+    The constraints are read from the state of the model, the rows being found through a row index -> position array.
+    """
+    instance: PathSelectionProblem
+    state: ModelState
+    row_positions: np.ndarray
+    structural_rows: int
+
+    def __init__(self, instance: PathSelectionProblem, state: ModelState, row_space: int,
+                 structural_rows: int = None) -> None:
+        """
+        :param instance: the instance
+        :param state: the state of the model, containing the cover and pair constraints, the branching constraints
+                      being added after them in the order of the branching stack
+        :param row_space: the number of row indexes of the cover and pair rows
+        :param structural_rows: the number of cover and pair constraints, every constraint of the state if not given
+        """
+        self.instance = instance
+        self.state = state
+        self.structural_rows = len(state.constraints) if structural_rows is None else structural_rows
+        # the pairs removed by the presolve have no row
+        self.row_positions = np.full(row_space, -1, dtype=np.int64)
+        self.row_positions[np.asarray(state.row_indexes[:self.structural_rows], dtype=np.int64)] = \
+            np.arange(self.structural_rows)
+
+    def rows(self, route: int, branching_constraints_stack: list = ()) -> np.ndarray:
+        """
+        :param route: index of the route
+        :param branching_constraints_stack: the branching constraints, as (set of routes, type) tuples
+        :return: the sorted positions of the constraints containing the route
+        """
+        n = self.instance.node_number
+        nodes = self.instance.get_route(route)
+        rows = [nodes.astype(np.int64)]
+        if self.instance.goal == '1id':
+            outside = np.ones(n, dtype=bool)
+            outside[nodes] = False
+            outside = np.flatnonzero(outside)
+            rows.append(n + hash_pairs(np.repeat(nodes, len(outside)), np.tile(outside, len(nodes)), n))
+        positions = self.row_positions[np.concatenate(rows)]
+        positions = np.sort(positions[positions >= 0])
+
+        branching_rows = [self.structural_rows + index
+                          for index, (constr, constr_type) in enumerate(branching_constraints_stack) if route in constr]
+        return np.concatenate((positions, np.array(branching_rows, dtype=np.int64)))
+
+    def column(self, route: int, branching_constraints_stack: list = ()) -> gp.Column:
+        """
+        :param route: index of the route
+        :param branching_constraints_stack: the branching constraints, as (set of routes, type) tuples
+        :return: the column of the route, containing only its nonzero coefficients
+        """
+        rows = self.rows(route, branching_constraints_stack).tolist()
+        return gp.Column([1.0] * len(rows), [self.state.constraints[row] for row in rows])
@@ -0,0 +1,77 @@
+from models.model_state import ModelState
+from gurobipy import GRB
+import numpy as np
+
+
+class ColumnPool:
+    """
+    Aging of the columns of the RMP: a column gets older at each RMP solved while it is non-basic with a reduced cost
+    above a threshold, and is reset otherwise. The columns reaching the maximal age, or the oldest ones if the RMP
+    has too many columns, are moved to an inactive pool; they come back through the pricing like any other route,
+    when their reduced cost becomes negative again.
+    """
+    max_age: int
+    reduced_cost_threshold: float
+    max_columns: int
+    ages: dict[int, int]
+    pooled: set[int]
+    purged: int
+    reactivated: int
+
+    def __init__(self, max_age: int = 0, reduced_cost_threshold: float = 0.0, max_columns: int = 0) -> None:
+        """
+        :param max_age: the number of consecutive RMPs after which an aging column is moved to the pool, 0 to disable it
+        :param reduced_cost_threshold: a non-basic column only gets older if its reduced cost is above this value
+        :param max_columns: the maximal number of columns of the RMP, the oldest non-basic columns being moved to the
+                            pool beyond it, 0 for no limit
+        """
+        self.max_age = max_age
+        self.reduced_cost_threshold = reduced_cost_threshold
+        self.max_columns = max_columns
+        self.ages = {}
+        self.pooled = set()
+        self.purged = 0
+        self.reactivated = 0
+
+    def enabled(self) -> bool:
+        return self.max_age > 0 or self.max_columns > 0
+
+    def update(self, state: ModelState, protected: set[int]) -> np.ndarray:
+        """
+        Age the columns with the solution of the RMP and choose the columns to move to the pool
+        :param state: the state of the solved RMP
+        :param protected: the routes that are never moved to the pool
+        :return: the positions in the state of the columns to remove from the RMP, which are added to the pool
+        """
+        routes = np.array(state.routes, dtype=np.int64)
+        aging = (state.basis() != GRB.BASIC) & (state.reduced_costs() > self.reduced_cost_threshold)
+        ages = np.array([self.ages.get(route, 0) for route in routes.tolist()], dtype=np.int64)
+        ages = np.where(aging, ages + 1, 0)
+        self.ages = dict(zip(routes.tolist(), ages.tolist()))
+
+        removable = aging & ~np.isin(routes, np.fromiter(protected, dtype=np.int64, count=len(protected)))
+        removed = np.zeros(len(routes), dtype=bool)
+        if self.max_age > 0:
+            removed = removable & (ages >= self.max_age)
+        if self.max_columns > 0:
+            excess = len(routes) - np.count_nonzero(removed) - self.max_columns
+            if excess > 0:
+                candidates = np.flatnonzero(removable & ~removed)
+                # the oldest columns first, then the lowest routes
+                oldest = candidates[np.lexsort((routes[candidates], -ages[candidates]))]
+                removed[oldest[:excess]] = True
+
+        positions = np.flatnonzero(removed)
+        for route in routes[positions].tolist():
+            del self.ages[route]
+            self.pooled.add(route)
+        self.purged += len(positions)
+        return positions
+
+    def reactivate(self, route: int) -> None:
+        """
+        :param route: a route added back to the RMP by the pricing
+        """
+        if route in self.pooled:
+            self.pooled.remove(route)
+            self.reactivated += 1
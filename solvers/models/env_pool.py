@@ -0,0 +1,42 @@
+import gurobipy as gp
+
+
+class EnvPool:
+    """
+    Started Gurobi environments reused among the models of the nodes: starting an environment is much more expensive
+    than creating a model in it, and a released environment can host the models of the next nodes.
+    An environment cannot be shared between processes, each process has its own pool.
+    """
+    available: list[gp.Env]
+    created: list[gp.Env]
+
+    def __init__(self) -> None:
+        self.available = []
+        self.created = []
+
+    def acquire(self) -> gp.Env:
+        """
+        :return: a started environment, without output, created if none is available
+        """
+        if len(self.available) > 0:
+            return self.available.pop()
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+        self.created.append(env)
+        return env
+
+    def release(self, env: gp.Env) -> None:
+        """
+        :param env: an environment given by acquire, whose models are no longer used
+        """
+        self.available.append(env)
+
+    def dispose(self) -> None:
+        """
+        Free every environment created by the pool, their models must have been disposed
+        """
+        for env in self.created:
+            env.dispose()
+        self.available = []
+        self.created = []
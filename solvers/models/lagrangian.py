@@ -0,0 +1,245 @@
+import math
+from time import time
+from problems import PathSelectionProblem, IncumbentStream
+from models.pricing import PricingEngine
+from models.partition_greedy import PartitionGreedy
+from models.local_search import LocalSearch
+from models.psp_greedy import get_greedy_psp_solution_routes
+import numpy as np
+
+# factor of the Polyak step size, halved when the bound does not improve for STALL_ITERATIONS iterations
+INITIAL_STEP_FACTOR = 2.0
+MIN_STEP_FACTOR = 1e-3
+STALL_ITERATIONS = 30
+# the Lagrangian heuristic runs every HEURISTIC_PERIOD iterations, while it takes less than HEURISTIC_SHARE of the time
+HEURISTIC_PERIOD = 10
+HEURISTIC_SHARE = 0.5
+BOUND_TOLERANCE = 1e-6
+
+
+class LagrangianRelaxation:
+    """
+    Lagrangian relaxation of the cover and pair rows, solved without any LP solver.
+    The multipliers pi >= 0 are indexed as the duals of the RMP: one per node, then n + hash_pair(a, b) for the pair
+    rows kept by the presolve. The routes being bounded by 1, which does not change the LP relaxation,
+    L(pi) = sum(pi) + sum over the routes of min(0, 1 - price_r(pi)) is a lower bound on the LP relaxation,
+    the prices being computed at once by the pricing engine. L is maximized by projected subgradient steps with the
+    Polyak step size, and the routes with a negative reduced cost are completed into solutions by the greedy.
+    """
+    instance: PathSelectionProblem
+    pricing: PricingEngine
+    seed: int
+    rows: np.ndarray
+    multipliers: np.ndarray
+    best_multipliers: np.ndarray
+    best_bound: float
+    solution: dict
+    iterations: int
+    stream: IncumbentStream
+
+    def __init__(self, instance: PathSelectionProblem, seed: int, pricing: PricingEngine = None,
+                 stream: IncumbentStream = None) -> None:
+        """
+        :param instance: the instance
+        :param seed: the seed of the greedy completing the Lagrangian solutions
+        :param pricing: the pricing engine of the instance, created if not given
+        :param stream: the stream to which the better solutions are appended
+        """
+        self.instance = instance
+        self.pricing = pricing if pricing is not None else PricingEngine(instance)
+        self.seed = seed
+        n = instance.node_number
+        # the nodes that need not be covered have no cover row, hence a null multiplier
+        self.rows = instance.cover_nodes()
+        self.row_pair_routes = None
+        row_space = n
+        if instance.goal == "1id":
+            row_space = n * (n + 1) // 2
+            pair_ids = instance.get_pair_rows().row_ids.astype(np.int64)
+            self.rows = np.concatenate((self.rows, n + pair_ids))
+            # routes x pair rows incidence, a route belonging to the pairs of nodes it crosses both
+            self.row_pair_routes = self.pricing.pair_routes[:, pair_ids].tocsc()
+            self.row_first = self.pricing.pair_first[pair_ids]
+            self.row_second = self.pricing.pair_second[pair_ids]
+        self.multipliers = np.zeros(row_space)
+        self.best_multipliers = self.multipliers.copy()
+        self.best_bound = -math.inf
+        self.solution = {}
+        self.iterations = 0
+        self.stream = stream
+
+    def evaluate(self, multipliers: np.ndarray) -> (float, np.ndarray):
+        """
+        :param multipliers: the multipliers of the rows
+        :return: a tuple (bound, prices) with the Lagrangian bound of the multipliers and the price of every route
+        """
+        prices = self.pricing.prices(multipliers)
+        return float(multipliers.sum()) + float(np.minimum(0.0, 1.0 - prices).sum()), prices
+
+    def subgradient(self, selected: np.ndarray) -> np.ndarray:
+        """
+        :param selected: a boolean mask of the routes minimizing the Lagrangian, i.e. with a negative reduced cost
+        :return: the subgradient 1 - A.y of the Lagrangian, null for the rows without multiplier
+        """
+        n = self.instance.node_number
+        routes = selected.astype(np.float64)
+        counts = self.pricing.route_nodes.T @ routes
+        gradient = np.zeros(len(self.multipliers))
+        cover_rows = self.rows[self.rows < n]
+        gradient[cover_rows] = 1 - counts[cover_rows]
+        if self.row_pair_routes is not None:
+            # the routes crossing exactly one node of a pair are those crossing a node, minus twice those crossing both
+            both = self.row_pair_routes.T @ routes
+            gradient[self.rows[len(cover_rows):]] = 1 - (counts[self.row_first] + counts[self.row_second] - 2 * both)
+        return gradient
+
+    def solve(self, timelimit: float, solution: dict) -> None:
+        """
+        Run the subgradient iterations until the time limit, the step size becomes too small,
+        or the bound proves the best solution optimal
+        :param timelimit: the time limit in seconds
+        :param solution: a feasible solution as a dict {route: 1.0}, giving the target of the Polyak step
+        """
+        start_time = time()
+        self.solution = solution
+        step_factor = INITIAL_STEP_FACTOR
+        stall = 0
+        heuristic_time = 0.0
+        multipliers = self.multipliers
+        while time() - start_time < timelimit and step_factor > MIN_STEP_FACTOR:
+            bound, prices = self.evaluate(multipliers)
+            self.iterations += 1
+            if bound > self.best_bound + BOUND_TOLERANCE:
+                self.best_bound = bound
+                self.best_multipliers = multipliers.copy()
+                stall = 0
+            else:
+                stall += 1
+                if stall >= STALL_ITERATIONS:
+                    step_factor /= 2
+                    stall = 0
+            if self.iterations % HEURISTIC_PERIOD == 1 and heuristic_time <= HEURISTIC_SHARE * (time() - start_time):
+                heuristic_start = time()
+                self.primal_heuristic(prices)
+                heuristic_time += time() - heuristic_start
+            if self.lower_bound() >= len(self.solution):
+                break
+
+            gradient = self.subgradient(prices > 1)
+            # projection on pi >= 0: the null multipliers cannot decrease
+            gradient[(multipliers <= 0) & (gradient < 0)] = 0.0
+            norm = float(gradient @ gradient)
+            if norm == 0:
+                break
+            multipliers = np.maximum(0.0, multipliers + step_factor * (len(self.solution) - bound) / norm * gradient)
+        self.multipliers = multipliers
+        if self.lower_bound() < len(self.solution):
+            self.primal_heuristic(self.pricing.prices(self.best_multipliers))
+
+    def lower_bound(self) -> int:
+        """
+        :return: the best Lagrangian bound rounded up, a lower bound on the number of routes of any solution
+        """
+        return max(0, math.ceil(self.best_bound - BOUND_TOLERANCE))
+
+    def primal_heuristic(self, prices: np.ndarray) -> None:
+        """
+        Complete the routes with a negative reduced cost into a solution with the greedy, remove the redundant routes
+        and keep the solution if it is better than the best one
+        :param prices: the price of every route for the current multipliers
+        """
+        reduced_costs = 1.0 - prices
+        negative = np.flatnonzero(reduced_costs < 0)
+        # a solution using more routes than the best one cannot be better once the redundant routes are removed
+        initial_routes = negative[np.argsort(reduced_costs[negative], kind="stable")][:len(self.solution)]
+        routes = np.array(PartitionGreedy(self.instance, self.seed).solve(initial_routes.tolist()), dtype=np.int64)
+        search = LocalSearch(self.instance, routes)
+        # the routes with the largest reduced cost are dropped first
+        search.drop_redundant(routes[np.argsort(-reduced_costs[routes], kind="stable")].tolist())
+        if len(search.selected) >= len(self.solution):
+            return
+        candidate = search.solution()
+        verification = self.instance.verify(candidate)
+        if verification.is_covered() and (self.instance.goal != "1id" or verification.is_one_id()):
+            self.solution = candidate
+            if self.stream is not None:
+                self.stream.record(candidate, self.lower_bound())
+
+
+class PSPLagrangianRelaxation:
+    """
+    Solver giving a lower bound and a solution with the Lagrangian relaxation, starting from the greedy solution
+    """
+    instance: PathSelectionProblem
+    relaxation: LagrangianRelaxation
+    seed: int
+    greedy: str
+    status: str
+    solving_time: float
+    greedy_time: float
+    greedy_obj: int
+    lower_bound: int
+    gap: float
+    iterations: int
+    stream: IncumbentStream
+
+    def __init__(self, instance: PathSelectionProblem, seed=784646, greedy="native", stream: IncumbentStream = None):
+        """
+        :param stream: the stream to which the greedy solution and the solutions of the Lagrangian heuristic are
+                       appended
+        """
+        self.instance = instance
+        self.seed = seed
+        self.greedy = greedy
+        self.relaxation = None
+        self.objective = -1
+        self.solution = None
+        self.status = "Not solved"
+        self.solving_time = -1.0
+        self.greedy_time = -1.0
+        self.greedy_obj = -1
+        self.lower_bound = -1
+        self.gap = -1.0
+        self.iterations = -1
+        self.stream = stream
+
+    def build_model(self):
+        pass
+
+    def solve(self, timelimit):
+        self.solution, self.greedy_time = get_greedy_psp_solution_routes(self.instance, self.seed, self.greedy)
+        self.greedy_obj = len(self.solution)
+        if self.stream is not None:
+            self.stream.record(self.solution, 0)
+        start_time = time()
+        self.relaxation = LagrangianRelaxation(self.instance, self.seed, stream=self.stream)
+        self.relaxation.solve(timelimit - self.greedy_time - (time() - start_time), self.solution)
+
+        self.solution = self.relaxation.solution
+        self.objective = len(self.solution)
+        self.lower_bound = self.relaxation.lower_bound()
+        self.iterations = self.relaxation.iterations
+        self.gap = (self.objective - self.lower_bound) / self.objective if self.objective > 0 else 0.0
+        self.status = "Lagrangian_optimal" if self.lower_bound >= self.objective else "Lagrangian"
+        self.solving_time = time() - start_time + self.greedy_time
+
+    def get_objective(self):
+        return self.objective
+
+    def get_status(self):
+        return self.status
+
+    def get_solving_time(self):
+        return self.solving_time
+
+    def get_total_time(self):
+        return None
+
+    def get_solution(self):
+        return self.solution
+
+    def get_multipliers(self):
+        """
+        :return: the multipliers of the best Lagrangian bound, indexed as the duals of the RMP
+        """
+        return self.relaxation.best_multipliers
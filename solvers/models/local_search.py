@@ -0,0 +1,224 @@
+from time import time
+from problems import PathSelectionProblem
+from problems.verification import selected_routes
+import numpy as np
+
+# maximal number of routes tried to replace the routes removed by a swap, the longest routes first
+MAX_CANDIDATES = 100
+
+
+class LocalSearch:
+    """
+    Local search shrinking a feasible selection of routes: the redundant routes are dropped, then two routes are
+    replaced by one (2-for-1 swaps), and one route by another one reducing the number of nodes covered only once
+    (1-for-1 swaps), which can make other routes redundant.
+    The moves are evaluated incrementally, only on the nodes of the routes they add or remove: the coverage of every
+    node is counted, and the signature of every node (the set of selected routes crossing it) is hashed with the keys
+    of the verifier. The nodes are grouped in classes of equal hashes, a selection distinguishing every pair of nodes
+    iff every class contains a single node.
+    """
+    instance: PathSelectionProblem
+    route_keys: np.ndarray
+    route_lengths: np.ndarray
+    selected: set[int]
+    coverage: np.ndarray
+    required: np.ndarray
+    hashes: np.ndarray
+    signatures: list[int]
+    classes: dict[int, int]
+    dropped: int
+    swaps: int
+
+    def __init__(self, instance: PathSelectionProblem, routes) -> None:
+        """
+        :param instance: the instance
+        :param routes: the indexes of the routes of a feasible selection
+        """
+        self.instance = instance
+        self.route_keys = instance.get_verifier().route_keys
+        self.route_lengths = instance.incidence.route_lengths()
+        self.selected = set(int(route) for route in routes)
+        routes = np.fromiter(self.selected, dtype=np.int64, count=len(self.selected))
+        nodes, owners = instance.incidence.expand_routes(routes)
+        self.coverage = np.bincount(nodes, minlength=instance.node_number)
+        # the nodes that need not be covered, and the classes of nodes that need not be distinguished from each other,
+        # come from the restricted instances; the hashes start from the class keys of the verifier
+        self.required = instance.cover_mask
+        if self.required is None:
+            self.required = np.ones(instance.node_number, dtype=bool)
+        self.hashes = instance.get_verifier().node_offsets.copy()
+        np.add.at(self.hashes, nodes, self.route_keys[routes[owners]])
+        self.signatures = [first << 64 | second for first, second in self.hashes.tolist()]
+        self.classes = {}
+        for signature in self.signatures:
+            self.classes[signature] = self.classes.get(signature, 0) + 1
+        self.dropped = 0
+        self.swaps = 0
+
+    def apply(self, removed: list[int], added: list[int]) -> bool:
+        """
+        Replace some selected routes by others if the selection stays feasible
+        :param removed: selected routes
+        :param added: routes that are not selected
+        :return: True if the move was applied, False if the selection is unchanged
+        """
+        routes = np.array(removed + added, dtype=np.int64)
+        nodes, owners = self.instance.incidence.expand_routes(routes)
+        affected, inverse = np.unique(nodes, return_inverse=True)
+        signs = np.where(owners < len(removed), -1, 1)
+        coverage = self.coverage[affected].copy()
+        np.add.at(coverage, inverse, signs)
+        if np.any((coverage < 1) & self.required[affected]):
+            return False
+
+        if self.instance.goal == "1id":
+            # the keys of the removed routes are subtracted modulo 2^64
+            keys = self.route_keys[routes[owners]]
+            keys[signs < 0] = np.uint64(0) - keys[signs < 0]
+            hashes = self.hashes[affected].copy()
+            np.add.at(hashes, inverse, keys)
+            old_signatures = [self.signatures[node] for node in affected.tolist()]
+            new_signatures = [first << 64 | second for first, second in hashes.tolist()]
+            self.move_signatures(old_signatures, new_signatures)
+            if any(self.classes[signature] > 1 for signature in new_signatures):
+                self.move_signatures(new_signatures, old_signatures)
+                return False
+            self.hashes[affected] = hashes
+            for node, signature in zip(affected.tolist(), new_signatures):
+                self.signatures[node] = signature
+
+        self.coverage[affected] = coverage
+        self.selected.difference_update(removed)
+        self.selected.update(added)
+        return True
+
+    def move_signatures(self, old_signatures: list[int], new_signatures: list[int]) -> None:
+        """
+        Move nodes from the classes of their old signatures to those of their new ones
+        """
+        for signature in old_signatures:
+            self.classes[signature] -= 1
+            if self.classes[signature] == 0:
+                del self.classes[signature]
+        for signature in new_signatures:
+            self.classes[signature] = self.classes.get(signature, 0) + 1
+
+    def drop_redundant(self, order=None) -> int:
+        """
+        Drop, one after the other, the routes whose removal keeps the selection feasible
+        :param order: the order in which the selected routes are tried, the shortest routes first if None
+        :return: the number of dropped routes
+        """
+        if order is None:
+            order = sorted(self.selected, key=lambda route: (self.route_lengths[route], route))
+        dropped = 0
+        for route in order:
+            route = int(route)
+            nodes = self.instance.incidence.get_route(route)
+            if np.all((self.coverage[nodes] > 1) | ~self.required[nodes]) and self.apply([route], []):
+                dropped += 1
+        self.dropped += dropped
+        return dropped
+
+    def candidates(self, removed: list[int]) -> np.ndarray:
+        """
+        :param removed: selected routes
+        :return: the unselected routes that can replace the removed routes on the nodes they are the only ones to cover,
+                 or that cross one of their nodes if there are none, the longest routes first
+        """
+        incidence = self.instance.incidence
+        nodes, _ = incidence.expand_routes(np.array(removed, dtype=np.int64))
+        affected, counts = np.unique(nodes, return_counts=True)
+        uncovered = affected[(self.coverage[affected] == counts) & self.required[affected]]
+        if len(uncovered) > 0:
+            routes = incidence.get_symptom(int(uncovered[0]))
+            for node in uncovered[1:].tolist():
+                routes = np.intersect1d(routes, incidence.get_symptom(node), assume_unique=True)
+                if len(routes) == 0:
+                    return routes
+        else:
+            routes = np.unique(incidence.expand_symptoms(affected)[0])
+        selected = np.fromiter(self.selected, dtype=np.int64, count=len(self.selected))
+        routes = routes[~np.isin(routes, selected)]
+        return routes[np.argsort(-self.route_lengths[routes], kind="stable")][:MAX_CANDIDATES]
+
+    def two_for_one(self, deadline: float) -> bool:
+        """
+        Replace two selected routes crossing a common node by one route
+        :param deadline: the time at which the search stops
+        :return: True if a move was applied
+        """
+        incidence = self.instance.incidence
+        selected = np.array(sorted(self.selected), dtype=np.int64)
+        for first in selected.tolist():
+            neighbours = np.unique(incidence.expand_symptoms(incidence.get_route(first))[0])
+            neighbours = neighbours[np.isin(neighbours, selected) & (neighbours > first)]
+            for second in neighbours.tolist():
+                if time() > deadline:
+                    return False
+                for route in self.candidates([first, second]).tolist():
+                    if self.apply([first, second], [route]):
+                        self.swaps += 1
+                        return True
+        return False
+
+    def one_for_one(self, deadline: float) -> bool:
+        """
+        Replace a selected route by another one if fewer nodes are then covered only once
+        :param deadline: the time at which the search stops
+        :return: True if a move was applied
+        """
+        covered_once = np.count_nonzero((self.coverage == 1) & self.required)
+        for first in sorted(self.selected):
+            if time() > deadline:
+                return False
+            for route in self.candidates([first]).tolist():
+                if self.apply([first], [route]):
+                    if np.count_nonzero((self.coverage == 1) & self.required) < covered_once:
+                        self.swaps += 1
+                        return True
+                    # going back to the previous selection, which was feasible
+                    self.apply([route], [first])
+        return False
+
+    def run(self, timelimit: float) -> None:
+        """
+        Drop the redundant routes, then apply swaps followed by drops until no move applies or the time limit
+        :param timelimit: the time limit in seconds
+        """
+        deadline = time() + timelimit
+        self.drop_redundant()
+        while time() < deadline and (self.two_for_one(deadline) or self.one_for_one(deadline)):
+            self.drop_redundant()
+
+    def solution(self) -> dict:
+        return {route: 1.0 for route in sorted(self.selected)}
+
+
+def improve_solution(instance: PathSelectionProblem, solution: dict, timelimit: float) -> dict:
+    """
+    :param instance: the instance
+    :param solution: a solution as a dict {route: value}, a route being selected if its value is at least 0.5
+    :param timelimit: the time given to the local search, 0 to disable it
+    :return: the solution found by the local search, or the given one if it is not feasible or was not improved
+    """
+    if timelimit <= 0 or len(solution) == 0:
+        return solution
+    routes = selected_routes(solution)
+    if not is_feasible(instance, routes):
+        return solution
+    search = LocalSearch(instance, routes)
+    search.run(timelimit)
+    improved = search.solution()
+    # the hashed signatures are checked exactly before keeping the solution
+    if len(improved) < len(routes) and is_feasible(instance, np.array(list(improved.keys()), dtype=np.int64)):
+        return improved
+    return solution
+
+
+def is_feasible(instance: PathSelectionProblem, routes: np.ndarray) -> bool:
+    """
+    :return: True if the selection of routes covers every node and, if the goal is 1-id, distinguishes every pair
+    """
+    verification = instance.get_verifier().verify_routes(routes)
+    return verification.is_covered() and (instance.goal != "1id" or verification.is_one_id())
@@ -0,0 +1,88 @@
+import gurobipy as gp
+import numpy as np
+
+
+class ModelState:
+    """
+    Bookkeeping of the variables and constraints of a model without using their names:
+    the variables are stored with the index of their route, the constraints with the index of their row,
+    and their attributes are read in a single call per attribute.
+    """
+    model: gp.Model
+    routes: list[int]
+    variables: list[gp.Var]
+    row_indexes: list[int]
+    constraints: list[gp.Constr]
+
+    def __init__(self, model: gp.Model) -> None:
+        self.model = model
+        self.routes = []
+        self.variables = []
+        self.row_indexes = []
+        self.constraints = []
+
+    def add_variable(self, route: int, variable: gp.Var) -> None:
+        self.routes.append(route)
+        self.variables.append(variable)
+
+    def add_variables(self, variables: dict[int, gp.Var]) -> None:
+        """
+        :param variables: the variables indexed by their route, e.g. the tupledict returned by addVars
+        """
+        for route, variable in variables.items():
+            self.add_variable(route, variable)
+
+    def add_constraint(self, row_index: int, constraint: gp.Constr) -> None:
+        self.row_indexes.append(row_index)
+        self.constraints.append(constraint)
+
+    def remove_variables(self, positions: np.ndarray) -> None:
+        """
+        Remove some variables from the model and from the state
+        :param positions: the positions of the variables in the state
+        """
+        removed = set(positions.tolist())
+        self.model.remove([self.variables[position] for position in removed])
+        kept = [position for position in range(len(self.variables)) if position not in removed]
+        self.routes = [self.routes[position] for position in kept]
+        self.variables = [self.variables[position] for position in kept]
+
+    def has_solution(self) -> bool:
+        return self.model.SolCount > 0
+
+    def values(self) -> np.ndarray:
+        """
+        :return: the value of the variables, in the order of the routes
+        """
+        return np.array(self.model.getAttr("X", self.variables), dtype=np.float64)
+
+    def reduced_costs(self) -> np.ndarray:
+        """
+        :return: the reduced cost of the variables of the LP, in the order of the routes
+        """
+        return np.array(self.model.getAttr("RC", self.variables), dtype=np.float64)
+
+    def basis(self) -> np.ndarray:
+        """
+        :return: the basis status of the variables of the LP, in the order of the routes
+        """
+        return np.array(self.model.getAttr("VBasis", self.variables), dtype=np.int64)
+
+    def duals(self, row_space: int) -> np.ndarray:
+        """
+        :param row_space: the number of row indexes
+        :return: the dual value of each row index of the LP, null for the rows that are not in the model
+        """
+        duals = np.zeros(row_space)
+        duals[np.asarray(self.row_indexes, dtype=np.int64)] = self.model.getAttr("Pi", self.constraints)
+        return duals
+
+    def solution(self) -> dict[int, float]:
+        """
+        :return: the nonzero variables as a dict {route: value}, empty if the model has no solution
+        """
+        if not self.has_solution():
+            return {}
+        values = self.values()
+        nonzero = np.flatnonzero(values).tolist()
+        return {self.routes[index]: float(values[index]) for index in nonzero}
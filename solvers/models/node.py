@@ -9,6 +9,7 @@ from problems import PathSelectionProblem
 from itertools import combinations
 from structlinks.DataStructures import LinkedList
 import gurobipy as gp
+import numpy as np
 import logging
 
 MEM_LIMIT = 20
@@ -80,7 +81,7 @@ class Node:
 
         # cover constraints
         for node in range(self.instance.node_number):
-            constraint = [l for l in self.instance.symptoms[node] if l in self.used_routes]
+            constraint = [l for l in self.instance.get_symptom(node).tolist() if l in self.used_routes]
 
             self.model.addConstr(
                 gp.quicksum([route_vars[l] for l in constraint]) >= 1,
@@ -90,9 +91,9 @@ class Node:
         if self.instance.goal == '1id':
             for i in range(self.instance.node_number):
                 for j in range(i + 1, self.instance.node_number):
-                    full_constraint = (self.instance.symptoms[i]
-                                       .symmetric_difference(self.instance.symptoms[j]))
-                    constraint = [l for l in full_constraint if l in self.used_routes]
+                    full_constraint = np.setxor1d(self.instance.get_symptom(i), self.instance.get_symptom(j),
+                                                  assume_unique=True)
+                    constraint = [l for l in full_constraint.tolist() if l in self.used_routes]
 
                     self.model.addConstr(
                         gp.quicksum([route_vars[l] for l in constraint]) >= 1,
@@ -132,14 +133,14 @@ class Node:
             columns[route] = set()
 
         for node in range(self.instance.node_number):
-            temp_symptom = self.instance.symptoms[node].intersection(routes_to_add)
+            temp_symptom = set(self.instance.get_symptom(node).tolist()).intersection(routes_to_add)
             for route_index in temp_symptom:
                 columns[route_index].add(node)
 
             if self.instance.goal == '1id':
                 for node_b in range(node, self.instance.node_number):
                     for route_index in temp_symptom.symmetric_difference(
-                            self.instance.symptoms[node_b].intersection(routes_to_add)):
+                            set(self.instance.get_symptom(node_b).tolist()).intersection(routes_to_add)):
                         columns[route_index].add(
                             self.instance.node_number + hash_pair(node, node_b, self.instance.node_number))
 
@@ -177,7 +178,7 @@ class Node:
         null_cover_dual = 0.0
         for node in range(self.instance.node_number):
             if dual_values[node] != 0:
-                for route in self.instance.symptoms[node]:
+                for route in self.instance.get_symptom(node):
                     prices[route][1] += dual_values[node]
             else:
                 null_cover_dual += 1.0
@@ -192,8 +193,8 @@ class Node:
                 for node_b in range(node_a + 1, self.instance.node_number):
                     val = dual_values[self.instance.node_number + hash_pair(node_a, node_b, self.instance.node_number)]
                     if val != 0:
-                        for route_index in self.instance.symptoms[node_a].symmetric_difference(
-                                self.instance.symptoms[node_b]):
+                        for route_index in np.setxor1d(self.instance.get_symptom(node_a),
+                                                       self.instance.get_symptom(node_b), assume_unique=True):
                             prices[route_index][1] += val
                     else:
                         null_1id_dual += 1.0
@@ -0,0 +1,166 @@
+from problems import PathSelectionProblem
+from time import time
+import numpy as np
+
+
+class PartitionGreedy:
+    """
+    Greedy algorithm for the path selection problem, working on the loaded instance.
+    The nodes are partitioned into classes of nodes crossed by the same selected routes, a route then
+    distinguishes sum(|C & r| * |C - r|) new pairs of nodes over the classes C.
+    When a route is selected, only the gains of the routes crossing a split class change: they are updated by the
+    difference of their contributions before and after the split, so that a step costs the number of
+    (route, node) incidences of the split classes instead of a full re-evaluation.
+    Ties are broken randomly using the seed.
+    """
+    instance: PathSelectionProblem
+    labels: np.ndarray
+    class_sizes: np.ndarray
+    class_number: int
+    undistinguished_pairs: int
+    covered: np.ndarray
+    gains: np.ndarray
+    available: np.ndarray
+    selected_routes: list[int]
+
+    def __init__(self, instance: PathSelectionProblem, seed: int) -> None:
+        self.instance = instance
+        self.generator = np.random.default_rng(seed)
+        n = instance.node_number
+        self.class_sizes = np.zeros(n + 1, dtype=np.int64)
+        if instance.node_classes is None:
+            self.labels = np.zeros(n, dtype=np.int64)
+            self.class_sizes[0] = n
+            self.class_number = 1
+        else:
+            # the nodes of different classes of the instance are already distinguished
+            _, self.labels = np.unique(instance.node_classes, return_inverse=True)
+            self.labels = self.labels.astype(np.int64).ravel()
+            sizes = np.bincount(self.labels)
+            self.class_sizes[:len(sizes)] = sizes
+            self.class_number = len(sizes)
+        self.undistinguished_pairs = int(np.sum(self.class_sizes * (self.class_sizes - 1) // 2))
+        self.covered = np.zeros(n, dtype=bool) if instance.cover_mask is None else ~instance.cover_mask
+        self.available = np.ones(instance.route_number, dtype=bool)
+        self.selected_routes = []
+
+        lengths = instance.incidence.route_lengths()
+        if not instance.is_restricted():
+            if instance.goal == "1id":
+                self.gains = lengths * (n - lengths)
+            else:
+                self.gains = lengths.copy()
+        elif instance.goal == "1id":
+            nodes, owners = instance.incidence.expand_routes(np.arange(instance.route_number))
+            keys, inside = np.unique(owners * self.class_number + self.labels[nodes], return_counts=True)
+            sizes = self.class_sizes[keys % self.class_number]
+            self.gains = np.bincount(keys // self.class_number, weights=inside * (sizes - inside),
+                                     minlength=instance.route_number).astype(np.int64)
+        else:
+            nodes, owners = instance.incidence.expand_routes(np.arange(instance.route_number))
+            self.gains = np.bincount(owners[~self.covered[nodes]], minlength=instance.route_number).astype(np.int64)
+
+    def select(self, route: int) -> None:
+        """
+        Add the route to the solution, refine the partition of the nodes and update the gains of the routes
+        :param route: index of the route
+        """
+        nodes = self.instance.get_route(route)
+        self.selected_routes.append(int(route))
+        self.available[route] = False
+
+        newly_covered = nodes[~self.covered[nodes]]
+        self.covered[nodes] = True
+        if self.instance.goal != "1id":
+            routes, _ = self.instance.incidence.expand_symptoms(newly_covered)
+            self.gains -= np.bincount(routes, minlength=self.instance.route_number)
+            return
+
+        classes, inverse, counts = np.unique(self.labels[nodes], return_inverse=True, return_counts=True)
+        sizes = self.class_sizes[classes]
+        self.undistinguished_pairs -= int(np.dot(counts, sizes - counts))
+        split = counts < sizes
+        if not np.any(split):
+            return
+
+        self.update_gains(nodes, classes[split], counts[split])
+
+        # the nodes of the route in a class that is split form a new class
+        new_classes = np.full(len(classes), -1, dtype=np.int64)
+        new_classes[split] = np.arange(self.class_number, self.class_number + np.count_nonzero(split))
+        moved = split[inverse]
+        self.labels[nodes[moved]] = new_classes[inverse[moved]]
+        self.class_sizes[classes[split]] -= counts[split]
+        self.class_sizes[new_classes[split]] = counts[split]
+        self.class_number += int(np.count_nonzero(split))
+
+    def update_gains(self, nodes: np.ndarray, split_classes: np.ndarray, inside_sizes: np.ndarray) -> None:
+        """
+        Update the gains of the routes crossing the classes split by the selected route
+        :param nodes: the nodes of the selected route
+        :param split_classes: the classes that are split
+        :param inside_sizes: the number of nodes of the selected route in each split class
+        """
+        class_positions = np.full(self.class_number, -1, dtype=np.int64)
+        class_positions[split_classes] = np.arange(len(split_classes))
+        affected_nodes = np.flatnonzero(class_positions[self.labels] >= 0)
+        in_route = np.zeros(self.instance.node_number, dtype=bool)
+        in_route[nodes] = True
+
+        routes, owners = self.instance.incidence.expand_symptoms(affected_nodes)
+        owner_nodes = affected_nodes[owners]
+        positions = class_positions[self.labels[owner_nodes]]
+        # number of nodes of each route in each split class, inside and outside the selected route
+        keys, key_of_entry = np.unique(routes * len(split_classes) + positions, return_inverse=True)
+        inside = np.bincount(key_of_entry, weights=in_route[owner_nodes], minlength=len(keys))
+        both = np.bincount(key_of_entry, minlength=len(keys))
+        outside = both - inside
+
+        size_in = inside_sizes[keys % len(split_classes)]
+        size_out = self.class_sizes[split_classes][keys % len(split_classes)] - size_in
+        delta = (inside * (size_in - inside) + outside * (size_out - outside)
+                 - both * (size_in + size_out - both))
+        self.gains += np.bincount(keys // len(split_classes), weights=delta,
+                                  minlength=self.instance.route_number).astype(np.int64)
+
+    def solve(self, initial_routes=()) -> list[int]:
+        """
+        Run the greedy algorithm
+        :param initial_routes: routes that are part of the solution from the start
+        :return: the list of the selected routes
+        """
+        for route in initial_routes:
+            self.select(route)
+
+        while not self.is_finished():
+            candidate_gains = np.where(self.available, self.gains, -1)
+            best_gain = candidate_gains.max(initial=-1)
+            if best_gain <= 0:
+                # the remaining pairs cannot be distinguished
+                break
+            candidates = np.flatnonzero(candidate_gains == best_gain)
+            self.select(int(candidates[self.generator.integers(len(candidates))]))
+
+        # if some nodes are still uncovered, the first route crossing each of them is added
+        for node in np.flatnonzero(~self.covered).tolist():
+            symptom = self.instance.get_symptom(node)
+            if not self.covered[node] and len(symptom) > 0:
+                self.select(int(symptom[0]))
+
+        return self.selected_routes
+
+    def is_finished(self) -> bool:
+        if self.instance.goal == "1id":
+            return self.undistinguished_pairs == 0
+        return bool(np.all(self.covered))
+
+
+def get_partition_greedy_solution(instance: PathSelectionProblem, seed: int) -> (dict[int, float], float):
+    """
+    :param instance: the instance to solve
+    :param seed: the seed used to break ties
+    :return: a tuple (solution, time) where solution is a dict {route: 1.0} and time the solving time in seconds
+    """
+    start_time = time()
+    routes = PartitionGreedy(instance, seed).solve()
+    return {route: 1.0 for route in routes}, time() - start_time
@@ -0,0 +1,271 @@
+import math
+import multiprocessing
+import os
+import queue
+import signal
+from time import time
+from problems import PathSelectionProblem, IncumbentStream
+from problems.verification import selected_routes
+from models.psp_ilp import PSPIntegerLinearProgram
+from models.local_search import is_feasible
+from models.lagrangian import PSPLagrangianRelaxation
+from models.psp_column_generation import PSPColumnGeneration
+from models.branch_and_price import PSPBranchAndPrice
+
+# share of the time limit kept by the members to send their last solution and bound, the members still running at the
+# time limit being terminated
+RESERVED_TIME_SHARE = 0.1
+# seconds between two checks of the members by the main process when they send nothing
+POLL_INTERVAL = 0.1
+BOUND_TOLERANCE = 1e-6
+
+
+class SharedIncumbent(IncumbentStream):
+    """
+    Stream of a member of a portfolio: its improving solutions are sent to the main process, and the number of routes
+    of the best solution and the best lower bound are shared by all the members, so that a member can stop when it
+    cannot improve the best solution of the portfolio
+    """
+    label: str
+    incumbent: object
+    bound: object
+    messages: object
+
+    def __init__(self, label: str, incumbent, bound, messages) -> None:
+        """
+        :param label: the configuration of the member
+        :param incumbent: the shared number of routes of the best solution
+        :param bound: the shared best lower bound
+        :param messages: the queue of the messages sent to the main process
+        """
+        super().__init__(None, None)
+        self.label = label
+        self.incumbent = incumbent
+        self.bound = bound
+        self.messages = messages
+
+    def record(self, solution: dict, bound: float) -> None:
+        """
+        Send the solution to the main process if it uses fewer routes than the best solution of the portfolio
+        :param solution: a feasible solution as a dict {route: value}
+        :param bound: a lower bound on the number of routes of any solution
+        """
+        self.raise_bound(bound)
+        routes = selected_routes(solution)
+        with self.incumbent.get_lock():
+            if len(routes) >= self.incumbent.value:
+                return
+            self.incumbent.value = len(routes)
+        self.records += 1
+        self.messages.put(("solution", self.label, time(), (sorted(routes.tolist()), bound)))
+
+    def raise_bound(self, bound: float) -> None:
+        with self.bound.get_lock():
+            self.bound.value = max(self.bound.value, bound)
+
+    def should_stop(self, bound: float) -> bool:
+        """
+        :param bound: a lower bound on the solutions the member can still find, which may only hold for the member
+        :return: True if the member cannot improve the best solution of the portfolio, or if it is proven optimal
+        """
+        return max(bound, self.bound.value) > self.incumbent.value - 1 + BOUND_TOLERANCE
+
+    def finish(self, status: str, bound: float) -> None:
+        self.messages.put(("finished", self.label, time(), (status, bound)))
+
+
+def member_bound(solver) -> float:
+    """
+    :return: the lower bound on the number of routes of any solution proven by a solver at the end of its run
+    """
+    status = solver.get_status()
+    if isinstance(solver, PSPIntegerLinearProgram):
+        if status == "Optimality":
+            return round(solver.get_objective())
+        return max(0.0, solver.model.ObjBound) if solver.model.SolCount > 0 else 0.0
+    if isinstance(solver, PSPBranchAndPrice):
+        return solver.objective if status == "BP_optimal" else max(0.0, solver.best_bound)
+    if isinstance(solver, PSPColumnGeneration):
+        # the LP relaxation is a bound once the column generation is complete
+        bound = solver.known_bound()
+        if status == "Completed":
+            bound = max(bound, math.ceil(solver.lp_solution_cost - BOUND_TOLERANCE))
+        return bound
+    if isinstance(solver, PSPLagrangianRelaxation):
+        return max(0, solver.lower_bound)
+    return 0.0
+
+
+def run_member(label: str, factory: callable, instance: PathSelectionProblem, deadline: float,
+               stream: SharedIncumbent) -> None:
+    """
+    Run a member of the portfolio in its own process, which leads a process group so that the processes it starts are
+    terminated with it
+    :param label: the configuration of the member
+    :param factory: a function building the solver from the instance and the stream
+    :param instance: the instance
+    :param deadline: the time at which the solver stops
+    :param stream: the stream of the member
+    """
+    os.setpgrp()
+    try:
+        solver = factory(instance, stream)
+        solver.build_model()
+        solver.solve(max(0.0, deadline - time()))
+        solution = solver.get_solution()
+        # the solvers do not append their final solution to the stream when it was found before
+        if solution and is_feasible(instance, selected_routes(solution)):
+            stream.record(solution, member_bound(solver))
+        stream.finish(solver.get_status(), member_bound(solver))
+    except Exception as error:
+        stream.finish(f"Error: {type(error).__name__}: {error}", 0.0)
+
+
+def terminate(process: multiprocessing.Process) -> None:
+    """
+    Terminate a member and the processes it started, then wait for it
+    """
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            # the member did not lead its process group yet
+            process.terminate()
+    process.join()
+
+
+class PSPPortfolio:
+    """
+    Portfolio running several configurations of the solvers (solver, seed) concurrently on the instance, each one in
+    its own process. The members share the number of routes of the best solution and the best lower bound: the ILPs
+    stop when their bound proves they cannot improve the best solution, and every member is terminated as soon as the
+    best solution is proven optimal or at the time limit. The configuration that found the best solution first wins.
+    """
+    instance: PathSelectionProblem
+    members: list
+    stream: IncumbentStream
+    best_bound: float
+    winner: str
+    winner_time: float
+    member_statuses: dict[str, str]
+    gap: float
+    status: str
+    solving_time: float
+
+    def __init__(self, instance: PathSelectionProblem, members: list, stream: IncumbentStream = None):
+        """
+        :param instance: the instance
+        :param members: the members as (label, factory) tuples, where the factory builds the solver of the member from
+                        the instance and the stream of the member, and can be sent to another process
+        :param stream: the stream to which the improving solutions of the members are appended
+        """
+        self.instance = instance
+        self.members = members
+        self.stream = stream
+        self.objective = -1
+        self.solution = None
+        self.best_bound = 0.0
+        self.winner = None
+        self.winner_time = -1.0
+        self.member_statuses = {}
+        self.gap = -1.0
+        self.status = "Not solved"
+        self.solving_time = -1.0
+
+    def build_model(self):
+        # each member builds its model in its own process
+        pass
+
+    def solve(self, timelimit):
+        start_time = time()
+        deadline = start_time + timelimit
+        # the members are spawned since a forked Gurobi environment cannot be used
+        context = multiprocessing.get_context("spawn")
+        incumbent = context.Value('i', self.instance.route_number + 1)
+        bound = context.Value('d', 0.0)
+        messages = context.Queue()
+        member_deadline = deadline - RESERVED_TIME_SHARE * timelimit
+        processes = [context.Process(target=run_member,
+                                     args=(label, factory, self.instance, member_deadline,
+                                           SharedIncumbent(label, incumbent, bound, messages)))
+                     for label, factory in self.members]
+        for process in processes:
+            process.start()
+
+        try:
+            while len(self.member_statuses) < len(processes) and not self.is_proven() and time() < deadline:
+                try:
+                    self.handle_message(messages.get(timeout=min(POLL_INTERVAL, max(deadline - time(), 0.0))),
+                                        start_time)
+                except queue.Empty:
+                    self.check_crashes(processes)
+        finally:
+            for process in processes:
+                terminate(process)
+        # the messages sent before the members stopped
+        while True:
+            try:
+                self.handle_message(messages.get_nowait(), start_time)
+            except (queue.Empty, EOFError, OSError):
+                break
+
+        for label, _ in self.members:
+            self.member_statuses.setdefault(label, "Terminated")
+        self.solution = self.solution if self.solution is not None else {}
+        self.objective = len(self.solution)
+        proven_bound = math.ceil(self.best_bound - BOUND_TOLERANCE)
+        self.gap = (self.objective - proven_bound) / self.objective if self.objective > 0 else -1.0
+        self.status = "Portfolio_optimal" if self.is_proven() else "Portfolio"
+        self.solving_time = time() - start_time
+
+    def handle_message(self, message: tuple, start_time: float) -> None:
+        """
+        :param message: a (kind, label, time, content) tuple sent by a member, the content being (routes, bound) for
+                        a solution and (status, bound) when the member finishes
+        :param start_time: the time at which the portfolio started
+        """
+        kind, label, sent_time, content = message
+        self.best_bound = max(self.best_bound, content[1])
+        if kind == "finished":
+            self.member_statuses[label] = content[0]
+            return
+        routes = content[0]
+        if self.solution is not None and len(routes) >= len(self.solution):
+            return
+        # the solution of a member is checked before it is kept
+        if not is_feasible(self.instance, routes):
+            return
+        self.solution = {route: 1.0 for route in routes}
+        self.winner = label
+        self.winner_time = sent_time - start_time
+        if self.stream is not None:
+            self.stream.record(self.solution, self.best_bound)
+
+    def check_crashes(self, processes: list) -> None:
+        """
+        Mark the members whose process stopped with an error code without finishing
+        """
+        for (label, _), process in zip(self.members, processes):
+            if label not in self.member_statuses and process.exitcode not in (None, 0):
+                self.member_statuses[label] = f"Crashed ({process.exitcode})"
+
+    def is_proven(self) -> bool:
+        """
+        :return: True if the best solution is proven optimal by the best bound
+        """
+        return self.solution is not None and len(self.solution) <= math.ceil(self.best_bound - BOUND_TOLERANCE)
+
+    def get_objective(self):
+        return self.objective
+
+    def get_status(self):
+        return self.status
+
+    def get_solving_time(self):
+        return self.solving_time
+
+    def get_total_time(self):
+        return None
+
+    def get_solution(self):
+        return self.solution
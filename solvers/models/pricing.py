@@ -0,0 +1,175 @@
+from common import hash_pairs
+from problems import PathSelectionProblem, Incidence
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix
+
+# bound on the rounding errors of the vectorized prices
+PRICE_TOLERANCE = 1e-9
+EXACT_PRICES_BLOCK_SIZE = 1024
+
+
+class PricingEngine:
+    """
+    Vectorized computation of the prices of every route from the duals of the RMP.
+    The price of a route is the sum of the duals of the rows it belongs to, its reduced cost being 1 - price.
+    A route r belongs to the row of the pair (a, b) iff x_a + x_b - 2 * x_a * x_b = 1, where x_v = 1 iff v is in r,
+    so that the dual of the pair is added to the weights of both nodes, and twice the dual is removed from
+    the routes crossing both nodes, using a precomputed pair -> routes incidence.
+    """
+    instance: PathSelectionProblem
+    route_nodes: csr_matrix
+    pair_routes: csc_matrix
+    pair_first: np.ndarray
+    pair_second: np.ndarray
+
+    def __init__(self, instance: PathSelectionProblem) -> None:
+        self.instance = instance
+        incidence = instance.incidence
+        self.route_nodes = csr_matrix((np.ones(len(incidence.route_indices)), incidence.route_indices,
+                                       incidence.route_indptr),
+                                      shape=(instance.route_number, instance.node_number))
+        # the pairs are ordered as their hash_pair indexes
+        self.pair_first, self.pair_second = np.triu_indices(instance.node_number, k=1)
+        self.pair_routes = None
+        if instance.goal == "1id":
+            self.pair_routes = self.build_pair_routes()
+
+    def build_pair_routes(self) -> csc_matrix:
+        """
+        :return: the route x pair incidence matrix, where a route belongs to the pairs of nodes it crosses both,
+                 built by groups of routes of the same length
+        """
+        n = self.instance.node_number
+        incidence = self.instance.incidence
+        lengths = incidence.route_lengths()
+        routes, pairs = [], []
+        for length in np.unique(lengths[lengths > 1]).tolist():
+            same_length = np.flatnonzero(lengths == length)
+            nodes = incidence.route_indices[incidence.route_indptr[same_length][:, None] + np.arange(length)]
+            first, second = np.triu_indices(length, k=1)
+            pairs.append(hash_pairs(nodes[:, first], nodes[:, second], n).ravel())
+            routes.append(np.repeat(same_length, len(first)))
+        routes = np.concatenate(routes) if routes else np.empty(0, dtype=np.int64)
+        pairs = np.concatenate(pairs) if pairs else np.empty(0, dtype=np.int64)
+        return csc_matrix((np.ones(len(routes)), (routes, pairs)),
+                          shape=(self.instance.route_number, len(self.pair_first)))
+
+    def prices(self, dual_values: np.ndarray) -> np.ndarray:
+        """
+        :param dual_values: the duals of the cover rows (one per node), followed, if the goal is 1-id,
+                            by the duals of the pair rows indexed by hash_pair
+        :return: the price of each route, i.e. the sum of the duals of the cover and pair rows containing it
+        """
+        n = self.instance.node_number
+        node_weights = np.array(dual_values[:n], dtype=np.float64)
+        prices = np.zeros(self.instance.route_number)
+        if self.pair_routes is not None:
+            pair_duals = np.asarray(dual_values[n:n + len(self.pair_first)], dtype=np.float64)
+            nonzero = np.flatnonzero(pair_duals)
+            if len(nonzero) > 0:
+                node_weights += np.bincount(self.pair_first[nonzero], weights=pair_duals[nonzero], minlength=n)
+                node_weights += np.bincount(self.pair_second[nonzero], weights=pair_duals[nonzero], minlength=n)
+                prices -= 2 * (self.pair_routes[:, nonzero] @ pair_duals[nonzero])
+        prices += self.route_nodes @ node_weights
+        return prices
+
+    def exact_prices(self, dual_values: np.ndarray, routes: np.ndarray) -> np.ndarray:
+        """
+        Compute the prices of some routes by adding the duals one by one in the order of the rows
+        (the cover rows by node, then the pair rows by hash_pair index), so that routes having the same price
+        up to the rounding errors of the vectorized computation are ordered as when the prices are summed row by row.
+        The routes are handled by blocks, the missing terms being replaced by zeros, which leaves the sums unchanged.
+        :param dual_values: the duals of the rows
+        :param routes: the indexes of the routes
+        :return: the price of each given route
+        """
+        n = self.instance.node_number
+        incidence = self.instance.incidence
+        duals = np.asarray(dual_values, dtype=np.float64)
+        nonzero = np.empty(0, dtype=np.int64)
+        if self.pair_routes is not None:
+            nonzero = np.flatnonzero(duals[n:n + len(self.pair_first)])
+        lengths = incidence.route_lengths()
+
+        prices = np.zeros(len(routes))
+        for start in range(0, len(routes), EXACT_PRICES_BLOCK_SIZE):
+            block = np.asarray(routes[start:start + EXACT_PRICES_BLOCK_SIZE], dtype=np.int64)
+            block_lengths = lengths[block]
+            width = int(block_lengths.max(initial=0))
+            positions = incidence.route_indptr[block][:, None] + np.arange(width)
+            padding = np.arange(width) >= block_lengths[:, None]
+            nodes = incidence.route_indices[np.where(padding, 0, positions)]
+            terms = [np.where(padding, 0.0, duals[nodes])]
+            if len(nonzero) > 0:
+                in_route = np.zeros((len(block), n), dtype=bool)
+                in_route[np.repeat(np.arange(len(block)), block_lengths), nodes[~padding]] = True
+                distinguished = in_route[:, self.pair_first[nonzero]] ^ in_route[:, self.pair_second[nonzero]]
+                terms.append(np.where(distinguished, duals[n + nonzero], 0.0))
+            # accumulate is sequential along the rows, unlike sum
+            terms = np.concatenate([np.zeros((len(block), 1))] + terms, axis=1)
+            prices[start:start + len(block)] = np.add.accumulate(terms, axis=1)[:, -1]
+        return prices
+
+    def null_duals(self, dual_values: np.ndarray) -> (int, int):
+        """
+        :return: a tuple (null_cover_duals, null_1id_duals), the number of cover and pair rows having a null dual
+        """
+        n = self.instance.node_number
+        null_cover = n - np.count_nonzero(np.asarray(dual_values[:n]))
+        if self.pair_routes is None:
+            return null_cover, 0
+        return null_cover, len(self.pair_first) - np.count_nonzero(np.asarray(dual_values[n:n + len(self.pair_first)]))
+
+
+def best_routes(prices: np.ndarray, excluded: np.ndarray, columns_number: int, exact_prices=None,
+                tolerance: float = PRICE_TOLERANCE) -> np.ndarray:
+    """
+    Select the routes with the highest prices, among the routes with a negative reduced cost (price > 1),
+    with a partial selection instead of a full sort
+    :param prices: the price of each route, modified for the routes whose exact price is computed
+    :param excluded: a boolean mask of the routes that cannot be selected
+    :param columns_number: the maximal number of selected routes
+    :param exact_prices: if given, a function returning the exact prices of some routes, called for the routes
+                         whose price is too close to 1 or to the price of the last selected route to be compared
+    :param tolerance: the maximal rounding error on the prices
+    :return: the selected routes, by decreasing price then increasing index
+    """
+    candidates = np.flatnonzero((prices > 1 - tolerance) & ~excluded)
+    if exact_prices is not None:
+        close = candidates[prices[candidates] <= 1 + tolerance]
+        prices[close] = exact_prices(close)
+    candidates = candidates[prices[candidates] > 1]
+
+    if len(candidates) > columns_number:
+        position = len(candidates) - columns_number
+        threshold = np.partition(prices[candidates], position)[position]
+        if exact_prices is not None:
+            close = candidates[np.abs(prices[candidates] - threshold) <= tolerance]
+            prices[close] = exact_prices(close)
+            threshold = np.partition(prices[candidates], position)[position]
+        # only the routes priced at least as the columns_number-th price are sorted
+        candidates = candidates[prices[candidates] >= threshold]
+    order = np.lexsort((candidates, -prices[candidates]))
+    return candidates[order[:columns_number]]
+
+
+def diverse_routes(incidence: Incidence, routes: np.ndarray, columns_number: int, max_similarity: float) -> np.ndarray:
+    """
+    Filter the routes so that no two selected routes cross nearly the same nodes
+    :param incidence: the incidence of the instance
+    :param routes: the candidate routes, by decreasing priority
+    :param columns_number: the maximal number of selected routes
+    :param max_similarity: a route is skipped if the Jaccard similarity of its nodes with those of a route already
+                           selected is at least this value
+    :return: the selected routes, in the order of the candidates
+    """
+    selected, selected_nodes = [], []
+    for route in routes.tolist():
+        nodes = set(incidence.get_route(route).tolist())
+        if any(len(nodes & other) >= max_similarity * len(nodes | other) for other in selected_nodes):
+            continue
+        selected.append(route)
+        selected_nodes.append(nodes)
+        if len(selected) == columns_number:
+            break
+    return np.array(selected, dtype=np.int64)
@@ -1,7 +1,12 @@
+import math
 from time import time
-from problems import PathSelectionProblem
-from models import Node
+from problems import PathSelectionProblem, IncumbentStream
+from models import Node, ColumnGenerationSettings
 from models import get_greedy_psp_solution_routes
+from models import LagrangianRelaxation
+from models.lagrangian import BOUND_TOLERANCE
+from models import improve_solution
+from problems.verification import selected_routes
 
 
 class PSPColumnGeneration:
@@ -15,11 +20,32 @@ class PSPColumnGeneration:
     status: str
     seed: int
     column_nbr: int
+    pooled_column_nbr: int
     greedy_obj: int
+    greedy: str
+    pair_rows_removed: int
+    settings: ColumnGenerationSettings
+    mispricings: int
+    lagrangian_bound: float
+    lagrangian_time: float
+    lagrangian_lower_bound: int
+    local_search_time: float
+    local_search_removed: int
+    stream: IncumbentStream
 
     def __init__(self, instance: PathSelectionProblem,
-                 seed=784646):
+                 seed=784646, greedy="native", settings: ColumnGenerationSettings = None, lagrangian_time=0.0,
+                 local_search_time=0.0, stream: IncumbentStream = None):
+        """
+        :param lagrangian_time: the time given to the Lagrangian relaxation before the column generation, whose
+                                multipliers are the initial duals of the root, 0 to disable it
+        :param local_search_time: the time given to the local search shrinking the greedy solution and the final one,
+                                  0 to disable it
+        :param stream: the stream to which the greedy solution and each better solution are appended
+        """
         self.instance = instance
+        self.greedy = greedy
+        self.settings = settings if settings is not None else ColumnGenerationSettings()
         self.objective = -1
         self.solution = None
         self.solving_time = -1.0
@@ -27,6 +53,7 @@ class PSPColumnGeneration:
         self.cg_time = -1.0
         self.conversion_time = -1.0
         self.column_nbr = -1
+        self.pooled_column_nbr = 0
         self.greedy_obj = -1
         self.seed = seed
         self.int_lp_solution_cost = -1
@@ -34,21 +61,37 @@ class PSPColumnGeneration:
         self.iterations = -1
         self.avg_null_1id_dual = -1.0
         self.avg_null_cover_dual = -1.0
+        self.pair_rows_removed = 0
+        self.mispricings = 0
+        self.lagrangian_bound = -1.0
+        self.lagrangian_time = lagrangian_time
+        self.lagrangian_lower_bound = -1
+        self.local_search_time = local_search_time
+        self.local_search_removed = 0
+        self.stream = stream
 
     def solve(self, timelimit):
-        self.solution, self.greedy_time = get_greedy_psp_solution_routes(self.instance, self.seed)
+        self.solution, self.greedy_time = get_greedy_psp_solution_routes(self.instance, self.seed, self.greedy)
         self.greedy_obj = len(self.solution)
-        self.objective = len(self.solution)
         self.status = "Greedy"
         start_time = time()
+        self.solution = self.improve(self.solution)
+        self.objective = len(self.solution)
+        initial_duals = self.lagrangian_warm_start(timelimit - self.greedy_time)
+        self.record()
 
-        node = Node(self.instance, set(self.solution.keys()), timelimit, "root", self.seed)
+        node = Node(self.instance, set(self.solution.keys()), timelimit - (time() - start_time), "root", self.seed,
+                    settings=self.settings, initial_duals=initial_duals)
         node.init_rmp()
         node.solve()
         self.cg_time = time() - start_time
+        # the active columns are in the RMP, the pooled ones were removed by the aging
         self.column_nbr = len(node.used_routes)
+        self.pooled_column_nbr = len(node.column_pool.pooled)
         self.avg_null_1id_dual = node.avg_null_1id_dual
         self.avg_null_cover_dual = node.avg_null_cover_dual
+        if self.instance.pair_rows is not None:
+            self.pair_rows_removed = self.instance.pair_rows.removed()
 
         if not node.finished:
             self.status = "CG_unfinished"
@@ -58,20 +101,67 @@ class PSPColumnGeneration:
         self.lp_solution_cost = node.objective_value
         self.int_lp_solution_cost = sum(node.solution.values())
         self.iterations = node.iterations
+        self.mispricings = node.mispricings
+        self.lagrangian_bound = node.lagrangian_bound
 
         if time() - start_time > timelimit:
             self.solving_time = time() - start_time + self.greedy_time
             return
 
-        node.solve_ilp()
+        # the routes of the current solution are initial columns of the RMP
+        node.solve_ilp(self.solution, self.stream, self.known_bound())
         if node.finished:
             self.status = "Completed"
 
         self.conversion_time = time() - start_time - self.cg_time
 
-        self.solving_time = time() - start_time + self.greedy_time
         self.objective = node.objective_value
-        self.solution = node.solution
+        self.solution = self.improve(node.solution)
+        if self.solution is not node.solution:
+            self.objective = len(self.solution)
+        self.record()
+        self.solving_time = time() - start_time + self.greedy_time
+
+    def improve(self, solution: dict) -> dict:
+        """
+        :param solution: a solution as a dict {route: value}
+        :return: the solution shrunk by the local search, the given one if it was not improved or the search is disabled
+        """
+        improved = improve_solution(self.instance, solution, self.local_search_time)
+        if improved is not solution:
+            self.local_search_removed += len(selected_routes(solution)) - len(improved)
+        return improved
+
+    def known_bound(self) -> int:
+        """
+        :return: the best lower bound on the number of routes known so far, given by the Lagrangian bounds
+        """
+        bound = max(0, self.lagrangian_lower_bound)
+        if math.isfinite(self.lagrangian_bound):
+            bound = max(bound, math.ceil(self.lagrangian_bound - BOUND_TOLERANCE))
+        return bound
+
+    def record(self) -> None:
+        """
+        Append the current solution to the stream if it is better than the recorded ones
+        """
+        if self.stream is not None:
+            self.stream.record(self.solution, self.known_bound())
+
+    def lagrangian_warm_start(self, timelimit):
+        """
+        Run the Lagrangian relaxation from the current solution, which is replaced by the Lagrangian one if better
+        :param timelimit: the remaining time, the relaxation taking at most lagrangian_time of it
+        :return: the multipliers of the best Lagrangian bound, None if the warm start is disabled
+        """
+        if self.lagrangian_time <= 0:
+            return None
+        relaxation = LagrangianRelaxation(self.instance, self.seed)
+        relaxation.solve(min(self.lagrangian_time, timelimit), self.solution)
+        self.solution = relaxation.solution
+        self.objective = len(self.solution)
+        self.lagrangian_lower_bound = relaxation.lower_bound()
+        return relaxation.best_multipliers
 
     def build_model(self):
         pass
@@ -93,3 +183,6 @@ class PSPColumnGeneration:
 
     def get_column_number(self):
         return self.column_nbr
+
+    def get_pooled_column_number(self):
+        return self.pooled_column_nbr
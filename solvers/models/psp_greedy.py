@@ -1,24 +1,177 @@
-from problems import PathSelectionProblem
+from time import time
+from problems import PathSelectionProblem, IncumbentStream
+from models.partition_greedy import get_partition_greedy_solution
+from models.local_search import improve_solution
+import numpy as np
+import atexit
 import subprocess
 import os
 
+GREEDY_ENGINES = ("native", "java")
+GREEDY_JAR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                          "Greedy/target/PathSelection-1.0.jar")
+GREEDY_MAX_HEAP = "20g"
 
-def get_greedy_psp_solution_routes(instance: PathSelectionProblem, seed: int):
-    solution_endpoints, greedy_time = get_greedy_psp_solution_endpoints(instance.source_file, instance.goal, seed)
-    solution = {}
-    for pair in solution_endpoints:
-        for index, (src, dest) in enumerate(instance.endpoints):
-            if int(pair[0]) == src and int(pair[1]) == dest:
-                solution[index] = 1.0
+
+class GreedyServer:
+    """
+    Client of the Java greedy started in server mode (--server): a single JVM is kept alive and reused for every
+    call, it keeps the parsed instances in memory and answers with the indexes of the chosen routes.
+    """
+    process: subprocess.Popen
+    threads: int
+
+    def __init__(self, threads: int = 1) -> None:
+        self.process = None
+        self.threads = threads
+
+    def start(self) -> None:
+        self.process = subprocess.Popen(
+            ["java", f"-Xmx{GREEDY_MAX_HEAP}", "-jar", GREEDY_JAR, "--server", "--threads", str(self.threads)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+    def solve(self, route_file: str, seed: int) -> (list[int], float):
+        """
+        :param route_file: the path to the instance file
+        :param seed: the seed used to break ties
+        :return: a tuple (routes, time) with the indexes of the chosen routes and the greedy time in seconds
+        """
+        answer = self.request(f"SOLVE {seed} {os.path.abspath(route_file)}")
+        if not answer.startswith("OK "):
+            raise RuntimeError(f"greedy server error on {route_file}: {answer}")
+        tokens = answer.split()
+        return [int(route) for route in tokens[3:]], float(tokens[1])
+
+    def request(self, line: str) -> str:
+        # the server is (re)started if it is not running
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+        answer = self.process.stdout.readline()
+        if answer == "":
+            raise RuntimeError("greedy server stopped unexpectedly")
+        return answer.strip()
+
+    def close(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.write("QUIT\n")
+            self.process.stdin.close()
+            self.process.wait()
+        self.process = None
+
+
+_greedy_server = None
+
+
+def get_greedy_server() -> GreedyServer:
+    """
+    :return: the greedy server shared by all the calls of the current process
+    """
+    global _greedy_server
+    if _greedy_server is None:
+        _greedy_server = GreedyServer()
+        atexit.register(_greedy_server.close)
+    return _greedy_server
+
+
+def get_greedy_psp_solution_routes(instance: PathSelectionProblem, seed: int, engine: str = "native"):
+    """
+    Compute a greedy solution of the instance
+    :param instance: the instance to solve
+    :param seed: the seed used to break ties
+    :param engine: "native" to run the greedy in-process on the loaded instance,
+                   "java" to run the Java implementation of the Greedy/ directory, through the shared greedy server;
+                   the native greedy is used on the restricted instances, the Java greedy only reading instance files
+    :return: a tuple (solution, time) where solution is a dict {route: 1.0} and time the greedy time in seconds
+    """
+    if engine == "native" or (engine == "java" and instance.is_restricted()):
+        return get_partition_greedy_solution(instance, seed)
+    if engine != "java":
+        raise ValueError(f"unknown greedy engine {engine}")
+
+    routes, greedy_time = get_greedy_server().solve(instance.source_file, seed)
+    return {route: 1.0 for route in routes}, greedy_time
+
+
+class PSPGreedy:
+    """
+    Solver running the greedy with new seeds while a run ends before the time limit, the first run using the given
+    seed; each solution is shrunk by the local search and the best one is kept
+    """
+    instance: PathSelectionProblem
+    seed: int
+    greedy: str
+    local_search_time: float
+    runs: int
+    best_seed: int
+    status: str
+    solving_time: float
+    stream: IncumbentStream
+
+    def __init__(self, instance: PathSelectionProblem, seed=784646, greedy="native", local_search_time=0.0,
+                 stream: IncumbentStream = None):
+        """
+        :param local_search_time: the time given to the local search on each greedy solution
+        :param stream: the stream to which the improving solutions are appended
+        """
+        self.instance = instance
+        self.seed = seed
+        self.greedy = greedy
+        self.local_search_time = local_search_time
+        self.objective = -1
+        self.solution = None
+        self.runs = 0
+        self.best_seed = -1
+        self.status = "Not solved"
+        self.solving_time = -1.0
+        self.stream = stream
+
+    def build_model(self):
+        pass
+
+    def solve(self, timelimit):
+        start_time = time()
+        generator = np.random.default_rng(self.seed)
+        seed = self.seed
+        while True:
+            solution, _ = get_greedy_psp_solution_routes(self.instance, seed, self.greedy)
+            solution = improve_solution(self.instance, solution, self.local_search_time)
+            self.runs += 1
+            if self.solution is None or len(solution) < len(self.solution):
+                self.solution = solution
+                self.best_seed = seed
+                if self.stream is not None:
+                    self.stream.record(solution, 0)
+            # a new run is only started when a run of the mean duration ends before the time limit
+            elapsed = time() - start_time
+            if elapsed * (self.runs + 1) / self.runs >= timelimit or (
+                    self.stream is not None and self.stream.should_stop(0)):
                 break
+            seed = int(generator.integers(np.iinfo(np.int32).max))
+        self.objective = len(self.solution)
+        self.status = "Greedy"
+        self.solving_time = time() - start_time
+
+    def get_objective(self):
+        return self.objective
+
+    def get_status(self):
+        return self.status
+
+    def get_solving_time(self):
+        return self.solving_time
+
+    def get_total_time(self):
+        return None
 
-    return solution, greedy_time
+    def get_solution(self):
+        return self.solution
 
 
 def get_greedy_psp_solution_endpoints(route_file, goal, seed: int):
-    greedy_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "Greedy/target/PathSelection-1.0.jar")
     output = subprocess.getoutput(
-        f"java -Xmx20g -jar {greedy_path} --routes {route_file} "
+        f"java -Xmx{GREEDY_MAX_HEAP} -jar {GREEDY_JAR} --routes {route_file} "
         f"--print-solution --seed {seed}") #65543
     # print(output)
     lines = output.split("\n")
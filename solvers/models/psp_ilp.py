@@ -1,72 +1,211 @@
-from problems import PathSelectionProblem
+from problems import PathSelectionProblem, IncumbentStream
+from problems.verification import selected_routes
+from models.model_state import ModelState
+from models.local_search import improve_solution
+from models.psp_greedy import get_greedy_psp_solution_routes
 from gurobipy import GRB
 import gurobipy as gp
+import numpy as np
+from scipy.sparse import vstack
+from time import time
 import logging
 
 MEM_LIMIT = 50
 DEFAULT_TIMEOUT = 1800
 RANDOM_SEED = 1863947
 
-STATUS_CODE = {2: "Optimality", 3: "Infeasible", 9: "Timeout", 17:"MEM_LIMIT"}
+STATUS_CODE = {2: "Optimality", 3: "Infeasible", 9: "Timeout", 11: "Interrupted", 17:"MEM_LIMIT"}
+PAIR_ROWS_MODES = ("all", "lazy")
 
 
 class PSPIntegerLinearProgram:
     instance: PathSelectionProblem
     env: gp.Env
     model: gp.Model
+    state: ModelState
     solution: dict[int, float]
     status: str
     solving_time: float
+    build_time: float
     total_time: float
     objective_value: float
     mip_gap: float
-
-    def __init__(self, instance: PathSelectionProblem, seed: int):
+    pair_rows_mode: str
+    pair_rows: int
+    pair_rows_removed: int
+    local_search_time: float
+    local_search_removed: int
+    greedy: str
+    greedy_time: float
+    start_objective: int
+    stream: IncumbentStream
+
+    def __init__(self, instance: PathSelectionProblem, seed: int, pair_rows_mode: str = "all",
+                 local_search_time: float = 0.0, greedy: str = None, stream: IncumbentStream = None):
+        """
+        :param instance: the instance to solve
+        :param seed: the seed given to the solver
+        :param pair_rows_mode: "all" to build up front the 1-id constraints that are not implied by other rows,
+                               "lazy" to start from the hardest pairs and add the violated pairs at each incumbent
+        :param local_search_time: the time given to the local search shrinking the solution when it is not proven
+                                  optimal and the MIP start, 0 to disable it
+        :param greedy: the greedy whose solution is given to the solver as MIP start, "native" or "java", the MIP
+                       starts cold if None
+        :param stream: the stream to which the MIP start and each incumbent found by the solver are appended
+        """
         self.logger = logging.getLogger('ILP')
         self.logger.setLevel(logging.INFO)
 
         self.instance = instance
+        self.seed = seed
         self.env = gp.Env(empty=True)
         self.env.setParam('OutputFlag', 0)
         self.env.start()
         self.model = gp.Model("ILP Model", env=self.env)
+        self.state = ModelState(self.model)
         self.model.setParam('TimeLimit', DEFAULT_TIMEOUT)
         self.model.setParam('SoftMemLimit', MEM_LIMIT)
         self.model.setParam('Seed', seed)
         self.model.setParam(GRB.Param.Threads, 1)
 
+        self.pair_rows_mode = pair_rows_mode
+        self.pair_rows = 0
+        self.pair_rows_removed = 0
+        self.generated_pairs = set()
+        self.y = None
+        self.local_search_time = local_search_time
+        self.local_search_removed = 0
+        self.greedy = greedy
+        self.greedy_time = 0.0
+        self.start_objective = -1
+        self.stream = stream
+
         self.solution = {}
         self.objective_value = instance.route_number
         self.status = "Not run"
         self.solving_time = -1.0
+        self.build_time = 0.0
         self.total_time = -1.0
 
     def build_model(self):
+        start_time = time()
 
         # y[i] == 1 iff route i is a measurement path, 0 otherwise
-        y = self.model.addVars([i for i in self.instance.get_routes_set()],
-                               name="Y",
-                               vtype=GRB.BINARY)
+        y = self.model.addMVar(self.instance.route_number, name="Y", vtype=GRB.BINARY)
+        self.y = y.tolist()
+        self.state.add_variables(dict(enumerate(self.y)))
 
         # objective : minimize the number of measurement paths
-        self.model.setObjective(gp.quicksum(y), GRB.MINIMIZE)
-
-        # each node must be crossed by at least one measurement path
-        for node in self.instance.get_node_set():
-            self.model.addConstr(gp.quicksum([y[l] for l in self.instance.get_symptom(node)]) >= 1, name=str(node))
-
-        if self.instance.goal == "1id":
-
-            for i in set(range(self.instance.node_number)):
-                for j in set(range(i + 1, self.instance.node_number)):
-                    self.model.addConstr(
-                        gp.quicksum(
-                            [y[l] for l in self.instance.get_symptom(i).symmetric_difference(self.instance.get_symptom(j))])
-                        >= 1)
+        self.model.setObjective(y.sum(), GRB.MINIMIZE)
+
+        # each node must be crossed by at least one measurement path,
+        # and each pair of nodes must be distinguished by a measurement path if the goal is 1-id
+        # the whole constraint matrix is assembled once and loaded in a single call
+        pairs = np.empty((0, 2), dtype=np.int64)
+        if self.instance.goal == "1id" and self.pair_rows_mode == "all":
+            # the rows implied by other rows are removed by the presolve
+            pair_rows = self.instance.get_pair_rows()
+            pairs = pair_rows.pairs
+            self.pair_rows = len(pair_rows)
+            self.pair_rows_removed = pair_rows.removed()
+
+        elif self.instance.goal == "1id":
+            # the pairs that are distinguished by the fewest routes are added up front,
+            # the other ones are added when an incumbent violates them
+            self.generated_pairs = self.hardest_pairs()
+            pairs = np.array(sorted(self.generated_pairs), dtype=np.int64).reshape(-1, 2)
+            self.pair_rows = len(self.generated_pairs)
+            self.model.setParam(GRB.Param.LazyConstraints, 1)
+
+        cover_rows = self.instance.incidence.node_matrix()[self.instance.cover_nodes()]
+        matrix = vstack((cover_rows, self.instance.incidence.pair_matrix(pairs)), format="csr")
+        self.model.addMConstr(matrix, y, GRB.GREATER_EQUAL, np.ones(matrix.shape[0]))
+        self.model.update()
+        self.build_time = time() - start_time
+
+    def pair_expression(self, i: int, j: int) -> gp.LinExpr:
+        """
+        :return: the sum of the variables of the routes distinguishing the nodes i and j
+        """
+        return gp.quicksum([self.y[l] for l in np.setxor1d(self.instance.get_symptom(i), self.instance.get_symptom(j),
+                                                           assume_unique=True).tolist()])
+
+    def hardest_pairs(self) -> set[(int, int)]:
+        """
+        :return: for each node, the pair it forms with the node it shares the most routes with,
+                 i.e. the pair with the smallest number of distinguishing routes
+        """
+        cooccurrences = self.instance.incidence.cooccurrences()
+        degrees = np.diag(cooccurrences)
+        distinguishing_routes = degrees[:, None] + degrees[None, :] - 2 * cooccurrences
+        np.fill_diagonal(distinguishing_routes, np.iinfo(distinguishing_routes.dtype).max)
+        classes = self.instance.node_classes
+        if classes is not None:
+            # only the nodes of a same class have to be distinguished
+            distinguishing_routes[classes[:, None] != classes[None, :]] = np.iinfo(distinguishing_routes.dtype).max
+        closest = np.argmin(distinguishing_routes, axis=1)
+        return {(min(i, j), max(i, j)) for i, j in enumerate(closest.tolist())
+                if i != j and (classes is None or classes[i] == classes[j])}
+
+    def add_violated_pairs(self, model: gp.Model, routes: np.ndarray) -> bool:
+        """
+        Lazy constraints: the fast verifier finds the pairs of nodes that the incumbent does not distinguish,
+        then consecutive pairs of each undistinguished class are added as lazy constraints
+        :param routes: the routes selected by the incumbent
+        :return: True if the incumbent distinguishes every pair
+        """
+        verification = self.instance.get_verifier().verify_routes(routes)
+        for nodes in verification.undistinguished_classes:
+            for i, j in zip(nodes[:-1].tolist(), nodes[1:].tolist()):
+                model.cbLazy(self.pair_expression(i, j) >= 1)
+                if (i, j) not in self.generated_pairs:
+                    self.generated_pairs.add((i, j))
+                    self.pair_rows += 1
+        return verification.is_one_id()
+
+    def callback(self, model: gp.Model, where: int) -> None:
+        """
+        At each incumbent, add the violated pairs if they are lazy, then append the incumbent to the stream;
+        stop when the stream knows a solution that the bound of the tree proves this model cannot improve
+        """
+        if where == GRB.Callback.MIP and self.stream is not None:
+            if self.stream.should_stop(model.cbGet(GRB.Callback.MIP_OBJBND)):
+                model.terminate()
+            return
+        if where != GRB.Callback.MIPSOL:
+            return
+        routes = np.flatnonzero(np.array(model.cbGetSolution(self.y)) > 0.5)
+        feasible = True
+        if self.instance.goal == "1id" and self.pair_rows_mode == "lazy":
+            feasible = self.add_violated_pairs(model, routes)
+        if feasible and self.stream is not None:
+            # the bound is -infinity until the root relaxation is solved
+            bound = max(0.0, model.cbGet(GRB.Callback.MIPSOL_OBJBND))
+            self.stream.record({route: 1.0 for route in routes.tolist()}, bound)
+
+    def set_start(self, solution: dict) -> None:
+        """
+        Give a feasible solution to the solver as MIP start
+        :param solution: the solution as a dict {route: value}
+        """
+        start = np.zeros(self.instance.route_number)
+        start[selected_routes(solution)] = 1.0
+        self.model.setAttr(GRB.Attr.Start, self.y, start.tolist())
+        self.start_objective = int(start.sum())
+        if self.stream is not None:
+            self.stream.record(solution, 0)
 
     def solve(self, time_limit: float):
-        self.model.setParam('TimeLimit', time_limit)
-        self.model.optimize()
+        if self.greedy is not None:
+            start, self.greedy_time = get_greedy_psp_solution_routes(self.instance, self.seed, self.greedy)
+            start_time = time()
+            self.set_start(improve_solution(self.instance, start, self.local_search_time))
+            time_limit -= self.greedy_time + time() - start_time
+        self.model.setParam('TimeLimit', max(time_limit, 0.0))
+        if (self.instance.goal == "1id" and self.pair_rows_mode == "lazy") or self.stream is not None:
+            self.model.optimize(self.callback)
+        else:
+            self.model.optimize()
 
         if self.model.status == 3:
             print(self.get_status())
@@ -81,14 +220,15 @@ class PSPIntegerLinearProgram:
             self.mip_gap = self.model.MIPGap
         except AttributeError:
             self.mip_gap = -1
-        self.solution = {}
-
-        for index in range(self.instance.route_number):
-            try:
-                if self.model.getVarByName(f"Y[{index}]").getAttr("X") > 0:
-                    self.solution[index] = self.model.getVarByName(f"Y[{index}]").getAttr("X")
-            except AttributeError:
-                pass
+        self.solution = {route: value for route, value in self.state.solution().items() if value > 0}
+        if self.model.status != GRB.OPTIMAL and self.model.SolCount > 0:
+            improved = improve_solution(self.instance, self.solution, self.local_search_time)
+            if improved is not self.solution:
+                self.local_search_removed = len(self.solution) - len(improved)
+                self.solution = improved
+                self.objective_value = len(improved)
+                if self.stream is not None:
+                    self.stream.record(improved, self.model.ObjBound)
 
         self.logger.debug(self.solution)
         self.logger.debug(self.objective_value)
@@ -100,10 +240,14 @@ class PSPIntegerLinearProgram:
         return STATUS_CODE[self.model.status]
 
     def get_solving_time(self):
-        return self.model.getAttr("Runtime")
+        # the greedy giving the MIP start is part of the solving time
+        return self.model.getAttr("Runtime") + self.greedy_time
+
+    def get_build_time(self):
+        return self.build_time
 
     def get_total_time(self):
-        return None
+        return self.build_time + self.get_solving_time()
 
     def get_solution(self):
         return self.solution
@@ -0,0 +1,93 @@
+from time import time
+from problems import InstanceReduction, IncumbentStream
+from problems.verification import selected_routes
+from models.partition_greedy import get_partition_greedy_solution
+from models.local_search import is_feasible
+
+
+class ReducedSolver:
+    """
+    Solver of a reduced instance: the components of the reduction are solved one after the other by their own solver,
+    the smallest components first, each one getting an equal share of the remaining time. The solutions of the
+    components are mapped back to the routes of the instance and completed with the forced routes.
+    The components share no route and each one has a row left, so that the number of forced routes plus the number of
+    components is a lower bound.
+    """
+    reduction: InstanceReduction
+    solver_factory: callable
+    seed: int
+    solvers: list
+    statuses: list[str]
+    fallbacks: int
+    status: str
+    solving_time: float
+    stream: IncumbentStream
+
+    def __init__(self, reduction: InstanceReduction, solver_factory: callable, seed: int = 784646,
+                 stream: IncumbentStream = None) -> None:
+        """
+        :param reduction: the reduction of the instance
+        :param solver_factory: a function building the solver of a component from its sub-instance
+        :param seed: the seed of the greedy replacing the solution of a component when it is not feasible
+        :param stream: the stream to which the solution of the instance is appended
+        """
+        self.reduction = reduction
+        self.solver_factory = solver_factory
+        self.seed = seed
+        self.solvers = []
+        self.statuses = []
+        self.fallbacks = 0
+        self.objective = -1
+        self.solution = None
+        self.status = "Not solved"
+        self.solving_time = -1.0
+        self.stream = stream
+
+    def build_model(self):
+        # the models of the components are built when they are solved, within the time limit
+        pass
+
+    def solve(self, timelimit):
+        start_time = time()
+        components = self.reduction.components
+        order = sorted(range(len(components)),
+                       key=lambda index: (components[index].route_number, components[index].node_number))
+        solutions = [{} for _ in components]
+        for position, index in enumerate(order):
+            component = components[index]
+            remaining = max(0.0, timelimit - (time() - start_time))
+            solver = self.solver_factory(component)
+            solver.build_model()
+            solver.solve(remaining / (len(order) - position))
+            solution = solver.get_solution()
+            if not solution or not is_feasible(component, selected_routes(solution)):
+                solution, _ = get_partition_greedy_solution(component, self.seed)
+                self.fallbacks += 1
+            solutions[index] = solution
+            self.solvers.append(solver)
+            self.statuses.append(solver.get_status())
+
+        self.solution = self.reduction.map_solution(solutions)
+        self.objective = len(self.solution)
+        self.status = "/".join(sorted(set(self.statuses))) if self.statuses else "Reduced"
+        self.solving_time = time() - start_time
+        if self.stream is not None:
+            self.stream.record(self.solution, self.lower_bound())
+
+    def lower_bound(self) -> int:
+        return len(self.reduction.forced_routes) + len(self.reduction.components)
+
+    def get_objective(self):
+        return self.objective
+
+    def get_status(self):
+        return self.status
+
+    def get_solving_time(self):
+        return self.solving_time
+
+    def get_total_time(self):
+        return None
+
+    def get_solution(self):
+        return self.solution
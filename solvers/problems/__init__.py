@@ -1 +1,8 @@
-from .path_selection_problem import PathSelectionProblem
\ No newline at end of file
+from .incidence import Incidence
+from .verification import SolutionVerifier, Verification
+from .presolve import PairRows, presolve_pair_rows
+from .analysis import InstanceAnalysis, find_duplicate_routes
+from .path_selection_problem import PathSelectionProblem
+from .incumbent_stream import IncumbentStream
+from .reduction import InstanceReduction
+from .result_cache import ResultCache, CachedResult, result_key
@@ -0,0 +1,94 @@
+from problems.incidence import Incidence
+from problems.verification import SolutionVerifier
+import numpy as np
+
+ANALYSIS_SEED = 3318725
+
+
+class InstanceAnalysis:
+    """
+    Structural analysis of an instance, independent of any model:
+    - the classes of nodes having identical symptoms, no selection of routes can distinguish them,
+    - the nodes crossed by no route, no selection of routes can cover them,
+    - the groups of routes crossing exactly the same nodes, only one route of each group is useful.
+    """
+    node_number: int
+    identical_classes: list[np.ndarray]
+    uncoverable_nodes: np.ndarray
+    duplicate_routes: list[np.ndarray]
+
+    def __init__(self, incidence: Incidence, seed: int = ANALYSIS_SEED) -> None:
+        """
+        Run the analysis in O(number of (node, route) incidences), up to the sorts of the hashes
+        :param incidence: the incidence of the instance
+        :param seed: the seed of the random keys used to hash the symptoms and the routes
+        """
+        self.node_number = incidence.node_number
+
+        # the symptoms are the signatures of the nodes when every route is selected
+        verification = SolutionVerifier(incidence, seed).verify_routes(np.arange(incidence.route_number))
+        self.uncoverable_nodes = verification.uncovered_nodes
+        self.identical_classes = [nodes for nodes in verification.undistinguished_classes
+                                  if len(incidence.get_symptom(int(nodes[0]))) > 0]
+        self.duplicate_routes = find_duplicate_routes(incidence, seed)
+
+    def is_feasible(self, goal: str) -> bool:
+        """
+        :param goal: the goal of the instance, "cover" or "1id"
+        :return: whether some selection of routes reaches the goal
+        """
+        if goal == "1id":
+            return len(self.uncoverable_nodes) == 0 and len(self.identical_classes) == 0
+        return len(self.uncoverable_nodes) == 0
+
+    def node_labels(self) -> (np.ndarray, int):
+        """
+        :return: a tuple (labels, class_number) giving the node of the quotient instance of each node:
+                 the nodes of an identical class share the same label, and the uncoverable nodes are labelled -1
+        """
+        labels = np.arange(self.node_number, dtype=np.int64)
+        for nodes in self.identical_classes:
+            labels[nodes] = nodes[0]
+        labels[self.uncoverable_nodes] = -1
+        representatives = np.flatnonzero(labels == np.arange(self.node_number))
+        new_labels = np.full(self.node_number, -1, dtype=np.int64)
+        new_labels[representatives] = np.arange(len(representatives))
+        labels[labels >= 0] = new_labels[labels[labels >= 0]]
+        return labels, len(representatives)
+
+    def __str__(self) -> str:
+        merged = sum(len(nodes) - 1 for nodes in self.identical_classes)
+        redundant = sum(len(routes) - 1 for routes in self.duplicate_routes)
+        return (f"{len(self.identical_classes)} classes of nodes with identical symptoms ({merged} merged nodes), "
+                f"{len(self.uncoverable_nodes)} nodes crossed by no route, "
+                f"{len(self.duplicate_routes)} groups of identical routes ({redundant} redundant routes)")
+
+
+def find_duplicate_routes(incidence: Incidence, seed: int = ANALYSIS_SEED) -> list[np.ndarray]:
+    """
+    Group the routes crossing the same set of nodes: the routes are hashed by summing random keys of their nodes,
+    then routes with equal hashes are compared exactly
+    :param incidence: the incidence of the instance
+    :param seed: the seed of the random keys of the nodes
+    :return: the groups of at least two routes crossing exactly the same nodes
+    """
+    generator = np.random.default_rng(seed)
+    node_keys = generator.integers(0, np.iinfo(np.uint64).max, size=(incidence.node_number, 2),
+                                   dtype=np.uint64, endpoint=True)
+    route_hashes = np.zeros((incidence.route_number, 2), dtype=np.uint64)
+    owners = np.repeat(np.arange(incidence.route_number), incidence.route_lengths())
+    np.add.at(route_hashes, owners, node_keys[incidence.route_indices])
+
+    order = np.lexsort((route_hashes[:, 1], route_hashes[:, 0]))
+    sorted_hashes = route_hashes[order]
+    new_group = np.any(sorted_hashes[1:] != sorted_hashes[:-1], axis=1)
+    bounds = np.flatnonzero(np.concatenate(([True], new_group, [True])))
+
+    groups = []
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        if end - start > 1:
+            routes = {}
+            for route in np.sort(order[start:end]).tolist():
+                routes.setdefault(incidence.get_route(route).tobytes(), []).append(route)
+            groups.extend(np.array(group, dtype=np.int64) for group in routes.values() if len(group) > 1)
+    return groups
@@ -0,0 +1,157 @@
+from common import transpose_csr
+import numpy as np
+
+
+class Incidence:
+    """
+    Compact node/route incidence of an instance, stored twice in CSR form:
+    node -> routes (the symptoms) and route -> nodes (the routes themselves).
+    Slices are sorted and returned as views, without any copy.
+    """
+    node_number: int
+    route_number: int
+    node_indptr: np.ndarray
+    node_indices: np.ndarray
+    route_indptr: np.ndarray
+    route_indices: np.ndarray
+
+    def __init__(self, node_number: int, route_indptr: np.ndarray, route_indices: np.ndarray,
+                 node_indptr: np.ndarray = None, node_indices: np.ndarray = None) -> None:
+        """
+        :param node_number: the number of nodes
+        :param route_indptr: offsets of each route in route_indices (length route_number + 1)
+        :param route_indices: concatenation of the sorted nodes crossed by each route
+        :param node_indptr: offsets of each symptom in node_indices, computed if not given
+        :param node_indices: concatenation of the sorted routes crossing each node, computed if not given
+        """
+        self.node_number = node_number
+        self.route_number = len(route_indptr) - 1
+        self.route_indptr = route_indptr
+        self.route_indices = route_indices
+        if node_indptr is None or node_indices is None:
+            node_indptr, node_indices = transpose_csr(node_number, route_indptr, route_indices)
+        self.node_indptr = node_indptr
+        self.node_indices = node_indices
+
+    @classmethod
+    def from_routes(cls, node_number: int, routes: list[set]) -> "Incidence":
+        """
+        Build the incidence from a list of routes given as sets of nodes
+        :param node_number: the number of nodes
+        :param routes: a list of sets containing the nodes crossed by each route
+        :return: the corresponding incidence
+        """
+        lengths = np.fromiter((len(route) for route in routes), dtype=np.int64, count=len(routes))
+        route_indptr = np.zeros(len(routes) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=route_indptr[1:])
+        route_indices = np.fromiter((node for route in routes for node in sorted(route)),
+                                    dtype=np.int32, count=int(route_indptr[-1]))
+        return cls(node_number, route_indptr, route_indices)
+
+    def get_symptom(self, node: int) -> np.ndarray:
+        """
+        :param node: index of the node
+        :return: the sorted indexes of the routes crossing the node
+        """
+        return self.node_indices[self.node_indptr[node]:self.node_indptr[node + 1]]
+
+    def get_route(self, route: int) -> np.ndarray:
+        """
+        :param route: index of the route
+        :return: the sorted indexes of the nodes crossed by the route
+        """
+        return self.route_indices[self.route_indptr[route]:self.route_indptr[route + 1]]
+
+    def expand_routes(self, routes: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Gather the nodes of several routes at once
+        :param routes: the indexes of some routes
+        :return: a tuple (nodes, owners) with one entry per node of each route, owners being the position of the
+                 corresponding route in the given array
+        """
+        return expand_rows(self.route_indptr, self.route_indices, routes)
+
+    def expand_symptoms(self, nodes: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Gather the routes crossing several nodes at once
+        :param nodes: the indexes of some nodes
+        :return: a tuple (routes, owners) with one entry per route crossing each node, owners being the position of
+                 the corresponding node in the given array
+        """
+        return expand_rows(self.node_indptr, self.node_indices, nodes)
+
+    def merge_nodes(self, labels: np.ndarray, node_number: int) -> "Incidence":
+        """
+        Build the incidence of the instance where the nodes having the same label are merged into a single node
+        :param labels: the new index of each node, or -1 to remove the node
+        :param node_number: the number of nodes after the merge
+        :return: the incidence on the merged nodes, with the same routes
+        """
+        nodes = labels[self.route_indices]
+        owners = np.repeat(np.arange(self.route_number, dtype=np.int64), self.route_lengths())
+        kept = nodes >= 0
+        entries = np.unique(owners[kept] * node_number + nodes[kept])
+        route_indptr = np.zeros(self.route_number + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entries // node_number, minlength=self.route_number), out=route_indptr[1:])
+        return Incidence(node_number, route_indptr, (entries % node_number).astype(np.int32))
+
+    def node_matrix(self):
+        """
+        :return: the node x route incidence matrix, as a scipy sparse CSR matrix
+        """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((np.ones(len(self.node_indices), dtype=np.int32), self.node_indices, self.node_indptr),
+                          shape=(self.node_number, self.route_number))
+
+    def pair_matrix(self, pairs: np.ndarray):
+        """
+        :param pairs: an array (k x 2) of pairs of nodes
+        :return: the pair x route matrix, as a scipy sparse CSR matrix, where a route belongs to the row of a pair
+                 iff it crosses exactly one of its nodes
+        """
+        matrix = self.node_matrix()
+        rows = abs(matrix[pairs[:, 0]] - matrix[pairs[:, 1]]).tocsr()
+        rows.eliminate_zeros()
+        return rows
+
+    def cooccurrences(self) -> np.ndarray:
+        """
+        :return: a dense node x node matrix containing the number of routes crossing both nodes,
+                 the diagonal being the number of routes crossing each node
+        """
+        matrix = self.node_matrix()
+        return (matrix @ matrix.T).toarray()
+
+    def node_degrees(self) -> np.ndarray:
+        """
+        :return: the number of routes crossing each node
+        """
+        return np.diff(self.node_indptr)
+
+    def route_lengths(self) -> np.ndarray:
+        """
+        :return: the number of nodes crossed by each route
+        """
+        return np.diff(self.route_indptr)
+
+    def nbytes(self) -> int:
+        """
+        :return: the memory used by the incidence arrays, in bytes
+        """
+        return (self.node_indptr.nbytes + self.node_indices.nbytes
+                + self.route_indptr.nbytes + self.route_indices.nbytes)
+
+
+def expand_rows(indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    :param indptr: offsets of each row of a CSR structure
+    :param indices: column indexes of the CSR structure
+    :param rows: the indexes of some rows
+    :return: a tuple (columns, owners) with the concatenated columns of the given rows, owners being the position
+             of the corresponding row in the given array
+    """
+    starts = indptr[rows]
+    lengths = indptr[np.asarray(rows) + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    positions = np.arange(int(lengths.sum()), dtype=np.int64) + offsets
+    return indices[positions], np.repeat(np.arange(len(rows)), lengths)
@@ -0,0 +1,61 @@
+from time import time
+from problems.path_selection_problem import PathSelectionProblem
+from problems.verification import selected_routes
+
+
+class IncumbentStream:
+    """
+    Append each improving solution found by a solver to a file as soon as it is found, so that the best solution so
+    far can be used before the end of the run. A record is the line "# time <seconds> objective <paths> bound <bound>"
+    followed by the solution in the format of the solution files; in a .csv file, a record is the line
+    "<instance>;<seconds>;<paths>;<bound>;<routes>", the routes being separated by spaces.
+    The last complete record of the file is the best solution.
+    """
+    path: str
+    problem: PathSelectionProblem
+    start_time: float
+    best_objective: float
+    records: int
+
+    def __init__(self, path: str, problem: PathSelectionProblem, start_time: float = None) -> None:
+        """
+        :param path: the file to which the records are appended
+        :param problem: the instance whose routes are written, i.e. the original instance if a quotient is solved
+        :param start_time: the time from which the timestamps are measured, now if not given
+        """
+        self.path = path
+        self.problem = problem
+        self.start_time = start_time if start_time is not None else time()
+        self.best_objective = float("inf")
+        self.records = 0
+
+    def record(self, solution: dict, bound: float) -> None:
+        """
+        Append the solution if it uses fewer routes than the recorded ones
+        :param solution: a feasible solution as a dict {route: value}, a route being selected if its value is at
+                         least 0.5
+        :param bound: a lower bound on the number of routes known when the solution is found
+        """
+        routes = sorted(selected_routes(solution).tolist())
+        if len(routes) >= self.best_objective:
+            return
+        self.best_objective = len(routes)
+        elapsed = time() - self.start_time
+        if self.path.endswith(".csv"):
+            text = (f"{self.problem.source_file};{elapsed};{len(routes)};{bound};"
+                    f"{' '.join(str(route) for route in routes)}\n")
+        else:
+            text = (f"# time {elapsed} objective {len(routes)} bound {bound}\n"
+                    + self.problem.format_solution({route: 1.0 for route in routes}))
+        # a record is written at once, so that a reader only misses the record being written
+        with open(self.path, "a") as file:
+            file.write(text)
+        self.records += 1
+
+    def should_stop(self, bound: float) -> bool:
+        """
+        :param bound: a lower bound known by the solver on the solutions it can still find
+        :return: True if the solver cannot find a better solution than the best one known elsewhere and can stop;
+                 a file stream only knows the solutions of the solver, which decides itself when to stop
+        """
+        return False
@@ -1,61 +1,157 @@
-from common import parse_instance, compute_symptoms
+import hashlib
+from common import load_instance
+from problems.analysis import InstanceAnalysis
+from problems.incidence import Incidence
+from problems.verification import SolutionVerifier, Verification
+from problems.presolve import PairRows, presolve_pair_rows
+import numpy as np
 
 class PathSelectionProblem:
     node_number: int
     route_number: int
-    symptoms: list[set]
+    incidence: Incidence
     goal: str
-    endpoints: list[(int, int)]
+    endpoints: np.ndarray
     initial_route_number: int
+    content_hash: str
+    verifier: SolutionVerifier
+    pair_rows: PairRows
+    analysis: InstanceAnalysis
+    node_classes: np.ndarray
+    cover_mask: np.ndarray
 
-    def __init__(self, file_path: str, goal: str) -> None:
+    def __init__(self, file_path: str, goal: str, use_cache: bool = False) -> None:
         self.source_file = file_path
-        (self.node_number,
-         self.route_number,
-         routes,
-         self.endpoints) = parse_instance(file_path)
+        self.node_number, arrays, self.content_hash = load_instance(file_path, use_cache)
         self.goal = goal
-        self.initial_route_number = len(routes)
 
-        self.symptoms = compute_symptoms(self.node_number, routes)
-        # print("symptoms computed")
+        self.set_incidence(Incidence(self.node_number, arrays["route_indptr"], arrays["route_indices"],
+                                     arrays.get("node_indptr"), arrays.get("node_indices")), arrays["endpoints"])
+
+    @classmethod
+    def from_incidence(cls, incidence: Incidence, endpoints: np.ndarray, goal: str, source_file: str,
+                       content_hash: str) -> "PathSelectionProblem":
+        """
+        Build an instance that is not read from a file, e.g. the quotient of an instance
+        :param incidence: the incidence of the instance
+        :param endpoints: the endpoints of each route (route_number x 2)
+        :param goal: the goal of the instance
+        :param source_file: the file the instance is derived from
+        :param content_hash: a hash identifying the content of the instance
+        """
+        problem = cls.__new__(cls)
+        problem.source_file = source_file
+        problem.node_number = incidence.node_number
+        problem.content_hash = content_hash
+        problem.goal = goal
+        problem.set_incidence(incidence, endpoints)
+        return problem
+
+    def set_incidence(self, incidence: Incidence, endpoints: np.ndarray) -> None:
+        self.incidence = incidence
+        self.endpoints = endpoints
+        self.route_number = self.incidence.route_number
+        self.initial_route_number = self.route_number
+        self.verifier = None
+        self.pair_rows = None
+        self.analysis = None
+        self.node_classes = None
+        self.cover_mask = None
+
+    def restrict_rows(self, node_classes: np.ndarray = None, cover_mask: np.ndarray = None) -> None:
+        """
+        Only require a part of the rows, e.g. when the other ones are satisfied by routes fixed by a reduction
+        :param node_classes: the class of each node, the 1-id rows only being required between the nodes of a same
+                             class, None if every pair of nodes must be distinguished
+        :param cover_mask: a boolean array that is true for the nodes whose cover row is required, None for every node
+        """
+        self.node_classes = node_classes
+        self.cover_mask = cover_mask
+        self.verifier = None
+        self.pair_rows = None
+
+    def is_restricted(self) -> bool:
+        """
+        :return: True if some of the cover or 1-id rows of the instance are not required
+        """
+        return self.node_classes is not None or self.cover_mask is not None
+
+    def cover_nodes(self) -> np.ndarray:
+        """
+        :return: the nodes whose cover row is required
+        """
+        if self.cover_mask is None:
+            return np.arange(self.node_number)
+        return np.flatnonzero(self.cover_mask)
+
+    def analyze(self) -> InstanceAnalysis:
+        """
+        :return: the structural analysis of the instance, computed at the first call
+        """
+        if self.analysis is None:
+            self.analysis = InstanceAnalysis(self.incidence)
+        return self.analysis
+
+    def quotient(self) -> "PathSelectionProblem":
+        """
+        Build the quotient instance, where each class of nodes having identical symptoms is a single node
+        and the nodes crossed by no route are removed. The routes keep their indexes, so that a solution
+        of the quotient instance is a solution of this instance, identifying every class instead of every node.
+        :return: the quotient instance
+        """
+        labels, class_number = self.analyze().node_labels()
+        content_hash = hashlib.blake2b(f"{self.content_hash}/quotient".encode(), digest_size=20).hexdigest()
+        return PathSelectionProblem.from_incidence(self.incidence.merge_nodes(labels, class_number), self.endpoints,
+                                                   self.goal, self.source_file, content_hash)
+
+    def get_verifier(self) -> SolutionVerifier:
+        if self.verifier is None:
+            self.verifier = SolutionVerifier(self.incidence, node_classes=self.node_classes,
+                                             cover_mask=self.cover_mask)
+        return self.verifier
+
+    def get_pair_rows(self) -> PairRows:
+        """
+        :return: the pairs of nodes whose 1-id constraint is not implied by another constraint
+        """
+        if self.pair_rows is None:
+            self.pair_rows = presolve_pair_rows(self.incidence, node_classes=self.node_classes,
+                                                cover_mask=self.cover_mask)
+        return self.pair_rows
+
+    def verify(self, solution: dict) -> Verification:
+        return self.get_verifier().verify(solution)
+
+    def verify_many(self, solutions: list[dict]) -> list[Verification]:
+        return self.get_verifier().verify_many(solutions)
 
     def is_covered(self, solution: dict) -> bool:
-        for index, symptom in enumerate(self.symptoms):
-            coverage = 0
-            for route in symptom.intersection(solution.keys()):
-                coverage += solution[route]
-            if coverage == 0:
-                return False
-        return True
+        return self.get_verifier().is_covered(solution)
 
     def is_one_id(self, solution: dict) -> bool:
-        for i in range(self.node_number):
-            for j in range(i + 1, self.node_number):
-                one_identifiability = 0
-                for route in self.symptoms[i].symmetric_difference(self.symptoms[j]).intersection(solution.keys()):
-                    one_identifiability += solution[route]
-                if one_identifiability < 1:
-                    return False
-        return True
-
-    def get_route(self, route_index: int) -> set[int]:
-        route = set()
-        for node, symptom in enumerate(self.symptoms):
-            if route_index in symptom:
-                route.add(node)
-        return route
+        return self.verify(solution).is_one_id()
+
+    def get_route(self, route_index: int) -> np.ndarray:
+        return self.incidence.get_route(route_index)
 
     def get_sources(self, solution: dict) -> dict:
         sources = {}  # {source_id: load}
         for route in solution.keys():
-            current_source = self.endpoints[route][0]
+            current_source = int(self.endpoints[route][0])
             if current_source not in sources.keys():
                 sources[current_source] = 0
             sources[current_source] += 1
         return sources
 
     def write_solution(self, sol_path: str, solution: dict) -> None:
+        with open(sol_path, "w") as file:
+            file.write(self.format_solution(solution))
+
+    def format_solution(self, solution: dict) -> str:
+        """
+        :param solution: the solution as a dict {route: value}
+        :return: the solution in the format of the solution files, the number of nodes then one route per line
+        """
         output_string = f"{self.node_number}\n"
         for index, val in solution.items():
                 output_string += f"{self.endpoints[index][0]} {self.endpoints[index][1]} |"
@@ -63,8 +159,7 @@ class PathSelectionProblem:
                     output_string += f" {node}"
                 # output_string += "{} | {} {}\n".format(self.endpoints[index], self.get_route(index), val)
                 output_string += "\n"
-        with open(sol_path, "w") as file:
-            file.write(output_string)
+        return output_string
 
     def get_routes_set(self):
         return set(range(self.route_number))
@@ -72,15 +167,15 @@ class PathSelectionProblem:
     def get_node_set(self):
         return set(range(self.node_number))
 
-    def get_symptom(self, node: int):
-        return self.symptoms[node]
+    def get_symptom(self, node: int) -> np.ndarray:
+        return self.incidence.get_symptom(node)
 
     def get_endpoints(self, route_index):
-        return self.endpoints[route_index]
+        return tuple(self.endpoints[route_index].tolist())
 
     def get_number_removed_routes(self):
         return self.initial_route_number - self.route_number
 
     def print_solution(self, solution: dict):
         for route, val in solution.items():
-            print("{} : {}; {} ({})".format(val, self.endpoints[route], self.get_route(route), route))
+            print("{} : {}; {} ({})".format(val, self.get_endpoints(route), set(self.get_route(route).tolist()), route))
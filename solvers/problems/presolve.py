@@ -0,0 +1,176 @@
+from common import hash_pairs
+from problems.incidence import Incidence
+import numpy as np
+
+PRESOLVE_SEED = 2094571
+# the inclusions between pair rows are only searched when the number of products it takes is below this limit
+PAIR_DOMINANCE_WORK_LIMIT = 5 * 10 ** 8
+DOMINANCE_BLOCK_SIZE = 2048
+
+
+class PairRows:
+    """
+    The 1-id constraints that remain after the presolve, with the number of rows removed by each rule
+    """
+    pairs: np.ndarray
+    row_ids: np.ndarray
+    total: int
+    implied: int
+    duplicates: int
+    dominated: int
+    pair_dominance: bool
+
+    def __init__(self, pairs: np.ndarray, row_ids: np.ndarray, total: int, implied: int, duplicates: int,
+                 dominated: int, pair_dominance: bool) -> None:
+        """
+        :param pairs: an array (k x 2) containing the kept pairs of nodes (a, b), a < b
+        :param row_ids: the hash_pair index of each kept pair
+        :param total: the number of pairs of nodes before the presolve
+        :param implied: the number of rows implied by a cover row
+        :param duplicates: the number of rows identical to a kept row
+        :param dominated: the number of rows implied by another pair row
+        :param pair_dominance: whether the inclusions between pair rows have been searched
+        """
+        self.pairs = pairs
+        self.row_ids = row_ids
+        self.total = total
+        self.implied = implied
+        self.duplicates = duplicates
+        self.dominated = dominated
+        self.pair_dominance = pair_dominance
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def removed(self) -> int:
+        return self.total - len(self.pairs)
+
+    def __str__(self) -> str:
+        dominated = f"{self.dominated} dominated by a pair row" if self.pair_dominance else "pair rows not compared"
+        return (f"{len(self.pairs)} pair rows kept out of {self.total} "
+                f"({self.implied} implied by a cover row, {self.duplicates} duplicates, {dominated})")
+
+
+def presolve_pair_rows(incidence: Incidence, seed: int = PRESOLVE_SEED,
+                       work_limit: float = PAIR_DOMINANCE_WORK_LIMIT, node_classes: np.ndarray = None,
+                       cover_mask: np.ndarray = None) -> PairRows:
+    """
+    Remove the 1-id constraints sum(y[r], r in S_a ^ S_b) >= 1 that are implied by another constraint,
+    i.e. whose set of routes contains the set of routes of another row:
+    - rows containing the symptom S_k of a node k, which includes every pair of nodes having disjoint symptoms,
+    - rows having the same set of routes as another row, only one of them is kept,
+    - rows strictly containing the set of another pair row, if the search fits in the work limit.
+    The sets of routes are compared through 128 bits hashes (the xor of random keys of their routes) and their sizes.
+    The removed rows are implied for any nonnegative y, so that both the ILP and its LP relaxation are unchanged.
+    :param incidence: the incidence of the instance
+    :param seed: the seed of the random keys of the routes
+    :param work_limit: maximal number of products spent to compare the pair rows with each other
+    :param node_classes: the class of each node, only the pairs of nodes of a same class having a row,
+                         None if every pair has one
+    :param cover_mask: a boolean array that is true for the nodes having a cover row, None for every node
+    :return: the kept pairs and the statistics of the presolve
+    """
+    n = incidence.node_number
+    first, second = np.triu_indices(n, k=1)
+    if node_classes is not None:
+        same_class = node_classes[first] == node_classes[second]
+        first, second = first[same_class], second[same_class]
+    generator = np.random.default_rng(seed)
+    route_keys = generator.integers(0, np.iinfo(np.uint64).max, size=(incidence.route_number, 2),
+                                    dtype=np.uint64, endpoint=True)
+
+    cooccurrences = incidence.cooccurrences()
+    degrees = np.diag(cooccurrences)
+    node_hashes = np.zeros((n, 2), dtype=np.uint64)
+    routes, owners = incidence.expand_symptoms(np.arange(n))
+    np.bitwise_xor.at(node_hashes, owners, route_keys[routes])
+    pair_hashes = node_hashes[first] ^ node_hashes[second]
+    sizes = degrees[first] + degrees[second] - 2 * cooccurrences[first, second]
+
+    # the pairs are sorted by hash, then by index so that the first pair of each group is kept
+    order = np.lexsort((np.arange(len(first)), sizes, pair_hashes[:, 1], pair_hashes[:, 0]))
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (np.any(pair_hashes[order[1:]] != pair_hashes[order[:-1]], axis=1)
+                     | (sizes[order[1:]] != sizes[order[:-1]]))
+    groups = np.empty(len(order), dtype=np.int64)
+    groups[order] = np.cumsum(new_group) - 1
+
+    # a group whose row is implied is removed as a whole
+    implied = implied_by_cover_rows(incidence, route_keys, cover_mask)[first, second]
+    implied_groups = np.zeros(int(groups.max(initial=-1)) + 1, dtype=bool)
+    implied_groups[groups[implied]] = True
+    implied = implied_groups[groups]
+    representatives = np.zeros(len(first), dtype=bool)
+    representatives[order[new_group]] = True
+    candidates = np.flatnonzero(representatives & ~implied)
+
+    lengths = incidence.route_lengths().astype(np.float64)
+    pair_dominance = float(np.sum((lengths * (n - lengths)) ** 2)) <= work_limit
+    kept = candidates
+    if pair_dominance:
+        kept = candidates[~dominated_by_pair_rows(incidence, first[candidates], second[candidates],
+                                                  sizes[candidates])]
+
+    pairs = np.stack((first[kept], second[kept]), axis=1).astype(np.int64)
+    implied_number = int(np.count_nonzero(implied))
+    return PairRows(pairs, hash_pairs(pairs[:, 0], pairs[:, 1], n), len(first), implied_number,
+                    len(first) - implied_number - len(candidates), len(candidates) - len(kept), pair_dominance)
+
+
+def implied_by_cover_rows(incidence: Incidence, route_keys: np.ndarray, cover_mask: np.ndarray = None) -> np.ndarray:
+    """
+    The row of (a, b) contains S_k iff each route crossing k crosses exactly one node among a and b, i.e. iff
+    the routes of S_k crossing a and the routes of S_k crossing b are complementary in S_k.
+    For each node k, the nodes are hashed by the routes of S_k crossing them, and the nodes are matched with the
+    nodes having the complementary hash, in O(sum(|r|^2)) over the routes r overall.
+    :param incidence: the incidence of the instance
+    :param route_keys: the random keys of the routes (route_number x 2)
+    :param cover_mask: a boolean array that is true for the nodes having a cover row, None for every node
+    :return: a boolean matrix (n x n) that is true for the pairs of nodes whose row contains a symptom
+    """
+    n = incidence.node_number
+    implied = np.zeros((n, n), dtype=bool)
+    cover_nodes = range(n) if cover_mask is None else np.flatnonzero(cover_mask).tolist()
+    for k in cover_nodes:
+        symptom = incidence.get_symptom(k)
+        if len(symptom) == 0:
+            # the cover row of k cannot be satisfied, the rows are kept as they are
+            continue
+        nodes, owners = incidence.expand_routes(symptom)
+        hashes = np.zeros((n, 2), dtype=np.uint64)
+        np.bitwise_xor.at(hashes, nodes, route_keys[symptom[owners]])
+        counts = np.bincount(nodes, minlength=n)
+
+        classes = {}
+        for node, (first_hash, second_hash), count in zip(range(n), hashes.tolist(), counts.tolist()):
+            classes.setdefault((first_hash, second_hash, count), []).append(node)
+        full_first, full_second = hashes[k].tolist()
+        for (first_hash, second_hash, count), members in classes.items():
+            complement = classes.get((first_hash ^ full_first, second_hash ^ full_second, len(symptom) - count))
+            if complement is not None:
+                implied[np.ix_(members, complement)] = True
+    return implied
+
+
+def dominated_by_pair_rows(incidence: Incidence, first: np.ndarray, second: np.ndarray,
+                           sizes: np.ndarray) -> np.ndarray:
+    """
+    Search the pair rows whose set of routes strictly contains the set of another of the given rows,
+    by computing the sizes of the intersections of the rows by blocks of sparse products
+    :param incidence: the incidence of the instance
+    :param first: the first node of each pair, the rows being pairwise distinct
+    :param second: the second node of each pair
+    :param sizes: the number of routes of each row
+    :return: a boolean array that is true for the dominated rows
+    """
+    rows = incidence.pair_matrix(np.stack((first, second), axis=1))
+    transposed = rows.T.tocsc()
+
+    dominated = np.zeros(len(first), dtype=bool)
+    for start in range(0, len(first), DOMINANCE_BLOCK_SIZE):
+        intersections = (rows[start:start + DOMINANCE_BLOCK_SIZE] @ transposed).tocoo()
+        # the row of the column is included in the row of the line, and is smaller
+        inclusions = ((intersections.data == sizes[intersections.col])
+                      & (sizes[intersections.col] < sizes[start + intersections.row]))
+        dominated[start + intersections.row[inclusions]] = True
+    return dominated
@@ -0,0 +1,222 @@
+import hashlib
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from problems.incidence import Incidence
+from problems.path_selection_problem import PathSelectionProblem
+from problems.verification import selected_routes
+import numpy as np
+
+
+class InstanceReduction:
+    """
+    Reduction of an instance before any model is built:
+    - a route is forced when it is the only route of a row: the only route crossing a node, or the only route
+      distinguishing a pair of nodes, i.e. |S_a ^ S_b| = 1. The forced routes are part of every solution.
+    - the rows satisfied by the forced routes are dropped: the cover rows of the nodes they cross, and the pair rows of
+      the nodes they distinguish. The nodes are then split into the classes of nodes crossed by the same forced routes,
+      only the nodes needing a cover row and the nodes of a class of at least two nodes remain.
+    - the remaining nodes are split into independent components, two nodes being linked if a route crosses both, or if
+      they are in a same class crossed by a forced route; the pairs of nodes of different components crossed by no
+      forced route are distinguished by the cover rows. Each component is a sub-instance solved on its own, whose
+      solutions are mapped back to the routes of the instance.
+    The structures of a reductions file (one-degree packs, tails) give the candidate pairs of nodes searched for forced
+    routes, every candidate being checked exactly; without them, every pair of nodes is searched.
+    """
+    instance: PathSelectionProblem
+    forced_routes: np.ndarray
+    hinted_forced: int
+    node_classes: np.ndarray
+    cover_mask: np.ndarray
+    components: list[PathSelectionProblem]
+    component_routes: list[np.ndarray]
+    component_nodes: list[np.ndarray]
+    hints: tuple
+
+    def __init__(self, instance: PathSelectionProblem, hints: tuple = None, node_map: np.ndarray = None) -> None:
+        """
+        :param instance: the instance to reduce
+        :param hints: the structures of a reductions file, as returned by common.parse_reductions
+                      (indy_nodes, bcs, one_degree_packs, tails), or None to search every pair of nodes
+        :param node_map: the node of the instance of each node of the hints, -1 for a removed node, e.g. the labels of
+                         the quotient instance; the nodes are the same if None
+        """
+        self.instance = instance
+        self.hints = hints
+        n = instance.node_number
+        incidence = instance.incidence
+
+        forced = [incidence.get_symptom(node)[0] for node in range(n) if len(incidence.get_symptom(node)) == 1]
+        self.hinted_forced = 0
+        if instance.goal == "1id":
+            if hints is None:
+                first, second = forcing_pairs(incidence)
+            else:
+                first, second = hinted_pairs(hints, n, node_map)
+                first, second = checked_forcing_pairs(incidence, first, second)
+            pair_forced = [np.setxor1d(incidence.get_symptom(a), incidence.get_symptom(b), assume_unique=True)[0]
+                           for a, b in zip(first.tolist(), second.tolist())]
+            if hints is not None:
+                self.hinted_forced = len(np.setdiff1d(pair_forced, forced))
+            forced.extend(pair_forced)
+        self.forced_routes = np.unique(np.array(forced, dtype=np.int64))
+
+        # the nodes crossed by the same forced routes form a class, hashed with the keys of the verifier
+        nodes, owners = incidence.expand_routes(self.forced_routes)
+        self.cover_mask = np.bincount(nodes, minlength=n) == 0
+        hashes = np.zeros((n, 2), dtype=np.uint64)
+        np.add.at(hashes, nodes, instance.get_verifier().route_keys[self.forced_routes[owners]])
+        _, self.node_classes, class_sizes = np.unique(hashes, axis=0, return_inverse=True, return_counts=True)
+        self.node_classes = self.node_classes.ravel()
+
+        active = self.cover_mask.copy()
+        if instance.goal == "1id":
+            active |= class_sizes[self.node_classes] > 1
+        self.build_components(active)
+
+    def build_components(self, active: np.ndarray) -> None:
+        """
+        Split the active nodes into independent components and build the sub-instance of each component
+        :param active: a boolean array that is true for the nodes having a cover row or a pair row left
+        """
+        instance = self.instance
+        n = instance.node_number
+        candidates = np.setdiff1d(np.arange(instance.route_number), self.forced_routes)
+        nodes, owners = instance.incidence.expand_routes(candidates)
+        kept = active[nodes]
+        nodes, owners = nodes[kept], owners[kept]
+
+        # the consecutive active nodes of each route are linked, then the nodes of each class crossed by a forced route
+        same_route = np.flatnonzero(owners[1:] == owners[:-1])
+        first, second = [nodes[same_route]], [nodes[same_route + 1]]
+        if instance.goal == "1id":
+            members = np.flatnonzero(active & ~self.cover_mask)
+            members = members[np.argsort(self.node_classes[members], kind="stable")]
+            same_class = np.flatnonzero(self.node_classes[members[1:]] == self.node_classes[members[:-1]])
+            first.append(members[same_class])
+            second.append(members[same_class + 1])
+        first, second = np.concatenate(first), np.concatenate(second)
+        graph = coo_matrix((np.ones(len(first)), (first, second)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+
+        self.components, self.component_routes, self.component_nodes = [], [], []
+        for component in np.unique(labels[active]).tolist():
+            component_nodes = np.flatnonzero(active & (labels == component))
+            self.component_nodes.append(component_nodes)
+            in_component = labels[nodes] == component
+            self.component_routes.append(candidates[np.unique(owners[in_component])])
+            self.components.append(self.sub_instance(len(self.components), component_nodes, self.component_routes[-1]))
+
+    def sub_instance(self, index: int, nodes: np.ndarray, routes: np.ndarray) -> PathSelectionProblem:
+        """
+        :param index: the index of the component
+        :param nodes: the sorted nodes of the component
+        :param routes: the sorted routes crossing a node of the component
+        :return: the instance restricted to the nodes and the routes, the nodes and the routes being renumbered
+        """
+        positions = np.full(self.instance.node_number, -1, dtype=np.int64)
+        positions[nodes] = np.arange(len(nodes))
+        route_nodes, owners = self.instance.incidence.expand_routes(routes)
+        kept = positions[route_nodes] >= 0
+        indptr = np.zeros(len(routes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners[kept], minlength=len(routes)), out=indptr[1:])
+        incidence = Incidence(len(nodes), indptr, positions[route_nodes[kept]])
+
+        content_hash = hashlib.blake2b(f"{self.instance.content_hash}/reduction/{index}".encode(),
+                                       digest_size=20).hexdigest()
+        problem = PathSelectionProblem.from_incidence(incidence, self.instance.endpoints[routes], self.instance.goal,
+                                                      self.instance.source_file, content_hash)
+        node_classes = None
+        if self.instance.goal == "1id":
+            node_classes = np.unique(self.node_classes[nodes], return_inverse=True)[1].ravel()
+        problem.restrict_rows(node_classes, self.cover_mask[nodes].copy())
+        return problem
+
+    def map_solution(self, solutions: list[dict]) -> dict:
+        """
+        :param solutions: a solution of each component, as a dict {route: value}
+        :return: the solution of the instance made of the forced routes and the routes selected in the components
+        """
+        routes = [self.forced_routes]
+        for component_routes, solution in zip(self.component_routes, solutions):
+            routes.append(component_routes[selected_routes(solution)])
+        return {route: 1.0 for route in np.unique(np.concatenate(routes)).tolist()}
+
+    def row_numbers(self) -> (int, int):
+        """
+        :return: a tuple (before, after) with the number of cover and pair rows of the instance and of the components
+        """
+        n = self.instance.node_number
+        if self.instance.goal != "1id":
+            return n, sum(len(component.cover_nodes()) for component in self.components)
+        after = 0
+        for component in self.components:
+            class_sizes = np.bincount(component.node_classes)
+            after += len(component.cover_nodes()) + int(np.sum(class_sizes * (class_sizes - 1) // 2))
+        return n + n * (n - 1) // 2, after
+
+    def hint_summary(self) -> str:
+        """
+        :return: the comparison of the structures of the reductions file with the components found
+        """
+        indy_nodes, bcs, one_degree_packs, tails = self.hints
+        return (f"reductions file: {len(indy_nodes)} independent nodes, {len(bcs)} biconnected components, "
+                f"{len(one_degree_packs)} one-degree packs, {len(tails)} tails, "
+                f"{self.hinted_forced} forced routes found from them")
+
+    def __str__(self) -> str:
+        rows_before, rows_after = self.row_numbers()
+        routes_after = sum(len(routes) for routes in self.component_routes)
+        largest = max((len(nodes) for nodes in self.component_nodes), default=0)
+        text = (f"{len(self.forced_routes)} forced routes, {len(self.components)} components "
+                f"(largest {largest} nodes), rows {rows_before} -> {rows_after}, "
+                f"routes {self.instance.route_number} -> {routes_after}")
+        if self.hints is not None:
+            text += f", {self.hint_summary()}"
+        return text
+
+
+def forcing_pairs(incidence: Incidence) -> (np.ndarray, np.ndarray):
+    """
+    :return: the pairs of nodes (a, b), a < b, distinguished by a single route, as two arrays
+    """
+    cooccurrences = incidence.cooccurrences()
+    degrees = np.diag(cooccurrences)
+    sizes = degrees[:, None] + degrees[None, :] - 2 * cooccurrences
+    return np.nonzero(np.triu(sizes == 1, k=1))
+
+
+def checked_forcing_pairs(incidence: Incidence, first: np.ndarray, second: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    :param first: the first node of each candidate pair
+    :param second: the second node of each candidate pair
+    :return: the candidate pairs distinguished by a single route
+    """
+    forcing = np.array([len(np.setxor1d(incidence.get_symptom(a), incidence.get_symptom(b), assume_unique=True)) == 1
+                        for a, b in zip(first.tolist(), second.tolist())], dtype=bool)
+    return first[forcing], second[forcing]
+
+
+def hinted_pairs(hints: tuple, node_number: int, node_map: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """
+    The routes leaving a one-degree pack or a tail can only be told apart by few routes: the pairs of a pack (its
+    center and its leaves) and the consecutive nodes of a tail are the candidates to force a route
+    :param hints: the structures of a reductions file (indy_nodes, bcs, one_degree_packs, tails)
+    :param node_number: the number of nodes of the instance, the pairs of unknown nodes being ignored
+    :param node_map: the node of the instance of each node of the hints, -1 for a removed node, None for the identity
+    :return: the candidate pairs (a, b), a < b, as two arrays
+    """
+    _, _, one_degree_packs, tails = hints
+    pairs = []
+    for center, leaves in one_degree_packs:
+        pack = [center] + sorted(leaves)
+        pairs.extend((a, b) for position, a in enumerate(pack) for b in pack[position + 1:])
+    for tail in tails:
+        pairs.extend(zip(tail[:-1], tail[1:]))
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    if node_map is not None:
+        pairs = pairs[np.all((pairs >= 0) & (pairs < len(node_map)), axis=1)]
+        pairs = node_map[pairs]
+    pairs = pairs[np.all((pairs >= 0) & (pairs < node_number), axis=1)]
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return pairs[:, 0], pairs[:, 1]
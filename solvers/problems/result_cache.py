@@ -0,0 +1,204 @@
+import fcntl
+import hashlib
+import json
+import math
+import os
+from contextlib import contextmanager
+from time import time
+from problems.verification import selected_routes
+
+# a new version makes the results of the previous ones unreachable, e.g. when the solvers change
+RESULT_CACHE_VERSION = 1
+ENTRY_SUFFIX = ".json"
+LOCK_FILENAME = "lock"
+BOUND_TOLERANCE = 1e-6
+
+
+def result_key(content_hash: str, goal: str, configuration: dict) -> str:
+    """
+    :param content_hash: the hash of the content of the instance file
+    :param goal: the goal of the model
+    :param configuration: the options of the run that change its result, the time limit excepted
+    :return: the key of the results of the run in the cache
+    """
+    text = json.dumps({"version": RESULT_CACHE_VERSION, "instance": content_hash, "goal": goal,
+                       "configuration": configuration}, sort_keys=True)
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+
+class CachedResult:
+    """
+    Result of a run read from the cache, with the interface of the solvers
+    """
+    timelimit: float
+    objective: int
+    status: str
+    solving_time: float
+    total_time: float
+    bound: float
+    solution: dict
+    fields: list
+    stored_time: float
+
+    def __init__(self, result: dict) -> None:
+        """
+        :param result: a result of an entry of the cache
+        """
+        self.timelimit = result["timelimit"]
+        self.objective = result["objective"]
+        self.status = result["status"]
+        self.solving_time = result["solving_time"]
+        self.total_time = result["total_time"]
+        self.bound = result["bound"]
+        self.solution = {route: 1.0 for route in result["routes"]}
+        self.fields = result["fields"]
+        self.stored_time = result["stored_time"]
+
+    def is_proven(self) -> bool:
+        """
+        :return: True if the solution is proven optimal by the bound
+        """
+        return self.objective <= math.ceil(self.bound - BOUND_TOLERANCE)
+
+    def get_objective(self):
+        return self.objective
+
+    def get_status(self):
+        return self.status
+
+    def get_solving_time(self):
+        return self.solving_time
+
+    def get_total_time(self):
+        return self.total_time
+
+    def get_solution(self):
+        return self.solution
+
+
+class ResultCache:
+    """
+    On-disk cache of the results of the runs, addressed by the hash of the content of the instance and of the options
+    of the run: renaming or copying an instance file keeps its results. An entry is a file holding the results of the
+    time limits run with the same options. The least recently used entries are removed when the cache exceeds its
+    size. The processes using the same directory lock it, and the entries are written to a temporary file then renamed,
+    so that a reader never sees a partial entry.
+    """
+    directory: str
+    max_bytes: int
+
+    def __init__(self, directory: str, max_size: float) -> None:
+        """
+        :param directory: the directory of the entries, created if needed
+        :param max_size: the maximal size of the entries in MB
+        """
+        self.directory = directory
+        self.max_bytes = int(max_size * 2 ** 20)
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    @contextmanager
+    def locked(self, exclusive: bool):
+        with open(os.path.join(self.directory, LOCK_FILENAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_entry(self, key: str) -> dict:
+        """
+        :return: the entry of the key, None if there is none or if it cannot be read
+        """
+        try:
+            with open(self.entry_path(key)) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("version") == RESULT_CACHE_VERSION else None
+
+    def lookup(self, key: str, timelimit: float, accept_longer: bool = False) -> CachedResult:
+        """
+        :param key: the key of the run
+        :param timelimit: the time limit of the run
+        :param accept_longer: if True, a result of a longer time limit, or a result proven optimal within the time
+                              limit, is accepted when the time limit was not run
+        :return: the cached result of the run, None if it is not in the cache
+        """
+        with self.locked(exclusive=False):
+            entry = self.read_entry(key)
+            if entry is None:
+                return None
+            results = [CachedResult(result) for result in entry["results"]]
+            exact = [result for result in results if result.timelimit == timelimit]
+            accepted = exact
+            if not exact and accept_longer:
+                accepted = [result for result in results if result.timelimit > timelimit
+                            or (result.is_proven() and result.solving_time <= timelimit)]
+            if not accepted:
+                return None
+            # the access is recorded for the eviction
+            os.utime(self.entry_path(key))
+        return min(accepted, key=lambda result: (result.objective, result.timelimit))
+
+    def store(self, key: str, description: dict, timelimit: float, solver, bound: float, fields: list) -> None:
+        """
+        Store the result of a run, replacing the result of the same time limit, then evict the least recently used
+        entries while the cache exceeds its size
+        :param key: the key of the run
+        :param description: the instance, the goal and the options of the run, stored to inspect the entry
+        :param timelimit: the time limit of the run
+        :param solver: the solver after the run
+        :param bound: the lower bound on the number of routes proven by the run
+        :param fields: the statistics specific to the solver
+        """
+        result = {"timelimit": timelimit, "objective": solver.get_objective(), "status": solver.get_status(),
+                  "solving_time": solver.get_solving_time(), "total_time": solver.get_total_time(), "bound": bound,
+                  "routes": sorted(selected_routes(solver.get_solution()).tolist()),
+                  "fields": [field if isinstance(field, (int, float, str, bool, type(None))) else str(field)
+                             for field in fields],
+                  "stored_time": time()}
+        path = self.entry_path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with self.locked(exclusive=True):
+            entry = self.read_entry(key) or {"version": RESULT_CACHE_VERSION, **description, "results": []}
+            entry["results"] = [old for old in entry["results"] if old["timelimit"] != timelimit] + [result]
+            try:
+                with open(temporary_path, "w") as file:
+                    json.dump(entry, file)
+                os.replace(temporary_path, path)
+            except OSError:
+                # the cache is optional, e.g. the disk may be full
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                return
+            self.evict(key)
+
+    def evict(self, kept_key: str) -> None:
+        """
+        Remove the least recently used entries, but the entry of kept_key, while the cache exceeds its size; the
+        cache must be locked
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(ENTRY_SUFFIX) and filename != kept_key + ENTRY_SUFFIX:
+                try:
+                    stat = os.stat(os.path.join(self.directory, filename))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        total = sum(size for _, size, _ in entries)
+        try:
+            total += os.path.getsize(self.entry_path(kept_key))
+        except OSError:
+            pass
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, filename))
+                total -= size
+            except OSError:
+                pass
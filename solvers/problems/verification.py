@@ -0,0 +1,147 @@
+from problems.incidence import Incidence
+import numpy as np
+
+VERIFIER_SEED = 1863947
+
+
+class Verification:
+    """
+    Result of the verification of a solution
+    """
+    uncovered_nodes: np.ndarray
+    undistinguished_classes: list[np.ndarray]
+
+    def __init__(self, uncovered_nodes: np.ndarray, undistinguished_classes: list[np.ndarray]) -> None:
+        """
+        :param uncovered_nodes: the nodes crossed by no selected route
+        :param undistinguished_classes: the groups of at least two nodes crossed by exactly the same selected routes
+        """
+        self.uncovered_nodes = uncovered_nodes
+        self.undistinguished_classes = undistinguished_classes
+
+    def is_covered(self) -> bool:
+        return len(self.uncovered_nodes) == 0
+
+    def is_one_id(self) -> bool:
+        return len(self.undistinguished_classes) == 0
+
+    def undistinguished_pairs(self) -> np.ndarray:
+        """
+        :return: an array (k x 2) containing every pair of nodes (a, b), a < b, that no selected route distinguishes
+        """
+        pairs = [np.empty((0, 2), dtype=np.int64)]
+        for nodes in self.undistinguished_classes:
+            first, second = np.triu_indices(len(nodes), k=1)
+            pairs.append(np.stack((nodes[first], nodes[second]), axis=1))
+        return np.concatenate(pairs)
+
+
+class SolutionVerifier:
+    """
+    Verify the cover and the 1-identifiability of solutions in O(n.k) where k is the number of selected routes:
+    the signature of each node (the set of selected routes crossing it) is hashed by summing random 64 bits keys
+    of the routes, then nodes with equal hashes are grouped by sorting and their signatures are compared exactly.
+    """
+    incidence: Incidence
+    route_keys: np.ndarray
+    node_classes: np.ndarray
+    cover_mask: np.ndarray
+    node_offsets: np.ndarray
+
+    def __init__(self, incidence: Incidence, seed: int = VERIFIER_SEED, node_classes: np.ndarray = None,
+                 cover_mask: np.ndarray = None) -> None:
+        """
+        :param incidence: the incidence of the instance
+        :param seed: the seed of the random keys of the routes
+        :param node_classes: the class of each node, only the nodes of a same class having to be distinguished,
+                             None if every pair of nodes must be distinguished
+        :param cover_mask: a boolean array that is true for the nodes that must be covered, None for every node
+        """
+        self.incidence = incidence
+        self.node_classes = node_classes
+        self.cover_mask = cover_mask
+        generator = np.random.default_rng(seed)
+        # two independent keys per route, so that a hash is 128 bits long
+        self.route_keys = generator.integers(0, np.iinfo(np.uint64).max, size=(incidence.route_number, 2),
+                                             dtype=np.uint64, endpoint=True)
+        # the hashes of the nodes start from a random key of their class, so that two classes are never merged
+        self.node_offsets = np.zeros((incidence.node_number, 2), dtype=np.uint64)
+        if node_classes is not None:
+            class_keys = generator.integers(0, np.iinfo(np.uint64).max, size=(int(node_classes.max(initial=-1)) + 1, 2),
+                                            dtype=np.uint64, endpoint=True)
+            self.node_offsets = class_keys[node_classes]
+
+    def verify(self, solution: dict) -> Verification:
+        """
+        :param solution: the solution as a dict {route: value}, a route is selected if its value is at least 0.5
+        :return: the verification of the solution
+        """
+        return self.verify_routes(selected_routes(solution))
+
+    def verify_many(self, solutions: list[dict]) -> list[Verification]:
+        """
+        Verify several candidate solutions of the same instance
+        :param solutions: a list of solutions as dicts {route: value}
+        :return: the verification of each solution
+        """
+        return [self.verify(solution) for solution in solutions]
+
+    def verify_routes(self, routes: np.ndarray) -> Verification:
+        """
+        :param routes: the indexes of the selected routes
+        :return: the verification of the selection
+        """
+        routes = np.unique(np.asarray(routes, dtype=np.int64))
+        nodes, owners = self.incidence.expand_routes(routes)
+
+        coverage = np.bincount(nodes, minlength=self.incidence.node_number)
+        uncovered_nodes = np.flatnonzero(self.required_coverage(coverage) == 0)
+
+        signature_hashes = self.node_offsets.copy()
+        np.add.at(signature_hashes, nodes, self.route_keys[routes[owners]])
+
+        order = np.lexsort((signature_hashes[:, 1], signature_hashes[:, 0]))
+        sorted_hashes = signature_hashes[order]
+        new_group = np.any(sorted_hashes[1:] != sorted_hashes[:-1], axis=1)
+        bounds = np.flatnonzero(np.concatenate(([True], new_group, [True])))
+
+        undistinguished_classes = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end - start > 1:
+                undistinguished_classes.extend(self.split_exactly(np.sort(order[start:end]), routes))
+        return Verification(uncovered_nodes, undistinguished_classes)
+
+    def is_covered(self, solution: dict) -> bool:
+        nodes, _ = self.incidence.expand_routes(np.unique(selected_routes(solution)))
+        return bool(np.all(self.required_coverage(np.bincount(nodes, minlength=self.incidence.node_number)) > 0))
+
+    def required_coverage(self, coverage: np.ndarray) -> np.ndarray:
+        """
+        :param coverage: the number of selected routes crossing each node
+        :return: the coverage, the nodes that need not be covered counting as covered
+        """
+        if self.cover_mask is None:
+            return coverage
+        return np.where(self.cover_mask, coverage, 1)
+
+    def split_exactly(self, nodes: np.ndarray, routes: np.ndarray) -> list[np.ndarray]:
+        """
+        Split a group of nodes having the same hash according to their exact signatures
+        :param nodes: the nodes with the same hash
+        :param routes: the sorted selected routes
+        :return: the groups of at least two nodes having exactly the same signature
+        """
+        classes = {}
+        for node in nodes.tolist():
+            signature = np.intersect1d(self.incidence.get_symptom(node), routes, assume_unique=True)
+            node_class = int(self.node_classes[node]) if self.node_classes is not None else 0
+            classes.setdefault((node_class, signature.tobytes()), []).append(node)
+        return [np.array(group, dtype=np.int64) for group in classes.values() if len(group) > 1]
+
+
+def selected_routes(solution: dict) -> np.ndarray:
+    """
+    :param solution: a solution as a dict {route: value}
+    :return: the indexes of the routes whose value is at least 0.5
+    """
+    return np.fromiter((route for route, value in solution.items() if value >= 0.5), dtype=np.int64)